@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 """Discord Bot メインエントリーポイント"""
 
+import asyncio
 import logging
+import signal
+from typing import Optional
 import discord
 from discord import app_commands
 from discord.ext import commands
 from core.config import get_discord_token, get_notification_role_id
+from core.http import close_sessions
 from core.logger import setup_logger
 from features.wrapped.commands import wrapped_command_handler, wrapped_simple_command_handler
 from features.twitch_notification.tasks import TwitchNotificationTask
@@ -38,11 +42,43 @@ discord_client_logger = logging.getLogger("discord.client")
 discord_client_logger.setLevel(logging.INFO)
 discord_client_logger.addFilter(ReconnectLogFilter())  # 再接続ログをINFOレベルに降格
 
+
+class HomuhomuBot(commands.Bot):
+    """終了時にTwitch通知タスクを止めて配信状態を保存するBot"""
+    
+    _shutdown_task: Optional[asyncio.Task] = None  # SIGTERMで開始した終了処理
+    
+    async def setup_hook(self):
+        # ECS（Fargate）はSIGTERMでタスクを停止するため、受け取ったらBotを閉じて終了処理を行う
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except NotImplementedError:
+            # Windowsのイベントループはシグナルハンドラーに対応していない
+            pass
+    
+    def _on_sigterm(self):
+        """SIGTERMを受け取ったら終了処理を開始（実行中に再度受け取った場合は無視する）"""
+        if self._shutdown_task is not None and not self._shutdown_task.done():
+            logger.info("終了処理中のためSIGTERMを無視します")
+            return
+        logger.info("SIGTERMを受け取りました。Botを終了します")
+        # タスクの参照を保持して、終了処理の途中でガベージコレクションされないようにする
+        self._shutdown_task = asyncio.create_task(self.close())
+    
+    async def close(self):
+        """Botを閉じる前にTwitch通知タスクを停止（保留中の配信状態を保存）"""
+        if twitch_task:
+            twitch_task.stop()
+        await super().close()
+        # 共有のHTTPセッション（osu!・Twitch）を閉じる
+        await close_sessions()
+
+
 # Bot設定
 intents = discord.Intents.none()
 intents.guilds = True  # サーバー情報が必要
 intents.members = True  # ロール管理に必要
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = HomuhomuBot(command_prefix='!', intents=intents)
 
 # Twitch通知タスク
 twitch_task: TwitchNotificationTask = None
@@ -79,18 +115,47 @@ async def on_ready():
         logger.warning("Twitch通知機能は無効化されています")
 
 
-@bot.tree.command(name="wrapped", description="osu! 2025年のプレイ統計を表示します")
-@app_commands.describe(username="osu! ユーザー名")
-async def wrapped_command(interaction: discord.Interaction, username: str):
-    """osu! 2025 Wrappedコマンド"""
-    await wrapped_command_handler(interaction, username)
+# Wrappedコマンドで選択できるゲームモード
+WRAPPED_MODE_CHOICES = [
+    app_commands.Choice(name="osu!", value="osu"),
+    app_commands.Choice(name="osu!taiko", value="taiko"),
+    app_commands.Choice(name="osu!catch", value="fruits"),
+    app_commands.Choice(name="osu!mania", value="mania")
+]
 
 
-@bot.tree.command(name="wrapped_simple", description="Display simplified osu! 2025 statistics")
-@app_commands.describe(username="osu! username")
-async def wrapped_simple_command(interaction: discord.Interaction, username: str):
-    """簡易版osu! 2025 Wrappedコマンド"""
-    await wrapped_simple_command_handler(interaction, username)
+@bot.tree.command(name="wrapped", description="osu! の年間プレイ統計を表示します")
+@app_commands.describe(
+    username="osu! ユーザー名",
+    year="対象年（デフォルト: 今年）",
+    mode="ゲームモード（デフォルト: osu!）"
+)
+@app_commands.choices(mode=WRAPPED_MODE_CHOICES)
+async def wrapped_command(
+    interaction: discord.Interaction,
+    username: str,
+    year: Optional[int] = None,
+    mode: Optional[app_commands.Choice[str]] = None
+):
+    """osu! Wrappedコマンド"""
+    await wrapped_command_handler(interaction, username, year, mode.value if mode else 'osu')
+
+
+@bot.tree.command(name="wrapped_simple", description="Display simplified osu! yearly statistics")
+@app_commands.describe(
+    username="osu! username",
+    year="Target year (default: current year)",
+    mode="Game mode (default: osu!)"
+)
+@app_commands.choices(mode=WRAPPED_MODE_CHOICES)
+async def wrapped_simple_command(
+    interaction: discord.Interaction,
+    username: str,
+    year: Optional[int] = None,
+    mode: Optional[app_commands.Choice[str]] = None
+):
+    """簡易版osu! Wrappedコマンド"""
+    await wrapped_simple_command_handler(interaction, username, year, mode.value if mode else 'osu')
 
 
 @bot.tree.command(name="notification", description="通知のON/OFFを設定します")
@@ -135,10 +200,8 @@ if __name__ == "__main__":
         exit(1)
     
     try:
+        # Ctrl+C・SIGTERMのどちらでも HomuhomuBot.close() で配信状態を保存してから終了する
         bot.run(token)
-    except KeyboardInterrupt:
-        logger.info("Botを停止しています...")
-        if twitch_task:
-            twitch_task.stop()
+        logger.info("Botを停止しました")
     except Exception as e:
         logger.error(f"Bot実行エラー: {e}", exc_info=True)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""複数の呼び出しをまとめて1回のリクエストにするバッチローダーモジュール"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Any
+from core.logger import get_logger
+
+logger = get_logger("batching")
+
+
+class BatchLoader:
+    """短い待ち時間の間に要求されたキーをまとめて読み込むローダー（dataloaderパターン）
+    
+    load() で要求されたキーは window 秒の間キューに溜め、max_batch_size 件ごとに
+    load_batch(キーのリスト) を1回呼び出す。同じキーへの同時要求は1つの結果を共有する。
+    load_batch はキー -> 値 の辞書を返し、含まれないキーの結果は None になる。
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        load_batch: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch_size: int = 50,
+        window: float = 0.01
+    ):
+        self.name = name
+        self.load_batch = load_batch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        
+        self.batches = 0  # load_batch を呼び出した回数
+        self.loaded_keys = 0  # load_batch に渡したキーの合計数
+        self.coalesced = 0  # 読み込み中の同じキーに合流した回数
+        
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    async def load(self, key: Hashable) -> Optional[Any]:
+        """キーの値を読み込む（他の呼び出しと同じバッチにまとめられる）"""
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            # 待っている呼び出し元がキャンセルされても例外を回収する（未回収の警告を出さない）
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._futures[key] = future
+            self._queue.append(key)
+            
+            if len(self._queue) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+        else:
+            self.coalesced += 1
+        
+        # 1つの呼び出し元のキャンセルで共有中の読み込みを止めない
+        return await asyncio.shield(future)
+    
+    async def load_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Optional[Any]]:
+        """複数のキーの値をまとめて読み込む"""
+        unique_keys = list(dict.fromkeys(keys))
+        values = await asyncio.gather(*(self.load(key) for key in unique_keys))
+        return dict(zip(unique_keys, values))
+    
+    def _dispatch(self):
+        """キューに溜まったキーを max_batch_size 件ずつ読み込み開始"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), self.max_batch_size):
+            asyncio.ensure_future(self._run_batch(keys[start:start + self.max_batch_size]))
+    
+    async def _run_batch(self, keys: List[Hashable]):
+        """1バッチ分を読み込み、待っている呼び出し元に結果を返す"""
+        self.batches += 1
+        self.loaded_keys += len(keys)
+        try:
+            results = await self.load_batch(keys)
+        except Exception as e:
+            logger.warning(f"バッチ読み込みエラー: name={self.name}, keys={len(keys)}, error={e}")
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for key in keys:
+            future = self._futures.pop(key)
+            if not future.done():
+                future.set_result(results.get(key))
+    
+    def stats(self) -> Dict:
+        """バッチ処理の統計情報を取得"""
+        return {
+            'batches': self.batches,
+            'loaded_keys': self.loaded_keys,
+            'average_batch_size': self.loaded_keys / self.batches if self.batches else 0.0,
+            'coalesced': self.coalesced,
+            'queued': len(self._queue)
+        }
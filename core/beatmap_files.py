@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""".osu ファイルの解析とコンテンツアドレス型ストアモジュール"""
+
+import asyncio
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from core.cache import TieredCache
+from core.config import get_cache_config
+from core.logger import get_logger
+
+logger = get_logger("beatmap_files")
+
+# ヒットオブジェクトの種類
+KIND_CIRCLE = 0
+KIND_SLIDER = 1
+KIND_SPINNER = 2
+
+# ヒットオブジェクト1件分（スライダーは難易度計算に必要な位置・時間を事前計算して保持）
+HIT_OBJECT_DTYPE = np.dtype([
+    ('x', 'f4'),
+    ('y', 'f4'),
+    ('time', 'f8'),
+    ('kind', 'u1'),
+    ('end_x', 'f4'),         # スライダー終点（テール）の位置
+    ('end_y', 'f4'),
+    ('lazy_end_x', 'f4'),    # 判定が終わる時点でのスライダー上の位置
+    ('lazy_end_y', 'f4'),
+    ('travel_time', 'f4'),   # スライダーを追う必要がある時間（ms）
+    ('repeat_count', 'u2'),
+    ('nested_start', 'u4'),  # nested 配列内の開始位置
+    ('nested_count', 'u2')
+])
+
+# スライダーのティック・リピート・テールの位置（ヘッドは含まない）
+NESTED_DTYPE = np.dtype([
+    ('x', 'f4'),
+    ('y', 'f4'),
+    ('repeat', '?')
+])
+
+LEGACY_LAST_TICK_OFFSET = 36.0  # スライダーの最後の判定を終点より前に置く時間（ms）
+BEZIER_SAMPLES = 50  # ベジェ曲線1区間あたりのサンプル数
+
+
+class ParsedBeatmap:
+    """難易度計算に必要な情報だけを持つ解析済みの譜面"""
+    
+    __slots__ = ('beatmap_id', 'mode', 'circle_size', 'overall_difficulty', 'approach_rate', 'objects', 'nested')
+    
+    def __init__(
+        self,
+        beatmap_id: int,
+        mode: int,
+        circle_size: float,
+        overall_difficulty: float,
+        approach_rate: float,
+        objects: np.ndarray,
+        nested: np.ndarray
+    ):
+        self.beatmap_id = beatmap_id
+        self.mode = mode
+        self.circle_size = circle_size
+        self.overall_difficulty = overall_difficulty
+        self.approach_rate = approach_rate
+        self.objects = objects
+        self.nested = nested
+    
+    def save(self, path: str):
+        """npz形式で保存（一時ファイルに書いてから置き換える）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = np.array([self.beatmap_id, self.mode, self.circle_size, self.overall_difficulty, self.approach_rate], dtype='f8')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=meta, objects=self.objects, nested=self.nested)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "ParsedBeatmap":
+        """npz形式のファイルから読み込み"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = data['meta']
+            return cls(
+                beatmap_id=int(meta[0]),
+                mode=int(meta[1]),
+                circle_size=float(meta[2]),
+                overall_difficulty=float(meta[3]),
+                approach_rate=float(meta[4]),
+                objects=data['objects'],
+                nested=data['nested']
+            )
+
+
+def _bezier(points: np.ndarray) -> np.ndarray:
+    """ベジェ曲線1区間をサンプリング"""
+    n = len(points) - 1
+    if n < 1:
+        return points
+    t = np.linspace(0.0, 1.0, BEZIER_SAMPLES)[:, None]
+    coefficients = np.array([math.comb(n, i) for i in range(n + 1)], dtype='f8')
+    powers = np.arange(n + 1)
+    basis = coefficients * t ** powers * (1 - t) ** (n - powers)
+    return basis @ points
+
+
+def _perfect_circle(points: np.ndarray) -> Optional[np.ndarray]:
+    """3点を通る円弧をサンプリング（一直線上の場合はNone）"""
+    a, b, c = points
+    d = 2 * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if abs(d) < 1e-6:
+        return None
+    
+    a_sq, b_sq, c_sq = a @ a, b @ b, c @ c
+    center = np.array([
+        (a_sq * (b[1] - c[1]) + b_sq * (c[1] - a[1]) + c_sq * (a[1] - b[1])) / d,
+        (a_sq * (c[0] - b[0]) + b_sq * (a[0] - c[0]) + c_sq * (b[0] - a[0])) / d
+    ])
+    radius = float(np.linalg.norm(a - center))
+    start_angle = math.atan2(a[1] - center[1], a[0] - center[0])
+    end_angle = math.atan2(c[1] - center[1], c[0] - center[0])
+    while end_angle < start_angle:
+        end_angle += 2 * math.pi
+    
+    # 中間点を通る向きに回る
+    direction = 1.0
+    theta_range = end_angle - start_angle
+    if (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]) < 0:
+        direction = -1.0
+        theta_range = 2 * math.pi - theta_range
+    
+    samples = max(2, int(math.ceil(theta_range * radius / 4)) + 1)
+    angles = start_angle + direction * np.linspace(0.0, theta_range, samples)
+    return center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def _slider_path(curve_type: str, control_points: np.ndarray) -> np.ndarray:
+    """スライダーの制御点から折れ線の経路を作成"""
+    if len(control_points) < 2:
+        # ヘッドしかない（曲線の制御点がない）スライダー
+        return control_points
+    if curve_type == 'P' and len(control_points) == 3:
+        arc = _perfect_circle(control_points)
+        if arc is not None:
+            return arc
+    
+    if curve_type in ('B', 'P'):
+        # 同じ点が連続する箇所（赤いアンカー）で区間を分ける
+        segments = []
+        start = 0
+        for i in range(1, len(control_points)):
+            if i == len(control_points) - 1 or np.array_equal(control_points[i], control_points[i + 1]):
+                segments.append(_bezier(control_points[start:i + 1]))
+                start = i + 1 if i < len(control_points) - 1 else i
+        return np.vstack(segments)
+    
+    # L（直線）とC（Catmull、折れ線で近似）
+    return control_points
+
+
+class _PathCursor:
+    """経路上の距離から位置を求める"""
+    
+    def __init__(self, path: np.ndarray, expected_length: float):
+        lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        self.path = path
+        self.cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+        self.length = expected_length if expected_length > 0 else float(self.cumulative[-1])
+    
+    def position_at(self, progress: float) -> np.ndarray:
+        """経路の進捗（0〜1）に対応する位置（指定の長さより短い経路は最後の区間を延長）"""
+        distance = min(max(progress, 0.0), 1.0) * self.length
+        if len(self.path) < 2 or self.cumulative[-1] <= 0:
+            return self.path[0]
+        index = int(np.searchsorted(self.cumulative, distance, side='right')) - 1
+        index = min(max(index, 0), len(self.path) - 2)
+        segment_length = self.cumulative[index + 1] - self.cumulative[index]
+        if segment_length <= 0:
+            return self.path[index]
+        ratio = (distance - self.cumulative[index]) / segment_length
+        return self.path[index] + (self.path[index + 1] - self.path[index]) * ratio
+
+
+def _timing_at(timing_points: List[Tuple[float, float, bool]], time: float) -> Tuple[float, float]:
+    """指定時刻の (1拍の長さ, スライダー速度倍率) を取得"""
+    beat_length = next((bl for _, bl, uninherited in timing_points if uninherited), 500.0)
+    velocity = 1.0
+    for point_time, value, uninherited in timing_points:
+        if point_time > time:
+            break
+        if uninherited:
+            beat_length = value
+            velocity = 1.0
+        else:
+            velocity = min(max(-100.0 / value, 0.1), 10.0) if value < 0 else 1.0
+    return beat_length, velocity
+
+
+def parse_osu_file(data: bytes) -> ParsedBeatmap:
+    """.osu ファイルの内容を解析"""
+    section = None
+    values: Dict[str, str] = {}
+    timing_points: List[Tuple[float, float, bool]] = []
+    hit_object_lines: List[str] = []
+    
+    for raw_line in data.decode('utf-8-sig', errors='replace').splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith('//'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            section = line[1:-1]
+            continue
+        
+        if section in ('General', 'Metadata', 'Difficulty'):
+            key, _, value = line.partition(':')
+            values[key.strip()] = value.strip()
+        elif section == 'TimingPoints':
+            parts = line.split(',')
+            if len(parts) < 2:
+                continue
+            beat_length = float(parts[1])
+            uninherited = parts[6] == '1' if len(parts) > 6 else beat_length > 0
+            timing_points.append((float(parts[0]), beat_length, uninherited))
+        elif section == 'HitObjects':
+            hit_object_lines.append(line)
+    
+    timing_points.sort(key=lambda point: (point[0], not point[2]))
+    circle_size = float(values.get('CircleSize', 5))
+    overall_difficulty = float(values.get('OverallDifficulty', 5))
+    approach_rate = float(values.get('ApproachRate', overall_difficulty))
+    slider_multiplier = float(values.get('SliderMultiplier', 1.4))
+    tick_rate = float(values.get('SliderTickRate', 1))
+    
+    objects = np.zeros(len(hit_object_lines), dtype=HIT_OBJECT_DTYPE)
+    nested: List[Tuple[float, float, bool]] = []
+    
+    for i, line in enumerate(hit_object_lines):
+        parts = line.split(',')
+        x, y, time, type_bits = float(parts[0]), float(parts[1]), float(parts[2]), int(parts[3])
+        obj = objects[i]
+        obj['x'], obj['y'], obj['time'] = x, y, time
+        obj['end_x'], obj['end_y'] = x, y
+        obj['lazy_end_x'], obj['lazy_end_y'] = x, y
+        obj['nested_start'] = len(nested)
+        
+        if type_bits & 8:
+            obj['kind'] = KIND_SPINNER
+            continue
+        if not type_bits & 2 or len(parts) < 8:
+            obj['kind'] = KIND_CIRCLE
+            continue
+        
+        obj['kind'] = KIND_SLIDER
+        curve = parts[5].split('|')
+        points = [(x, y)] + [tuple(map(float, p.split(':'))) for p in curve[1:] if ':' in p]
+        control_points = np.array(points, dtype='f8')
+        span_count = max(int(parts[6]), 1)
+        cursor = _PathCursor(_slider_path(curve[0], control_points) - control_points[0], float(parts[7]))
+        
+        beat_length, velocity_multiplier = _timing_at(timing_points, time)
+        scoring_distance = 100.0 * slider_multiplier * velocity_multiplier
+        velocity = scoring_distance / beat_length
+        span_duration = cursor.length / velocity if velocity > 0 else 0.0
+        duration = span_duration * span_count
+        head = np.array([x, y])
+        
+        # ティック・リピート・テールを時間順に並べる
+        tick_distance = min(scoring_distance / tick_rate, cursor.length) if tick_rate > 0 else cursor.length
+        min_distance_from_end = velocity * 10
+        tick_progresses = []
+        distance = tick_distance
+        while tick_distance > 0 and distance <= cursor.length and distance < cursor.length - min_distance_from_end:
+            tick_progresses.append(distance / cursor.length)
+            distance += tick_distance
+        
+        for span in range(span_count):
+            reversed_span = span % 2 == 1
+            for progress in (reversed(tick_progresses) if reversed_span else tick_progresses):
+                px, py = head + cursor.position_at(progress)
+                nested.append((px, py, False))
+            if span < span_count - 1:
+                px, py = head + cursor.position_at(0.0 if reversed_span else 1.0)
+                nested.append((px, py, True))
+        
+        tail = head + cursor.position_at(1.0 if span_count % 2 == 1 else 0.0)
+        nested.append((tail[0], tail[1], False))
+        
+        # 判定が終わる時刻（終点の少し前）のスライダー上の位置
+        tracking_end = max(duration - LEGACY_LAST_TICK_OFFSET, duration / 2)
+        end_progress = tracking_end / span_duration if span_duration > 0 else 0.0
+        end_progress = 1 - end_progress % 1 if end_progress % 2 >= 1 else end_progress % 1
+        lazy_end = head + cursor.position_at(end_progress)
+        
+        obj['end_x'], obj['end_y'] = tail
+        obj['lazy_end_x'], obj['lazy_end_y'] = lazy_end
+        obj['travel_time'] = tracking_end
+        obj['repeat_count'] = span_count - 1
+        obj['nested_count'] = len(nested) - obj['nested_start']
+    
+    return ParsedBeatmap(
+        beatmap_id=int(values.get('BeatmapID', 0) or 0),
+        mode=int(values.get('Mode', 0) or 0),
+        circle_size=circle_size,
+        overall_difficulty=overall_difficulty,
+        approach_rate=approach_rate,
+        objects=objects,
+        nested=np.array(nested, dtype=NESTED_DTYPE)
+    )
+
+
+class OsuFileStore:
+    """解析済みの .osu ファイルを内容のハッシュ値で保存するストア
+    
+    同じ内容のファイルは1回だけ解析・保存し、譜面ID -> ハッシュ値 の対応は
+    インデックス（TieredCache）に保存する。import_dir を指定すると初回参照時に
+    ディレクトリ内の .osu ファイルを取り込む（取り込んだ対応はメモリにも保持し、
+    インデックスの期限切れ・削除後も使う）。download が有効な場合は
+    ストアにない譜面の .osu ファイルをosu!から取得する。
+    """
+    
+    MEMORY_ENTRIES = 64  # メモリに保持する解析済み譜面の数
+    
+    def __init__(self, directory: str, index: TieredCache, import_dir: Optional[str] = None, download: bool = False):
+        self.directory = directory
+        self.index = index
+        self.import_dir = import_dir
+        self.download = download
+        self._memory: "OrderedDict[str, ParsedBeatmap]" = OrderedDict()
+        # 解析・読み込みは asyncio.to_thread の複数のスレッドで並行して行われるため、LRUの更新は排他する
+        self._memory_lock = threading.Lock()
+        self._import_lock = asyncio.Lock()
+        self._imported = import_dir is None
+        self._imported_digests: Dict[int, str] = {}  # import_dir から取り込んだ 譜面ID -> ハッシュ値
+    
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.npz")
+    
+    def add_bytes(self, data: bytes) -> Tuple[int, str]:
+        """.osu ファイルの内容を保存（保存済みなら解析しない）して (譜面ID, ハッシュ値) を返す"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            return self._load_digest(digest).beatmap_id, digest
+        
+        parsed = parse_osu_file(data)
+        parsed.save(path)
+        self._remember(digest, parsed)
+        return parsed.beatmap_id, digest
+    
+    def add_directory(self, path: str) -> Dict[int, str]:
+        """ディレクトリ内の .osu ファイルをすべて保存して {譜面ID: ハッシュ値} を返す"""
+        digests: Dict[int, str] = {}
+        for name in sorted(os.listdir(path)):
+            if not name.endswith('.osu'):
+                continue
+            try:
+                with open(os.path.join(path, name), 'rb') as f:
+                    beatmap_id, digest = self.add_bytes(f.read())
+            except Exception as e:
+                logger.warning(f".osuファイルの取り込みに失敗: file={name}, error={e}")
+                continue
+            if beatmap_id:
+                digests[beatmap_id] = digest
+        return digests
+    
+    def _remember(self, digest: str, parsed: ParsedBeatmap):
+        with self._memory_lock:
+            self._memory[digest] = parsed
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+    
+    def _load_digest(self, digest: str) -> Optional[ParsedBeatmap]:
+        with self._memory_lock:
+            parsed = self._memory.get(digest)
+            if parsed is not None:
+                self._memory.move_to_end(digest)
+                return parsed
+        # ファイルの読み込みはロックの外で行う
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        parsed = ParsedBeatmap.load(path)
+        self._remember(digest, parsed)
+        return parsed
+    
+    async def _ensure_imported(self):
+        """import_dir の .osu ファイルを1回だけ取り込む"""
+        if self._imported:
+            return
+        async with self._import_lock:
+            if self._imported:
+                return
+            try:
+                digests = await asyncio.to_thread(self.add_directory, self.import_dir)
+                self._imported_digests = digests
+                await self.index.set_many({str(beatmap_id): {'digest': digest} for beatmap_id, digest in digests.items()})
+                logger.info(f".osuファイルを取り込みました: dir={self.import_dir}, count={len(digests)}")
+            except Exception as e:
+                logger.warning(f".osuファイルのディレクトリ取り込みに失敗: dir={self.import_dir}, error={e}")
+            self._imported = True
+    
+    async def get(self, beatmap_id: int, client=None) -> Optional[ParsedBeatmap]:
+        """譜面IDから解析済みの譜面を取得（なければNone）"""
+        await self._ensure_imported()
+        
+        entry = await self.index.get(str(beatmap_id))
+        if entry is not None:
+            parsed = await asyncio.to_thread(self._load_digest, entry['digest'])
+            if parsed is not None:
+                return parsed
+        
+        # インデックスの期限切れ・削除で消えた取り込み済みの譜面はインデックスに戻す
+        digest = self._imported_digests.get(beatmap_id)
+        if digest is not None:
+            parsed = await asyncio.to_thread(self._load_digest, digest)
+            if parsed is not None:
+                await self.index.set(str(beatmap_id), {'digest': digest})
+                return parsed
+        
+        if not self.download or client is None:
+            return None
+        
+        data = await client.get_osu_file(beatmap_id)
+        if not data:
+            return None
+        _, digest = await asyncio.to_thread(self.add_bytes, data)
+        await self.index.set(str(beatmap_id), {'digest': digest})
+        return await asyncio.to_thread(self._load_digest, digest)
+
+
+_osu_file_store: Optional[OsuFileStore] = None
+
+
+def get_osu_file_store() -> OsuFileStore:
+    """.osu ファイルストア（{cache_dir}/osu_files）を取得"""
+    global _osu_file_store
+    if _osu_file_store is None:
+        config = get_cache_config()
+        index = TieredCache(
+            'osu_files',
+            os.path.join(config['cache_dir'], 'cache.sqlite3'),
+            ttl=config['attributes_ttl'],
+            max_entries=config['attributes_max_entries'],
+            memory_entries=config['attributes_memory_entries']
+        )
+        _osu_file_store = OsuFileStore(
+            os.path.join(config['cache_dir'], 'osu_files'),
+            index,
+            import_dir=config['osu_files_dir'],
+            download=config['osu_file_download']
+        )
+    return _osu_file_store
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""メモリLRU + SQLiteの2段キャッシュモジュール"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from core.config import get_cache_config
+from core.logger import get_logger
+
+logger = get_logger("cache")
+
+
+class TieredCache:
+    """メモリ上のLRUの後ろにSQLiteを置いた永続キャッシュ
+    
+    値はJSONとして保存する。ディスクアクセスはスレッドで実行し、
+    イベントループをブロックしない。
+    """
+    
+    PRUNE_INTERVAL = 100  # 何件書き込むごとに件数上限を適用するか
+    
+    def __init__(self, name: str, db_path: str, ttl: float, max_entries: int, memory_entries: int):
+        self.name = name
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """SQLite接続を取得（初回はテーブルを作成）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.name} '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {self.name}_updated_at ON {self.name} (updated_at)')
+            self._conn.commit()
+        return self._conn
+    
+    def _remember(self, key: str, value: Any, updated_at: float):
+        """メモリLRUに格納（上限を超えたら古いものから捨てる）"""
+        self._memory[key] = (value, updated_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _read_disk(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._db_lock:
+            row = self._get_connection().execute(
+                f'SELECT value, updated_at FROM {self.name} WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+    
+    def _read_disk_many(self, keys: List[str]) -> Dict[str, Tuple[Any, float]]:
+        with self._db_lock:
+            conn = self._get_connection()
+            rows = []
+            # SQLiteのパラメータ数上限を超えないように分割して取得
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(conn.execute(
+                    f'SELECT key, value, updated_at FROM {self.name} WHERE key IN ({placeholders})', chunk
+                ).fetchall())
+        return {key: (json.loads(value), updated_at) for key, value, updated_at in rows}
+    
+    def read_all(self) -> List[Tuple[str, Any]]:
+        """ディスク上の期限内の全エントリを取得（集計用、同期処理）"""
+        with self._db_lock:
+            rows = self._get_connection().execute(
+                f'SELECT key, value FROM {self.name} WHERE updated_at >= ?', (time.time() - self.ttl,)
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+    
+    def _write_disk(self, key: str, value: Any, updated_at: float):
+        self._write_disk_many({key: value}, updated_at)
+    
+    def _write_disk_many(self, items: Dict[str, Any], updated_at: float):
+        with self._db_lock:
+            conn = self._get_connection()
+            conn.executemany(
+                f'INSERT OR REPLACE INTO {self.name} (key, value, updated_at) VALUES (?, ?, ?)',
+                [(key, json.dumps(value, separators=(',', ':')), updated_at) for key, value in items.items()]
+            )
+            self._writes_since_prune += len(items)
+            if self._writes_since_prune >= self.PRUNE_INTERVAL:
+                self._writes_since_prune = 0
+                self._prune(conn)
+            conn.commit()
+    
+    def _prune(self, conn: sqlite3.Connection):
+        """期限切れと件数上限を超えた古いエントリを削除"""
+        conn.execute(f'DELETE FROM {self.name} WHERE updated_at < ?', (time.time() - self.ttl,))
+        conn.execute(
+            f'DELETE FROM {self.name} WHERE key IN ('
+            f'SELECT key FROM {self.name} ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+    
+    def _is_fresh(self, updated_at: float) -> bool:
+        return time.time() - updated_at < self.ttl
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """キャッシュから値を取得（なければNone）"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._is_fresh(entry[1]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            del self._memory[key]
+        
+        try:
+            entry = await asyncio.to_thread(self._read_disk, key)
+        except Exception as e:
+            logger.warning(f"キャッシュ読み込みエラー: name={self.name}, key={key}, error={e}")
+            entry = None
+        
+        if entry is not None and self._is_fresh(entry[1]):
+            self._remember(key, entry[0], entry[1])
+            self.disk_hits += 1
+            return entry[0]
+        
+        self.misses += 1
+        return None
+    
+    async def set(self, key: str, value: Any):
+        """キャッシュに値を保存"""
+        updated_at = time.time()
+        self._remember(key, value, updated_at)
+        try:
+            await asyncio.to_thread(self._write_disk, key, value, updated_at)
+        except Exception as e:
+            logger.warning(f"キャッシュ書き込みエラー: name={self.name}, key={key}, error={e}")
+    
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """複数のキーをまとめて取得（見つかったキーだけを含む辞書を返す）"""
+        results: Dict[str, Any] = {}
+        disk_keys: List[str] = []
+        for key in dict.fromkeys(keys):
+            entry = self._memory.get(key)
+            if entry is not None and self._is_fresh(entry[1]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                results[key] = entry[0]
+            else:
+                self._memory.pop(key, None)
+                disk_keys.append(key)
+        
+        if not disk_keys:
+            return results
+        
+        try:
+            entries = await asyncio.to_thread(self._read_disk_many, disk_keys)
+        except Exception as e:
+            logger.warning(f"キャッシュ読み込みエラー: name={self.name}, keys={len(disk_keys)}, error={e}")
+            entries = {}
+        
+        for key in disk_keys:
+            entry = entries.get(key)
+            if entry is not None and self._is_fresh(entry[1]):
+                self._remember(key, entry[0], entry[1])
+                self.disk_hits += 1
+                results[key] = entry[0]
+            else:
+                self.misses += 1
+        return results
+    
+    async def set_many(self, items: Dict[str, Any]):
+        """複数の値を1回の書き込みでキャッシュに保存"""
+        if not items:
+            return
+        updated_at = time.time()
+        for key, value in items.items():
+            self._remember(key, value, updated_at)
+        try:
+            await asyncio.to_thread(self._write_disk_many, items, updated_at)
+        except Exception as e:
+            logger.warning(f"キャッシュ書き込みエラー: name={self.name}, keys={len(items)}, error={e}")
+    
+    def stats(self) -> Dict:
+        """ヒット/ミスの統計情報を取得"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory)
+        }
+
+
+_beatmap_attributes_cache: Optional[TieredCache] = None
+
+
+def get_beatmap_attributes_cache() -> TieredCache:
+    """譜面属性キャッシュ（キー: 譜面ID + 難易度に影響するMODのビットマスク）を取得"""
+    global _beatmap_attributes_cache
+    if _beatmap_attributes_cache is None:
+        config = get_cache_config()
+        _beatmap_attributes_cache = TieredCache(
+            'beatmap_attributes',
+            os.path.join(config['cache_dir'], 'cache.sqlite3'),
+            ttl=config['attributes_ttl'],
+            max_entries=config['attributes_max_entries'],
+            memory_entries=config['attributes_memory_entries']
+        )
+    return _beatmap_attributes_cache
+
+
+_beatmap_cache: Optional[TieredCache] = None
+
+
+def get_beatmap_cache() -> TieredCache:
+    """譜面情報キャッシュ（キー: 譜面ID）を取得"""
+    global _beatmap_cache
+    if _beatmap_cache is None:
+        config = get_cache_config()
+        _beatmap_cache = TieredCache(
+            'beatmaps',
+            os.path.join(config['cache_dir'], 'cache.sqlite3'),
+            ttl=config['beatmaps_ttl'],
+            max_entries=config['beatmaps_max_entries'],
+            memory_entries=config['beatmaps_memory_entries']
+        )
+    return _beatmap_cache
@@ -45,7 +45,21 @@ def get_twitch_config() -> Dict:
     return {
         'channel_id': channel_id,
         'usernames': usernames,
-        'check_interval': check_interval
+        'check_interval': check_interval,
+        # EventSub（WebSocket）で配信開始を受け取る場合の設定（WebSocketの購読にはユーザーアクセストークンが必要）
+        'eventsub_enabled': os.getenv('TWITCH_EVENTSUB_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        'eventsub_user_token': os.getenv('TWITCH_USER_ACCESS_TOKEN') or None,
+        'eventsub_ws_url': os.getenv('TWITCH_EVENTSUB_WS_URL') or None,
+        'eventsub_subscriptions_url': os.getenv('TWITCH_EVENTSUB_SUBSCRIPTIONS_URL') or None,
+        # EventSub接続中に取りこぼしを確認するためのポーリング間隔（秒）
+        'reconcile_interval': _get_int_env('TWITCH_RECONCILE_INTERVAL', 600),
+        # 通知済みの配信状態を保存するファイル（未指定時は {CACHE_DIR}/twitch_live_state.json）と書き込み間隔（秒）
+        'state_path': os.getenv('TWITCH_STATE_PATH') or None,
+        'state_flush_interval': _get_float_env('TWITCH_STATE_FLUSH_INTERVAL', 30.0),
+        # 配信者ごとに配信開始の時間帯を学習してポーリング間隔を変える（max_poll_interval が通知遅延の上限）
+        'adaptive_polling': os.getenv('TWITCH_ADAPTIVE_POLLING', 'true').lower() in ('1', 'true', 'yes'),
+        'min_poll_interval': _get_int_env('TWITCH_MIN_POLL_INTERVAL', 60),
+        'max_poll_interval': _get_int_env('TWITCH_MAX_POLL_INTERVAL', 300)
     }
 
 
@@ -85,4 +99,81 @@ def get_broadcast_allowed_users() -> Optional[List[int]]:
         if uid_str and uid_str.isdigit():
             user_ids.append(int(uid_str))
     
-    return user_ids if user_ids else []
\ No newline at end of file
+    return user_ids if user_ids else []
+
+
+def _get_float_env(name: str, default: float) -> float:
+    """数値の環境変数を取得（不正な値の場合はデフォルト値）"""
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+def _get_int_env(name: str, default: int) -> int:
+    """整数の環境変数を取得（不正な値の場合はデフォルト値）"""
+    value = os.getenv(name, '')
+    return int(value) if value.isdigit() else default
+
+
+def get_http_config() -> Dict:
+    """外部API用HTTPコネクションプール設定を取得"""
+    return {
+        'pool_size': _get_int_env('HTTP_POOL_SIZE', 20),
+        'pool_per_host': _get_int_env('HTTP_POOL_PER_HOST', 10),
+        'keepalive_timeout': _get_float_env('HTTP_KEEPALIVE_TIMEOUT', 30.0),
+        'connect_timeout': _get_float_env('HTTP_CONNECT_TIMEOUT', 5.0),
+        'read_timeout': _get_float_env('HTTP_READ_TIMEOUT', 10.0),
+        'total_timeout': _get_float_env('HTTP_TOTAL_TIMEOUT', 20.0),
+        # 5xx・429・タイムアウト時のリトライ（試行回数 / バックオフの最小・最大秒数）
+        'retry_attempts': _get_int_env('HTTP_RETRY_ATTEMPTS', 3),
+        'retry_base_delay': _get_float_env('HTTP_RETRY_BASE_DELAY', 0.5),
+        'retry_max_delay': _get_float_env('HTTP_RETRY_MAX_DELAY', 10.0),
+        # ホストごとのサーキットブレーカー（連続失敗回数 / リクエストを止める秒数）
+        'circuit_failure_threshold': _get_int_env('HTTP_CIRCUIT_FAILURE_THRESHOLD', 5),
+        'circuit_reset_timeout': _get_float_env('HTTP_CIRCUIT_RESET_TIMEOUT', 30.0)
+    }
+
+
+def get_wrapped_config() -> Dict:
+    """Wrapped機能の設定を取得"""
+    return {
+        'sr_concurrency': max(_get_int_env('WRAPPED_SR_CONCURRENCY', 5), 1),
+        'sr_timeout': _get_float_env('WRAPPED_SR_TIMEOUT', 3.0),
+        # 1回の /wrapped で待つ最大秒数（過ぎたらStar Ratingの取得を打ち切り、計算値のまま表示する）
+        'response_budget': _get_float_env('WRAPPED_RESPONSE_BUDGET', 10.0),
+        'cache_ttl': _get_float_env('WRAPPED_CACHE_TTL', 300.0),
+        'cache_stale_ttl': _get_float_env('WRAPPED_CACHE_STALE_TTL', 3600.0),
+        'negative_cache_ttl': _get_float_env('WRAPPED_NEGATIVE_CACHE_TTL', 60.0),
+        # Star Ratingの取得がタイムアウト・打ち切りで一部計算値になった結果の鮮度（過ぎたら裏で取り直す）
+        'incomplete_cache_ttl': _get_float_env('WRAPPED_INCOMPLETE_CACHE_TTL', 30.0),
+        'cache_max_entries': _get_int_env('WRAPPED_CACHE_MAX_ENTRIES', 500),
+        'default_year': _get_int_env('WRAPPED_DEFAULT_YEAR', 0) or None
+    }
+
+
+def get_cache_config() -> Dict:
+    """キャッシュ設定を取得"""
+    return {
+        'cache_dir': os.getenv('CACHE_DIR', 'data'),
+        'attributes_ttl': _get_float_env('BEATMAP_ATTRIBUTES_TTL', 30 * 24 * 3600.0),
+        'attributes_max_entries': _get_int_env('BEATMAP_ATTRIBUTES_MAX_ENTRIES', 50000),
+        'attributes_memory_entries': _get_int_env('BEATMAP_ATTRIBUTES_MEMORY_ENTRIES', 2000),
+        'beatmaps_ttl': _get_float_env('BEATMAP_CACHE_TTL', 7 * 24 * 3600.0),
+        'beatmaps_max_entries': _get_int_env('BEATMAP_CACHE_MAX_ENTRIES', 50000),
+        'beatmaps_memory_entries': _get_int_env('BEATMAP_CACHE_MEMORY_ENTRIES', 2000),
+        # ETag / Last-Modified による条件付きリクエスト用に保持するレスポンス数（クライアントごと）
+        'response_cache_entries': _get_int_env('HTTP_RESPONSE_CACHE_ENTRIES', 1000),
+        # ローカルStar Rating計算用の .osu ファイル（取り込むディレクトリ / osu!からの取得を許可するか）
+        'osu_files_dir': os.getenv('OSU_FILES_DIR') or None,
+        'osu_file_download': os.getenv('OSU_FILE_DOWNLOAD', '').lower() in ('1', 'true', 'yes')
+    }
+
+
+def get_osu_rate_limit_config() -> Dict:
+    """osu! APIのクライアント側レート制限設定を取得"""
+    return {
+        'requests_per_minute': max(_get_float_env('OSU_RATE_LIMIT_PER_MINUTE', 60.0), 1.0),
+        'burst': max(_get_int_env('OSU_RATE_LIMIT_BURST', 10), 1)
+    }
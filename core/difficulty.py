@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu!standard のローカル難易度（Star Rating）計算モジュール"""
+
+import asyncio
+import math
+from typing import List, Optional
+import numpy as np
+from core.beatmap_files import ParsedBeatmap, KIND_SLIDER, KIND_SPINNER, get_osu_file_store
+from core.logger import get_logger
+from core.mods import MOD_BITS, difficulty_bitmask
+
+logger = get_logger("difficulty")
+
+# osu!（lazer）の osu!standard 難易度計算に合わせた定数
+NORMALISED_RADIUS = 50.0
+MIN_DELTA_TIME = 25.0
+MAXIMUM_SLIDER_RADIUS = NORMALISED_RADIUS * 2.4
+ASSUMED_SLIDER_RADIUS = NORMALISED_RADIUS * 1.8
+SECTION_LENGTH = 400.0
+DECAY_WEIGHT = 0.9
+DIFFICULTY_MULTIPLIER = 0.0675
+PERFORMANCE_BASE_MULTIPLIER = 1.14
+
+AIM_SKILL_MULTIPLIER = 23.55
+AIM_STRAIN_DECAY_BASE = 0.15
+AIM_REDUCED_SECTION_COUNT = 10
+SPEED_SKILL_MULTIPLIER = 1375.0
+SPEED_STRAIN_DECAY_BASE = 0.3
+SPEED_REDUCED_SECTION_COUNT = 5
+
+UNSUPPORTED_MODS = MOD_BITS['FL']  # Flashlightの難易度は計算しない（APIで取得する）
+
+
+def _wide_angle_bonus(angle: np.ndarray) -> np.ndarray:
+    return np.sin(0.75 * (np.clip(angle, math.pi / 6, 5 * math.pi / 6) - math.pi / 6)) ** 2
+
+
+def _acute_angle_bonus(angle: np.ndarray) -> np.ndarray:
+    return 1 - _wide_angle_bonus(angle)
+
+
+def _lazy_slider_movement(beatmap: ParsedBeatmap, scaling_factor: float):
+    """スライダーごとの (カーソルが追う終点の位置, 移動距離) を計算（CSによって変わる）"""
+    objects = beatmap.objects
+    lazy_end = np.column_stack((objects['lazy_end_x'], objects['lazy_end_y'])).astype('f8')
+    travel_distance = np.zeros(len(objects))
+    
+    for i in np.flatnonzero(objects['kind'] == KIND_SLIDER):
+        obj = objects[i]
+        nested = beatmap.nested[obj['nested_start']:obj['nested_start'] + obj['nested_count']]
+        cursor = np.array([obj['x'], obj['y']], dtype='f8')
+        target_end = lazy_end[i].copy()
+        distance = 0.0
+        
+        for j, nested_obj in enumerate(nested):
+            movement = np.array([nested_obj['x'], nested_obj['y']], dtype='f8') - cursor
+            required_movement = ASSUMED_SLIDER_RADIUS
+            if j == len(nested) - 1:
+                # 最後は判定が終わる時点の位置までしか追わない
+                lazy_movement = target_end - cursor
+                if np.hypot(*lazy_movement) < np.hypot(*movement):
+                    movement = lazy_movement
+            elif nested_obj['repeat']:
+                required_movement = NORMALISED_RADIUS
+            
+            movement_length = scaling_factor * float(np.hypot(*movement))
+            if movement_length > required_movement:
+                ratio = (movement_length - required_movement) / movement_length
+                cursor = cursor + movement * ratio
+                distance += movement_length * ratio
+        
+        lazy_end[i] = cursor
+        travel_distance[i] = distance * (1 + obj['repeat_count'] / 2.5) ** (1 / 2.5)
+    
+    return lazy_end, travel_distance
+
+
+def _rhythm_complexity(
+    index: int,
+    start_time: List[float],
+    strain_time: List[float],
+    is_slider: List[bool],
+    is_spinner: List[bool],
+    hit_window: float
+) -> float:
+    """リズムの複雑さによるスピード難易度の倍率"""
+    history_time_max = 5000.0
+    if is_spinner[index]:
+        return 0.0
+    
+    previous_island_size = 0
+    complexity_sum = 0.0
+    island_size = 1
+    start_ratio = 0.0
+    first_delta_switch = False
+    
+    historical_note_count = min(index, 32)
+    rhythm_start = 0
+    while rhythm_start < historical_note_count - 2 and start_time[index] - start_time[index - 1 - rhythm_start] < history_time_max:
+        rhythm_start += 1
+    
+    for i in range(rhythm_start, 0, -1):
+        curr, prev, last = index - i, index - i - 1, index - i - 2
+        decay = (history_time_max - (start_time[index] - start_time[curr])) / history_time_max
+        decay = min((historical_note_count - i) / historical_note_count, decay)
+        
+        curr_delta, prev_delta, last_delta = strain_time[curr], strain_time[prev], strain_time[last]
+        ratio = 1.0 + 6.0 * min(0.5, math.sin(math.pi / (min(prev_delta, curr_delta) / max(prev_delta, curr_delta))) ** 2)
+        window_penalty = min(1.0, max(0.0, abs(prev_delta - curr_delta) - hit_window * 0.3) / (hit_window * 0.3))
+        effective_ratio = window_penalty * ratio
+        
+        if first_delta_switch:
+            if not (prev_delta > 1.25 * curr_delta or prev_delta * 1.25 < curr_delta):
+                if island_size < 7:
+                    island_size += 1
+            else:
+                if is_slider[curr]:
+                    effective_ratio *= 0.125
+                if is_slider[prev]:
+                    effective_ratio *= 0.25
+                if previous_island_size == island_size:
+                    effective_ratio *= 0.25
+                if previous_island_size % 2 == island_size % 2:
+                    effective_ratio *= 0.5
+                if last_delta > prev_delta + 10 and prev_delta > curr_delta + 10:
+                    effective_ratio *= 0.125
+                
+                complexity_sum += (math.sqrt(effective_ratio * start_ratio) * decay
+                                   * math.sqrt(4 + island_size) / 2 * math.sqrt(4 + previous_island_size) / 2)
+                start_ratio = effective_ratio
+                previous_island_size = island_size
+                if prev_delta * 1.25 < curr_delta:
+                    first_delta_switch = False
+                island_size = 1
+        elif prev_delta > 1.25 * curr_delta:
+            first_delta_switch = True
+            start_ratio = effective_ratio
+            island_size = 1
+    
+    return math.sqrt(4 + complexity_sum * 0.75) / 2
+
+
+def _strain_peaks(start_time: np.ndarray, values: np.ndarray, decay_base: float,
+                  multiplier: float, decay_time: np.ndarray, rhythm: Optional[np.ndarray] = None) -> np.ndarray:
+    """オブジェクトごとのストレインを積み上げ、400ms区間ごとのピークを取得"""
+    peaks = []
+    strain = 0.0
+    section_peak = 0.0
+    section_end = math.ceil(start_time[0] / SECTION_LENGTH) * SECTION_LENGTH if len(start_time) else 0.0
+    previous_time = 0.0
+    
+    for i in range(len(start_time)):
+        factor = rhythm[i - 1] if rhythm is not None and i > 0 else 1.0
+        while start_time[i] > section_end:
+            peaks.append(section_peak)
+            # 新しい区間は直前のストレインを減衰させた値から始める
+            section_peak = strain * factor * decay_base ** ((section_end - previous_time) / 1000)
+            section_end += SECTION_LENGTH
+        
+        strain = strain * decay_base ** (decay_time[i] / 1000) + values[i] * multiplier
+        factor = rhythm[i] if rhythm is not None else 1.0
+        section_peak = max(strain * factor, section_peak)
+        previous_time = start_time[i]
+    
+    peaks.append(section_peak)
+    return np.array(peaks)
+
+
+def _difficulty_value(peaks: np.ndarray, reduced_section_count: int, difficulty_multiplier: float) -> float:
+    """区間ピークの重み付き合計（上位のピークは外れ値として少し下げる）"""
+    strains = np.sort(peaks[peaks > 0])[::-1].copy()
+    count = min(len(strains), reduced_section_count)
+    if count:
+        scale = np.log10(1 + 9 * np.clip(np.arange(count) / reduced_section_count, 0, 1))
+        strains[:count] *= 0.75 + 0.25 * scale
+        strains = np.sort(strains)[::-1]
+    return float(np.sum(strains * DECAY_WEIGHT ** np.arange(len(strains)))) * difficulty_multiplier
+
+
+def calculate_star_rating(beatmap: ParsedBeatmap, mods: int = 0) -> Optional[float]:
+    """MODを適用したStar Ratingを計算（osu!standard以外・非対応MODの場合はNone）
+    
+    osu!のAim/Speedスキルを移植した計算で、スタック（重なったノーツのずらし）と
+    Flashlightは扱わない。
+    """
+    if beatmap.mode != 0 or mods & UNSUPPORTED_MODS:
+        return None
+    
+    mods = difficulty_bitmask(mods)
+    objects = beatmap.objects
+    if len(objects) < 2:
+        return 0.0
+    
+    clock_rate = 1.5 if mods & MOD_BITS['DT'] else 0.75 if mods & MOD_BITS['HT'] else 1.0
+    circle_size = beatmap.circle_size
+    overall_difficulty = beatmap.overall_difficulty
+    if mods & MOD_BITS['HR']:
+        circle_size = min(circle_size * 1.3, 10.0)
+        overall_difficulty = min(overall_difficulty * 1.4, 10.0)
+    elif mods & MOD_BITS['EZ']:
+        circle_size *= 0.5
+        overall_difficulty *= 0.5
+    
+    radius = 54.4 - 4.48 * circle_size
+    scaling_factor = NORMALISED_RADIUS / radius
+    if radius < 30:
+        scaling_factor *= 1 + min(30 - radius, 5) / 50
+    hit_window = 2 * (80 - 6 * overall_difficulty) / clock_rate
+    
+    lazy_end, travel_distance = _lazy_slider_movement(beatmap, scaling_factor)
+    
+    # 以降の配列は2番目以降のオブジェクト（難易度計算の対象）ごとの値
+    position = np.column_stack((objects['x'], objects['y'])).astype('f8')
+    tail = np.column_stack((objects['end_x'], objects['end_y'])).astype('f8')
+    times = objects['time'] / clock_rate
+    is_slider = objects['kind'] == KIND_SLIDER
+    is_spinner = objects['kind'] == KIND_SPINNER
+    travel_time = np.maximum(objects['travel_time'] / clock_rate, MIN_DELTA_TIME)
+    
+    current = np.arange(1, len(objects))
+    last = current - 1
+    start_time = times[current]
+    delta_time = times[current] - times[last]
+    strain_time = np.maximum(delta_time, MIN_DELTA_TIME)
+    
+    movable = ~is_spinner[current] & ~is_spinner[last]
+    jump = np.where(movable, np.linalg.norm(position[current] * scaling_factor - lazy_end[last] * scaling_factor, axis=1), 0.0)
+    min_jump_time = np.where(is_slider[last], np.maximum(strain_time - travel_time[last], MIN_DELTA_TIME), strain_time)
+    tail_jump = np.linalg.norm(tail[last] - position[current], axis=1) * scaling_factor
+    min_jump = np.where(
+        is_slider[last] & movable,
+        np.maximum(0.0, np.minimum(jump - (MAXIMUM_SLIDER_RADIUS - ASSUMED_SLIDER_RADIUS), tail_jump - MAXIMUM_SLIDER_RADIUS)),
+        jump
+    )
+    travel = np.where(is_slider[current], travel_distance[current], 0.0)
+    slider_travel_time = np.where(is_slider[current], travel_time[current], MIN_DELTA_TIME)
+    
+    # 角度（直前のオブジェクトへの移動と現在のオブジェクトへの移動のなす角）
+    angle = np.full(len(current), np.nan)
+    if len(objects) > 2:
+        c = current[1:]
+        v1 = lazy_end[c - 2] - position[c - 1]
+        v2 = position[c] - lazy_end[c - 1]
+        cross = v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0]
+        dot = np.einsum('ij,ij->i', v1, v2)
+        angle[1:] = np.where(is_spinner[c - 2] | ~movable[1:], np.nan, np.abs(np.arctan2(cross, dot)))
+    
+    aim = _aim_values(jump, min_jump, min_jump_time, strain_time, travel, slider_travel_time, angle, is_slider[current], is_spinner[current])
+    speed = _speed_values(delta_time, strain_time, min_jump, travel, hit_window, is_spinner[current])
+    # リズムの計算は要素ごとの逐次処理になるため、Pythonのリストで行う
+    rhythm_args = (start_time.tolist(), strain_time.tolist(), is_slider[current].tolist(), is_spinner[current].tolist(), hit_window)
+    rhythm = np.array([_rhythm_complexity(i, *rhythm_args) for i in range(len(current))])
+    
+    aim_peaks = _strain_peaks(start_time, aim, AIM_STRAIN_DECAY_BASE, AIM_SKILL_MULTIPLIER, delta_time)
+    speed_peaks = _strain_peaks(start_time, speed, SPEED_STRAIN_DECAY_BASE, SPEED_SKILL_MULTIPLIER, strain_time, rhythm)
+    
+    aim_rating = math.sqrt(_difficulty_value(aim_peaks, AIM_REDUCED_SECTION_COUNT, 1.06)) * DIFFICULTY_MULTIPLIER
+    speed_rating = math.sqrt(_difficulty_value(speed_peaks, SPEED_REDUCED_SECTION_COUNT, 1.04)) * DIFFICULTY_MULTIPLIER
+    
+    base_aim = (5 * max(1.0, aim_rating / DIFFICULTY_MULTIPLIER) - 4) ** 3 / 100000
+    base_speed = (5 * max(1.0, speed_rating / DIFFICULTY_MULTIPLIER) - 4) ** 3 / 100000
+    base_performance = (base_aim ** 1.1 + base_speed ** 1.1) ** (1 / 1.1)
+    if base_performance <= 0.00001:
+        return 0.0
+    return (PERFORMANCE_BASE_MULTIPLIER ** (1 / 3) * 0.027
+            * ((100000 / 2 ** (1 / 1.1) * base_performance) ** (1 / 3) + 4))
+
+
+def _aim_values(jump, min_jump, min_jump_time, strain_time, travel, travel_time, angle, is_slider, is_spinner) -> np.ndarray:
+    """オブジェクトごとのAim難易度（スライダーの移動を含む）"""
+    n = len(jump)
+    values = np.zeros(n)
+    if n < 3:
+        return values
+    
+    velocity = jump / strain_time
+    slider_velocity = travel / travel_time
+    # 直前がスライダーの場合はスライダーの移動と次のオブジェクトへの移動の合計速度も考慮
+    movement_velocity = np.concatenate(([velocity[0]], np.maximum(
+        velocity[1:], np.where(is_slider[:-1], min_jump[1:] / min_jump_time[1:] + slider_velocity[:-1], velocity[1:])
+    )))
+    
+    i = np.arange(2, n)
+    curr_velocity = movement_velocity[i]
+    prev_velocity = movement_velocity[i - 1]
+    aim = curr_velocity.copy()
+    
+    # 一定リズムの場合のみ角度ボーナスを付ける
+    same_rhythm = np.maximum(strain_time[i], strain_time[i - 1]) < 1.25 * np.minimum(strain_time[i], strain_time[i - 1])
+    has_angles = same_rhythm & ~np.isnan(angle[i]) & ~np.isnan(angle[i - 1]) & ~np.isnan(angle[i - 2])
+    curr_angle = np.nan_to_num(angle[i])
+    last_angle = np.nan_to_num(angle[i - 1])
+    last_last_angle = np.nan_to_num(angle[i - 2])
+    
+    angle_bonus = np.minimum(curr_velocity, prev_velocity)
+    wide = _wide_angle_bonus(curr_angle)
+    acute = _acute_angle_bonus(curr_angle)
+    acute = np.where(
+        strain_time[i] > 100,
+        0.0,
+        acute * _acute_angle_bonus(last_angle) * np.minimum(angle_bonus, 125 / strain_time[i])
+        * np.sin(math.pi / 2 * np.minimum(1, (100 - strain_time[i]) / 25)) ** 2
+        * np.sin(math.pi / 2 * (np.clip(jump[i], 50, 100) - 50) / 50) ** 2
+    )
+    wide = wide * angle_bonus * (1 - np.minimum(wide, _wide_angle_bonus(last_angle) ** 3))
+    acute = acute * (0.5 + 0.5 * (1 - np.minimum(acute, _acute_angle_bonus(last_last_angle) ** 3)))
+    wide = np.where(has_angles, wide, 0.0)
+    acute = np.where(has_angles, acute, 0.0)
+    
+    # 速度変化のボーナス
+    prev_distance_velocity = (jump[i - 1] + travel[i - 2]) / strain_time[i - 1]
+    curr_distance_velocity = (jump[i] + travel[i - 1]) / strain_time[i]
+    max_velocity = np.maximum(prev_distance_velocity, curr_distance_velocity)
+    difference = np.abs(prev_distance_velocity - curr_distance_velocity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance_ratio = np.where(max_velocity > 0, np.sin(math.pi / 2 * difference / max_velocity) ** 2, 0.0)
+    min_time = np.minimum(strain_time[i], strain_time[i - 1])
+    max_time = np.maximum(strain_time[i], strain_time[i - 1])
+    velocity_change = np.minimum(125 / min_time, difference) * distance_ratio * (min_time / max_time) ** 2
+    velocity_change = np.where(np.maximum(curr_velocity, prev_velocity) > 0, velocity_change, 0.0)
+    
+    slider_bonus = np.where(is_slider[i - 1], travel[i - 1] / travel_time[i - 1], 0.0)
+    
+    aim += np.maximum(acute * 1.95, wide * 1.5 + velocity_change * 0.75)
+    aim += slider_bonus * 1.35
+    values[2:] = np.where(is_spinner[i] | is_spinner[i - 1], 0.0, aim)
+    return values
+
+
+def _speed_values(delta_time, strain_time, min_jump, travel, hit_window, is_spinner) -> np.ndarray:
+    """オブジェクトごとのSpeed難易度（連打の間隔とダブルタップしやすさを考慮）"""
+    single_spacing_threshold = 125.0
+    min_speed_bonus = 75.0
+    
+    current_delta = np.maximum(1.0, delta_time)
+    next_delta = np.concatenate((current_delta[1:], [np.nan]))
+    speed_ratio = current_delta / np.maximum(current_delta, np.abs(next_delta - current_delta))
+    window_ratio = np.minimum(1.0, current_delta / hit_window) ** 2
+    doubletapness = np.where(np.isnan(next_delta), 1.0, speed_ratio ** (1 - window_ratio))
+    
+    adjusted_strain_time = strain_time / np.clip((strain_time / hit_window) / 0.93, 0.92, 1.0)
+    speed_bonus = np.where(
+        adjusted_strain_time < min_speed_bonus,
+        1 + 0.75 * ((min_speed_bonus - adjusted_strain_time) / 40) ** 2,
+        1.0
+    )
+    previous_travel = np.concatenate(([0.0], travel[:-1]))
+    distance = np.minimum(single_spacing_threshold, previous_travel + min_jump)
+    values = (speed_bonus + speed_bonus * (distance / single_spacing_threshold) ** 3.5) * doubletapness / adjusted_strain_time
+    return np.where(is_spinner, 0.0, values)
+
+
+async def get_local_star_rating(beatmap_id: int, mods: int, client=None) -> Optional[float]:
+    """ローカルの .osu ファイルからMOD適用後のStar Ratingを計算（計算できない場合はNone）"""
+    if not beatmap_id or mods & UNSUPPORTED_MODS:
+        return None
+    try:
+        beatmap = await get_osu_file_store().get(beatmap_id, client)
+        if beatmap is None:
+            return None
+        return await asyncio.to_thread(calculate_star_rating, beatmap, mods)
+    except Exception as e:
+        logger.warning(f"ローカルStar Rating計算エラー: beatmap_id={beatmap_id}, mods={mods}, error={e}")
+        return None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""外部API用の共有HTTPコネクションプールモジュール"""
+
+import asyncio
+import aiohttp
+from typing import Dict, Tuple
+from core.config import get_http_config
+from core.logger import get_logger
+
+logger = get_logger("http")
+
+
+class PoolStats:
+    """コネクションプールの統計情報"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0   # 送信したリクエスト数
+        self.opened = 0     # 新規に張ったコネクション数
+        self.reused = 0     # keep-aliveで再利用したコネクション数
+        self.waiting = 0    # 空きコネクション待ちのリクエスト数（現在値）
+        self.max_waiting = 0
+    
+    def to_dict(self) -> Dict:
+        """辞書形式に変換"""
+        return {
+            'requests': self.requests,
+            'opened': self.opened,
+            'reused': self.reused,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting
+        }
+
+
+_sessions: Dict[str, Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = {}
+_stats: Dict[str, PoolStats] = {}
+
+
+def _get_stats(name: str) -> PoolStats:
+    """プール名に対応する統計オブジェクトを取得"""
+    stats = _stats.get(name)
+    if stats is None:
+        stats = PoolStats(name)
+        _stats[name] = stats
+    return stats
+
+
+def _create_trace_config(stats: PoolStats) -> aiohttp.TraceConfig:
+    """コネクションの生成・再利用・待機を数えるTraceConfigを作成"""
+    trace_config = aiohttp.TraceConfig()
+    
+    async def on_request_start(session, ctx, params):
+        stats.requests += 1
+    
+    async def on_queued_start(session, ctx, params):
+        ctx.queued = True
+        stats.waiting += 1
+        stats.max_waiting = max(stats.max_waiting, stats.waiting)
+    
+    async def on_queued_end(session, ctx, params):
+        ctx.queued = False
+        stats.waiting -= 1
+    
+    async def on_request_exception(session, ctx, params):
+        # 待機中にキャンセルされた場合はqueued_endが呼ばれないためここで戻す
+        if getattr(ctx, 'queued', False):
+            ctx.queued = False
+            stats.waiting -= 1
+    
+    async def on_create_end(session, ctx, params):
+        stats.opened += 1
+    
+    async def on_reuse(session, ctx, params):
+        stats.reused += 1
+    
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_queued_start.append(on_queued_start)
+    trace_config.on_connection_queued_end.append(on_queued_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    trace_config.on_connection_create_end.append(on_create_end)
+    trace_config.on_connection_reuseconn.append(on_reuse)
+    return trace_config
+
+
+def get_session(name: str) -> aiohttp.ClientSession:
+    """名前付きの共有aiohttpセッションを取得（実行中のイベントループごとに1つ）"""
+    loop = asyncio.get_running_loop()
+    entry = _sessions.get(name)
+    if entry is not None:
+        session, session_loop = entry
+        if not session.closed and session_loop is loop:
+            return session
+    
+    config = get_http_config()
+    connector = aiohttp.TCPConnector(
+        limit=config['pool_size'],
+        limit_per_host=config['pool_per_host'],
+        keepalive_timeout=config['keepalive_timeout']
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config['total_timeout'],
+        connect=config['connect_timeout'],
+        sock_read=config['read_timeout']
+    )
+    session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        trace_configs=[_create_trace_config(_get_stats(name))]
+    )
+    _sessions[name] = (session, loop)
+    logger.info(f"HTTPプールを作成しました: name={name}, limit={config['pool_size']}, per_host={config['pool_per_host']}")
+    return session
+
+
+def get_pool_stats() -> Dict[str, Dict]:
+    """全プールの統計情報を取得"""
+    return {name: stats.to_dict() for name, stats in _stats.items()}
+
+
+async def close_sessions():
+    """全ての共有セッションを閉じる"""
+    for session, _ in list(_sessions.values()):
+        if not session.closed:
+            await session.close()
+    _sessions.clear()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ETag / Last-Modified による条件付きリクエスト用のレスポンスキャッシュモジュール"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple, Union
+from urllib.parse import urlencode
+from core.config import get_cache_config
+
+Params = Union[Mapping[str, Any], Iterable[Tuple[str, Any]], None]
+
+
+class CachedResponse:
+    """検証子（ETag / Last-Modified）とデコード済みのレスポンス本文"""
+    
+    __slots__ = ('etag', 'last_modified', 'body')
+    
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], body: Any):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+    
+    def conditional_headers(self) -> Dict[str, str]:
+        """再検証用のリクエストヘッダーを作成"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ConditionalCache:
+    """GETレスポンスを検証子付きで保持し、304 Not Modified の時に本文を再利用するキャッシュ
+    
+    サーバーが ETag / Last-Modified を返したレスポンスだけを保存し、次回の同じリクエストで
+    If-None-Match / If-Modified-Since を送る。304の場合は保存済みの本文を返すため、
+    本文のダウンロードとJSONのデコードを省略できる。保存数は max_entries 件までのLRU。
+    """
+    
+    def __init__(self, name: str, max_entries: int = 1000):
+        self.name = name
+        self.max_entries = max_entries
+        
+        self.hits = 0  # 304で保存済みの本文を返した回数
+        self.revalidations = 0  # 検証子付きで送ったリクエスト数
+        self.misses = 0  # 保存済みのレスポンスがなかった回数
+        self.stored = 0  # 保存したレスポンス数
+        
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+    
+    @staticmethod
+    def key(url: str, params: Params = None) -> str:
+        """URLとクエリパラメータからキャッシュキーを作成（パラメータの順序に依存しない）"""
+        if not params:
+            return url
+        items = params.items() if isinstance(params, Mapping) else params
+        pairs = []
+        for name, value in items:
+            values = value if isinstance(value, (list, tuple)) else [value]
+            pairs.extend((str(name), str(v)) for v in values)
+        return f"{url}?{urlencode(sorted(pairs))}"
+    
+    def lookup(self, key: str) -> Optional[CachedResponse]:
+        """保存済みのレスポンスを取得（見つかった場合は再検証として数える）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.revalidations += 1
+        return entry
+    
+    def not_modified(self, entry: CachedResponse) -> Any:
+        """304を受け取った時に保存済みの本文を返す"""
+        self.hits += 1
+        return entry.body
+    
+    def store(self, key: str, headers: Mapping[str, str], body: Any):
+        """検証子付きのレスポンスを保存（検証子がない場合は保存しない）"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        
+        self._entries[key] = CachedResponse(etag, last_modified, body)
+        self._entries.move_to_end(key)
+        self.stored += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        """キャッシュの統計情報を取得"""
+        return {
+            'hits': self.hits,
+            'revalidations': self.revalidations,
+            'misses': self.misses,
+            'stored': self.stored,
+            'entries': len(self._entries)
+        }
+
+
+_response_caches: Dict[str, ConditionalCache] = {}
+
+
+def get_response_cache(name: str) -> ConditionalCache:
+    """名前付きの共有レスポンスキャッシュを取得（HTTPプールと同じ名前を使う）"""
+    cache = _response_caches.get(name)
+    if cache is None:
+        cache = ConditionalCache(name, max_entries=get_cache_config()['response_cache_entries'])
+        _response_caches[name] = cache
+    return cache
+
+
+def get_response_cache_stats() -> Dict[str, Dict]:
+    """全レスポンスキャッシュの統計情報を取得"""
+    return {name: cache.stats() for name, cache in _response_caches.items()}
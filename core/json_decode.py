@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""APIレスポンスのJSONデコードとフィールド射影モジュール"""
+
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準のjsonを使う
+    orjson = None
+
+# 残すフィールドの指定: {フィールド名: None（値をそのまま残す） or ネストしたフィールド指定}
+# リストの値にはネストした指定を要素ごとに適用する
+Fields = Dict[str, Optional["Fields"]]
+
+
+def loads(data: bytes) -> Any:
+    """JSONのバイト列をデコード（orjson が使える場合は orjson を使う）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project(value: Any, fields: Optional[Fields]) -> Any:
+    """デコード済みの値から指定されたフィールドだけを残す"""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {name: project(value[name], sub_fields) for name, sub_fields in fields.items() if name in value}
+
+
+def decode(data: bytes, fields: Optional[Fields] = None) -> Any:
+    """JSONのバイト列をデコードし、fields が指定されていれば使うフィールドだけを残す"""
+    return project(loads(data), fields)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! APIレスポンスの軽量データモデルモジュール
+
+APIのJSONはここで一度だけパースし、表示に使うフィールドだけを保持する。
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from core.mods import mods_to_bitmask, bitmask_to_mods
+
+
+def parse_timestamp(value: Optional[str]) -> float:
+    """ISO 8601形式の日時（例: "2025-01-15T12:30:45Z"）をUNIX時間に変換"""
+    if not value:
+        return 0.0
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return 0.0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _mod_acronyms(mods: List[Any]) -> List[str]:
+    """MODのリスト（文字列 or lazer形式の {'acronym': ...}）を略称のリストに変換"""
+    return [mod['acronym'] if isinstance(mod, dict) else mod for mod in mods or []]
+
+
+class Beatmap:
+    """譜面情報"""
+    
+    __slots__ = ('id', 'beatmapset_id', 'version', 'star_rating', 'artist', 'title', 'cover_url')
+    
+    def __init__(
+        self,
+        id: int,
+        beatmapset_id: int,
+        version: str,
+        star_rating: float,
+        artist: str,
+        title: str,
+        cover_url: str
+    ):
+        self.id = id
+        self.beatmapset_id = beatmapset_id
+        self.version = version
+        self.star_rating = star_rating
+        self.artist = artist
+        self.title = title
+        self.cover_url = cover_url
+    
+    @classmethod
+    def from_api(cls, beatmap: Dict, beatmapset: Optional[Dict] = None) -> "Beatmap":
+        """APIのbeatmap / beatmapsetオブジェクトから生成"""
+        beatmapset = beatmapset or beatmap.get('beatmapset') or {}
+        return cls(
+            id=beatmap.get('id', 0),
+            beatmapset_id=beatmapset.get('id') or beatmap.get('beatmapset_id', 0),
+            version=beatmap.get('version', 'Unknown'),
+            star_rating=beatmap.get('difficulty_rating', 0) or 0,
+            artist=beatmapset.get('artist', 'Unknown'),
+            title=beatmapset.get('title', 'Unknown'),
+            cover_url=beatmapset.get('covers', {}).get('card', '')
+        )
+    
+    @property
+    def url(self) -> str:
+        """譜面ページのURL（IDが不明な場合は空文字）"""
+        if self.beatmapset_id and self.id:
+            return f"https://osu.ppy.sh/beatmapsets/{self.beatmapset_id}#osu/{self.id}"
+        return ""
+
+
+class Score:
+    """ベストスコア"""
+    
+    __slots__ = ('pp', 'created_at', 'mods', 'accuracy', 'beatmap', 'modded_star_rating')
+    
+    def __init__(
+        self,
+        pp: float,
+        created_at: float,
+        mods: int,
+        accuracy: float,
+        beatmap: Beatmap,
+        modded_star_rating: float = 0.0
+    ):
+        self.pp = pp
+        self.created_at = created_at  # UNIX時間
+        self.mods = mods              # MODのビットマスク
+        self.accuracy = accuracy      # 0.0〜1.0
+        self.beatmap = beatmap
+        self.modded_star_rating = modded_star_rating  # APIから取得したMOD適用後のSR（未取得なら0）
+    
+    @classmethod
+    def from_api(cls, score: Dict) -> "Score":
+        """APIのscoreオブジェクトから生成"""
+        return cls(
+            pp=score.get('pp') or 0.0,
+            created_at=parse_timestamp(score.get('created_at') or score.get('ended_at')),
+            mods=mods_to_bitmask(_mod_acronyms(score.get('mods', []))),
+            accuracy=score.get('accuracy') or 0.0,
+            beatmap=Beatmap.from_api(score.get('beatmap') or {}, score.get('beatmapset'))
+        )
+    
+    @property
+    def mod_names(self) -> List[str]:
+        """MODの略称リスト"""
+        return bitmask_to_mods(self.mods)
+    
+    @property
+    def created_date(self) -> datetime:
+        """取得日時（UTC）"""
+        return datetime.fromtimestamp(self.created_at, timezone.utc)
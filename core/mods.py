@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! MODビットマスク変換モジュール"""
+
+from typing import Optional, List
+
+
+# MOD名 -> ビットマスク
+MOD_BITS = {
+    'NF': 1, 'EZ': 2, 'TD': 4, 'HD': 8, 'HR': 16, 'SD': 32, 'DT': 64, 'RX': 128,
+    'HT': 256, 'NC': 512, 'FL': 1024, 'AT': 2048, 'SO': 4096, 'AP': 8192, 'PF': 16384,
+    '4K': 32768, '5K': 65536, '6K': 131072, '7K': 262144, '8K': 524288, 'FI': 1048576,
+    'RD': 2097152, 'CN': 4194304, 'TP': 8388608, 'K9': 16777216, 'KC': 33554432,
+    '1K': 67108864, '3K': 134217728, '2K': 268435456, 'V2': 536870912, 'MR': 1073741824
+}
+
+
+def mods_to_bitmask(mods: Optional[List[str]]) -> int:
+    """MODのリストをビットマスクに変換"""
+    mod_bitmask = 0
+    if not mods:
+        return mod_bitmask
+    
+    for mod in mods:
+        if mod in MOD_BITS:
+            mod_bitmask |= MOD_BITS[mod]
+        # NCはDTを含む（NCが指定されている場合はDTも含める）
+        if mod == 'NC' and 'DT' not in mods:
+            mod_bitmask |= MOD_BITS['DT']
+    
+    return mod_bitmask
+
+
+# 難易度（Star Rating等）に影響するMOD
+DIFFICULTY_MOD_MASK = MOD_BITS['EZ'] | MOD_BITS['HR'] | MOD_BITS['DT'] | MOD_BITS['HT'] | MOD_BITS['FL']
+
+
+def difficulty_mods_bitmask(mods: Optional[List[str]]) -> int:
+    """難易度に影響するMODだけのビットマスクを取得（NCはDTとして扱う）"""
+    return difficulty_bitmask(mods_to_bitmask(mods))
+
+
+def difficulty_bitmask(mod_bitmask: int) -> int:
+    """ビットマスクから難易度に影響するMODだけを取り出す（NCはDTとして扱う）"""
+    result = mod_bitmask & DIFFICULTY_MOD_MASK
+    if mod_bitmask & MOD_BITS['NC']:
+        result |= MOD_BITS['DT']
+    # FL使用時はHDもFlashlightの難易度に影響する
+    if result & MOD_BITS['FL']:
+        result |= mod_bitmask & MOD_BITS['HD']
+    return result
+
+
+def bitmask_to_mods(mod_bitmask: int) -> List[str]:
+    """ビットマスクをMODの略称リストに変換（NC/PFが含むDT/SDは省略）"""
+    mods = [mod for mod, bit in MOD_BITS.items() if mod_bitmask & bit]
+    if 'NC' in mods and 'DT' in mods:
+        mods.remove('DT')
+    if 'PF' in mods and 'SD' in mods:
+        mods.remove('SD')
+    return mods
@@ -2,36 +2,108 @@
 # -*- coding: utf-8 -*-
 """osu! API v2 クライアントモジュール"""
 
-import requests
-from typing import Optional, Dict, List
+import asyncio
+import aiohttp
+from typing import Optional, Dict, List, Any, AsyncIterator, Callable
+from core.batching import BatchLoader
+from core.cache import TieredCache, get_beatmap_attributes_cache, get_beatmap_cache
+from core.config import get_osu_credentials
+from core.http import get_session
+from core.http_cache import ConditionalCache, get_response_cache
+from core.json_decode import Fields, decode
+from core.models import Score
+from core.mods import difficulty_mods_bitmask
+from core.osu_auth import OsuTokenProvider, get_osu_token_provider
+from core.logger import get_logger
+from core.rate_limit import RateGovernor, get_osu_rate_governor, PRIORITY_INTERACTIVE, PRIORITY_ENRICHMENT
+from core.resilience import RetryPolicy, get_circuit_breaker, is_retryable_status
+
+logger = get_logger("osu_api")
+
+# エンドポイントごとに残すフィールド（ページHTML・バッジ・ランク履歴などの使わないフィールドは捨てる）
+USER_FIELDS: Fields = {
+    'id': None,
+    'username': None,
+    'avatar_url': None,
+    'join_date': None,
+    'scores_best_count': None,
+    'statistics': {'play_count': None},
+    'monthly_playcounts': {'start_date': None, 'count': None}
+}
+SCORE_FIELDS: Fields = {
+    'pp': None,
+    'created_at': None,
+    'ended_at': None,
+    'mods': None,
+    'accuracy': None,
+    'beatmap': {'id': None, 'beatmapset_id': None, 'version': None, 'difficulty_rating': None},
+    'beatmapset': {'id': None, 'artist': None, 'title': None, 'covers': {'card': None}}
+}
 
 
 class OsuAPIClient:
-    """osu! API v2 クライアント"""
+    """osu! API v2 クライアント（asyncio版）
+    
+    イベントループをブロックしないようにaiohttpで通信する。
+    セッションを渡さない場合は共有のkeep-aliveプール（"osu"）を使用する。
+    """
     
     BASE_URL = "https://osu.ppy.sh/api/v2"
-    TOKEN_URL = "https://osu.ppy.sh/oauth/token"
+    OSU_FILE_URL = "https://osu.ppy.sh/osu"
+    BEST_SCORES_PAGE_SIZE = 100  # 1リクエストで取得できるベストスコアの最大件数
+    BEST_SCORES_LIMIT = 200  # APIから取得できるベストスコアの上限
+    BEATMAPS_BATCH_SIZE = 50  # 複数譜面取得APIで1回に指定できるIDの最大数
+    BEATMAPS_BATCH_WINDOW = 0.01  # 譜面IDをまとめるために待つ秒数
     
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        token_provider: Optional[OsuTokenProvider] = None,
+        attributes_cache: Optional[TieredCache] = None,
+        rate_governor: Optional[RateGovernor] = None,
+        beatmap_cache: Optional[TieredCache] = None,
+        response_cache: Optional[ConditionalCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        beatmap_loader: Optional[BatchLoader] = None
+    ):
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token = None
-        self._authenticate()
-    
-    def _authenticate(self):
-        """APIアクセストークンの取得"""
-        data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'grant_type': 'client_credentials',
-            'scope': 'public'
-        }
-        
-        response = requests.post(self.TOKEN_URL, data=data)
-        response.raise_for_status()
-        
-        token_data = response.json()
-        self.access_token = token_data['access_token']
+        # トークンはプロセス全体で共有（クライアント生成ごとに再認証しない）
+        self.token_provider = token_provider or get_osu_token_provider(client_id, client_secret)
+        self.attributes_cache = attributes_cache or get_beatmap_attributes_cache()
+        # 全クライアントで共有するレート制御（osu!側のレート制限に掛からないようにする）
+        self.rate_governor = rate_governor or get_osu_rate_governor()
+        self.beatmap_cache = beatmap_cache or get_beatmap_cache()
+        # ETag / Last-Modified で再検証するGETレスポンスのキャッシュ（全クライアントで共有）
+        self.response_cache = response_cache or get_response_cache('osu')
+        # 5xx・429・タイムアウト時のリトライ方針（サーキットブレーカーはホストごとに共有）
+        self.retry_policy = retry_policy or RetryPolicy.from_config()
+        # 同時に要求された譜面IDを1回の複数譜面取得リクエストにまとめる（全クライアントで共有）
+        self.beatmap_loader = beatmap_loader or get_beatmap_loader()
+        self._session = session
+    
+    async def __aenter__(self) -> "OsuAPIClient":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def close(self):
+        """クライアントを閉じる（共有プールのコネクションは閉じずに再利用する）"""
+        self._session = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """HTTPセッションの取得"""
+        if self._session is None or self._session.closed:
+            return get_session('osu')
+        return self._session
+    
+    async def _authenticate(self, stale_token: Optional[str] = None):
+        """共有プロバイダからAPIアクセストークンを取得"""
+        self.access_token = await self.token_provider.get_token(self._get_session(), stale_token=stale_token)
     
     def _get_headers(self) -> Dict[str, str]:
         """認証ヘッダーの取得"""
@@ -41,77 +113,283 @@ class OsuAPIClient:
             'Accept': 'application/json'
         }
     
-    def get_user(self, username: str, mode: str = 'osu') -> Optional[Dict]:
-        """ユーザー情報の取得"""
-        url = f"{self.BASE_URL}/users/{username}/{mode}"
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        allow_404: bool = False,
+        priority: int = PRIORITY_INTERACTIVE,
+        conditional: bool = False,
+        fields: Optional[Fields] = None,
+        **kwargs
+    ) -> Any:
+        """APIリクエストを送信してJSONを返す（allow_404の場合は404でNoneを返す）
         
-        response = requests.get(url, headers=self._get_headers())
+        fields を指定した場合は指定されたフィールドだけを残す。conditional の場合は
+        保存済みの検証子で条件付きリクエストを送り、304 Not Modified なら保存済みの本文を返す。
+        """
+        await self._authenticate()
         
-        if response.status_code == 404:
-            return None
+        cache_key = self.response_cache.key(url, kwargs.get('params')) if conditional else None
+        cached = self.response_cache.lookup(cache_key) if conditional else None
         
-        response.raise_for_status()
-        return response.json()
+        breaker = get_circuit_breaker(url)
+        retry_policy = self.retry_policy
+        reauthenticated = False
+        attempt = 0
+        delay = 0.0
+        retry_delay = 0.0
+        
+        while True:
+            # バックオフはレスポンスを閉じてから待つ（待っている間プールのコネクションを占有しない）
+            if retry_delay > 0:
+                await asyncio.sleep(retry_delay)
+                retry_delay = 0.0
+            
+            # サーバーが落ちている間はリクエストを送らずに即座に失敗する
+            breaker.before_request()
+            headers = self._get_headers()
+            if cached is not None:
+                headers.update(cached.conditional_headers())
+            
+            await self.rate_governor.acquire(priority)
+            attempt += 1
+            try:
+                async with self._get_session().request(method, url, headers=headers, **kwargs) as response:
+                    self.rate_governor.on_response(response.status, response.headers)
+                    if response.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    
+                    # トークンが失効していた場合は再取得して1回だけリトライ
+                    if response.status == 401 and not reauthenticated:
+                        reauthenticated = True
+                        await self._authenticate(stale_token=self.access_token)
+                        continue
+                    
+                    if is_retryable_status(response.status) and attempt < retry_policy.attempts:
+                        # 429はレート制御がRetry-Afterの間止めるため、ここでは待たない
+                        if response.status != 429:
+                            delay = retry_policy.backoff(delay)
+                            logger.warning(f"osu! APIエラーのためリトライします: status={response.status}, url={url}, attempt={attempt}, delay={delay:.2f}s")
+                            retry_delay = delay
+                        continue
+                    
+                    if cached is not None and response.status == 304:
+                        return self.response_cache.not_modified(cached)
+                    
+                    if allow_404 and response.status == 404:
+                        return None
+                    
+                    response.raise_for_status()
+                    data = decode(await response.read(), fields)
+                    if conditional:
+                        self.response_cache.store(cache_key, response.headers, data)
+                    return data
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                breaker.record_failure()
+                if attempt >= retry_policy.attempts:
+                    raise
+                delay = retry_policy.backoff(delay)
+                logger.warning(f"osu! API通信エラーのためリトライします: url={url}, attempt={attempt}, delay={delay:.2f}s, error={e!r}")
+                retry_delay = delay
     
-    def get_user_recent_activity(self, user_id: int, limit: int = 100) -> List[Dict]:
+    async def get_user(self, username: str, mode: str = 'osu', priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict]:
+        """ユーザー情報の取得"""
+        url = f"{self.BASE_URL}/users/{username}/{mode}"
+        return await self._request('GET', url, allow_404=True, priority=priority, conditional=True, fields=USER_FIELDS)
+    
+    async def get_user_recent_activity(self, user_id: int, limit: int = 100, priority: int = PRIORITY_INTERACTIVE) -> List[Dict]:
         """ユーザーの最近のアクティビティを取得"""
         url = f"{self.BASE_URL}/users/{user_id}/recent_activity"
         params = {'limit': limit}
-        
-        response = requests.get(url, headers=self._get_headers(), params=params)
-        response.raise_for_status()
-        return response.json()
+        return await self._request('GET', url, priority=priority, params=params)
     
-    def get_user_best_scores(self, user_id: int, mode: str = 'osu', limit: int = 100) -> List[Dict]:
-        """ユーザーのベストスコア（PP）を取得"""
+    async def get_user_best_scores(
+        self,
+        user_id: int,
+        mode: str = 'osu',
+        limit: int = 100,
+        offset: int = 0,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Score]:
+        """ユーザーのベストスコア（PP）を取得（表示に使うフィールドだけのScoreに変換）"""
         url = f"{self.BASE_URL}/users/{user_id}/scores/best"
         params = {'mode': mode, 'limit': limit}
-        
-        response = requests.get(url, headers=self._get_headers(), params=params)
-        response.raise_for_status()
-        return response.json()
+        if offset:
+            params['offset'] = offset
+        scores = await self._request('GET', url, priority=priority, conditional=True, fields=SCORE_FIELDS, params=params)
+        return [Score.from_api(score) for score in scores]
     
-    def get_beatmap(self, beatmap_id: int) -> Optional[Dict]:
-        """譜面情報の取得"""
-        url = f"{self.BASE_URL}/beatmaps/{beatmap_id}"
+    async def iter_user_best_scores(
+        self,
+        user_id: int,
+        mode: str = 'osu',
+        max_scores: int = BEST_SCORES_LIMIT,
+        should_continue: Optional[Callable[[List[Score]], bool]] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> AsyncIterator[Score]:
+        """ベストスコアをページ単位（offset指定）で取得しながら1件ずつ返す
+        
+        次のページは現在のページを返している間に先読みする。ページが埋まらなかった場合、
+        max_scores に達した場合、should_continue(ページ) が False を返した場合は以降のページを取得しない。
+        呼び出し側がループを抜けた場合は先読み中のリクエストをキャンセルする
+        （確実にキャンセルするには contextlib.aclosing で囲む）。
+        """
+        max_scores = min(max_scores, self.BEST_SCORES_LIMIT)
+        
+        def fetch_page(offset: int) -> asyncio.Task:
+            limit = min(self.BEST_SCORES_PAGE_SIZE, max_scores - offset)
+            return asyncio.ensure_future(
+                self.get_user_best_scores(user_id, mode, limit, offset=offset, priority=priority)
+            )
         
-        response = requests.get(url, headers=self._get_headers())
+        if max_scores <= 0:
+            return
+        
+        offset = 0
+        pending = fetch_page(offset)
+        try:
+            while pending is not None:
+                page = await pending
+                pending = None
+                requested = min(self.BEST_SCORES_PAGE_SIZE, max_scores - offset)
+                offset += len(page)
+                
+                # 続きがありそうな場合のみ、現在のページを返す前に次のページを先読み
+                has_more = len(page) >= requested and offset < max_scores
+                if has_more and (should_continue is None or should_continue(page)):
+                    pending = fetch_page(offset)
+                
+                for score in page:
+                    yield score
+        finally:
+            if pending is not None:
+                pending.cancel()
+                # キャンセル前に失敗していた場合の例外を回収（未回収の警告を出さない）
+                pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+    
+    async def get_beatmap(self, beatmap_id: int) -> Optional[Dict]:
+        """譜面情報の取得（キャッシュ経由、同時に要求された他の譜面とまとめて取得）"""
+        beatmaps = await self.load_beatmaps([beatmap_id])
+        return beatmaps.get(beatmap_id)
+    
+    async def get_beatmaps(self, beatmap_ids: List[int], priority: int = PRIORITY_ENRICHMENT) -> List[Dict]:
+        """複数の譜面情報を1回のリクエストで取得（最大50件、存在しない譜面は結果に含まれない）"""
+        url = f"{self.BASE_URL}/beatmaps"
+        params = [('ids[]', beatmap_id) for beatmap_id in beatmap_ids[:self.BEATMAPS_BATCH_SIZE]]
+        result = await self._request('GET', url, priority=priority, params=params)
+        return result.get('beatmaps', [])
+    
+    async def load_beatmaps(self, beatmap_ids: List[int]) -> Dict[int, Dict]:
+        """複数の譜面情報を取得（キャッシュにない譜面だけを50件ずつまとめて取得）
         
-        if response.status_code == 404:
-            return None
+        Returns:
+            {譜面ID: 譜面情報}（存在しない譜面は含まない）
+        """
+        beatmap_ids = list(dict.fromkeys(beatmap_ids))
+        cached = await self.beatmap_cache.get_many(str(beatmap_id) for beatmap_id in beatmap_ids)
+        results = {beatmap_id: cached[str(beatmap_id)] for beatmap_id in beatmap_ids if str(beatmap_id) in cached}
         
-        response.raise_for_status()
-        return response.json()
+        missing = [beatmap_id for beatmap_id in beatmap_ids if beatmap_id not in results]
+        if missing:
+            loaded = await self.beatmap_loader.load_many(missing)
+            results.update({beatmap_id: beatmap for beatmap_id, beatmap in loaded.items() if beatmap is not None})
+        return results
+    
+    async def load_beatmap_batch(self, beatmap_ids: List[int]) -> Dict[int, Dict]:
+        """1バッチ分の譜面情報を取得（付加情報の優先度で取得し、結果はキャッシュに保存）"""
+        beatmaps = await self.get_beatmaps(beatmap_ids)
+        results = {beatmap['id']: beatmap for beatmap in beatmaps}
+        await self.beatmap_cache.set_many({str(beatmap_id): beatmap for beatmap_id, beatmap in results.items()})
+        return results
+    
+    async def get_osu_file(self, beatmap_id: int, priority: int = PRIORITY_ENRICHMENT) -> Optional[bytes]:
+        """譜面の .osu ファイルを取得（API外のため認証なし、存在しない場合はNone）"""
+        url = f"{self.OSU_FILE_URL}/{beatmap_id}"
+        breaker = get_circuit_breaker(url)
+        breaker.before_request()
+        await self.rate_governor.acquire(priority)
+        try:
+            response = await self._get_session().get(url)
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            breaker.record_failure()
+            raise
+        async with response:
+            self.rate_governor.on_response(response.status, response.headers)
+            if response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.read() or None
+    
+    @staticmethod
+    def _attributes_cache_key(beatmap_id: int, mod_bitmask: int, ruleset: str) -> str:
+        """譜面属性キャッシュのキー"""
+        cache_key = f"{beatmap_id}:{mod_bitmask}"
+        if ruleset != 'osu':
+            # コンバート譜面はモードごとに難易度が異なる（既存のosu!キャッシュのキーはそのまま）
+            cache_key = f"{cache_key}:{ruleset}"
+        return cache_key
     
-    def get_beatmap_attributes(self, beatmap_id: int, mods: List[str] = None) -> Optional[Dict]:
-        """MOD適用後の譜面属性を取得（難易度情報を含む）"""
+    async def get_cached_beatmap_attributes(self, beatmap_id: int, mods: List[str] = None, ruleset: str = 'osu') -> Optional[Dict]:
+        """キャッシュ済みのMOD適用後の譜面属性を取得（APIは呼ばない、なければNone）"""
+        return await self.attributes_cache.get(self._attributes_cache_key(beatmap_id, difficulty_mods_bitmask(mods), ruleset))
+    
+    async def get_beatmap_attributes(
+        self,
+        beatmap_id: int,
+        mods: List[str] = None,
+        ruleset: str = 'osu',
+        priority: int = PRIORITY_ENRICHMENT
+    ) -> Optional[Dict]:
+        """MOD適用後の譜面属性を取得（難易度情報を含む）
+        
+        結果は譜面ID + 難易度に影響するMODのビットマスク（+ osu!以外のモード名）をキーに永続キャッシュする。
+        """
         url = f"{self.BASE_URL}/beatmaps/{beatmap_id}/attributes"
         
-        # MODのビットマスクを計算
-        mod_bitmask = 0
-        if mods:
-            mod_to_bit = {
-                'NF': 1, 'EZ': 2, 'TD': 4, 'HD': 8, 'HR': 16, 'SD': 32, 'DT': 64, 'RX': 128,
-                'HT': 256, 'NC': 512, 'FL': 1024, 'AT': 2048, 'SO': 4096, 'AP': 8192, 'PF': 16384,
-                '4K': 32768, '5K': 65536, '6K': 131072, '7K': 262144, '8K': 524288, 'FI': 1048576,
-                'RD': 2097152, 'CN': 4194304, 'TP': 8388608, 'K9': 16777216, 'KC': 33554432,
-                '1K': 67108864, '3K': 134217728, '2K': 268435456, 'V2': 536870912, 'MR': 1073741824
-            }
-            
-            for mod in mods:
-                if mod in mod_to_bit:
-                    mod_bitmask |= mod_to_bit[mod]
-                # NCはDTを含む（NCが指定されている場合はDTも含める）
-                if mod == 'NC' and 'DT' not in mods:
-                    mod_bitmask |= mod_to_bit['DT']
+        # 難易度に影響するMODのビットマスクを計算（HD/NF等は結果が変わらないため除外）
+        mod_bitmask = difficulty_mods_bitmask(mods)
+        cache_key = self._attributes_cache_key(beatmap_id, mod_bitmask, ruleset)
+        
+        cached = await self.attributes_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # POSTリクエストでmodsパラメータを送信
         payload = {'mods': mod_bitmask} if mod_bitmask > 0 else {}
-        response = requests.post(url, headers=self._get_headers(), json=payload)
-        
-        if response.status_code == 404:
-            return None
+        if ruleset != 'osu':
+            payload['ruleset'] = ruleset
+        attributes = await self._request('POST', url, allow_404=True, priority=priority, json=payload)
         
-        response.raise_for_status()
-        return response.json()
+        if attributes is not None:
+            await self.attributes_cache.set(cache_key, attributes)
+        return attributes
+
+
+async def _load_beatmap_batch(beatmap_ids: List[int]) -> Dict[int, Dict]:
+    """共有のBatchLoaderから呼ばれる1バッチ分の取得処理（呼び出し元に関係なく共有の認証情報で取得する）"""
+    client_id, client_secret = get_osu_credentials()
+    async with OsuAPIClient(client_id, client_secret) as client:
+        return await client.load_beatmap_batch(beatmap_ids)
+
+
+_beatmap_loader: Optional[BatchLoader] = None
+
 
+def get_beatmap_loader() -> BatchLoader:
+    """全クライアントで共有する譜面情報のバッチローダーを取得（別々の呼び出し元が同時に要求した譜面IDもまとめて取得する）"""
+    global _beatmap_loader
+    if _beatmap_loader is None:
+        _beatmap_loader = BatchLoader(
+            'beatmaps',
+            _load_beatmap_batch,
+            max_batch_size=OsuAPIClient.BEATMAPS_BATCH_SIZE,
+            window=OsuAPIClient.BEATMAPS_BATCH_WINDOW
+        )
+    return _beatmap_loader
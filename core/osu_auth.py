@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! API OAuthトークン管理モジュール"""
+
+import asyncio
+import time
+import aiohttp
+from typing import Optional, Dict, Tuple
+from core.logger import get_logger
+
+logger = get_logger("osu_auth")
+
+
+class OsuTokenProvider:
+    """client_credentialsトークンをプロセス全体で共有するプロバイダ
+    
+    有効期限（expires_in）の手前で再取得し、同時に再取得が必要になった場合は
+    1本のリクエストの完了を全員で待つ。
+    """
+    
+    TOKEN_URL = "https://osu.ppy.sh/oauth/token"
+    REFRESH_MARGIN = 300  # 有効期限の何秒前に再取得するか
+    
+    def __init__(self, client_id: str, client_secret: str):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token: Optional[str] = None
+        self.expires_at: float = 0.0
+        self.refresh_count = 0
+        self._lock = asyncio.Lock()
+    
+    def _is_valid(self) -> bool:
+        """キャッシュ済みトークンがまだ使えるか"""
+        return self.access_token is not None and time.monotonic() < self.expires_at - self.REFRESH_MARGIN
+    
+    async def get_token(self, session: aiohttp.ClientSession, stale_token: Optional[str] = None) -> str:
+        """アクセストークンを取得（stale_tokenを渡すとそのトークンを無効として扱う）"""
+        if self._is_valid() and self.access_token != stale_token:
+            return self.access_token
+        
+        async with self._lock:
+            # 待っている間に他のリクエストが再取得を終えていればそれを使う
+            if self._is_valid() and self.access_token != stale_token:
+                return self.access_token
+            
+            await self._refresh(session)
+            return self.access_token
+    
+    async def _refresh(self, session: aiohttp.ClientSession):
+        """トークンエンドポイントから新しいトークンを取得"""
+        data = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'grant_type': 'client_credentials',
+            'scope': 'public'
+        }
+        
+        async with session.post(self.TOKEN_URL, data=data) as response:
+            response.raise_for_status()
+            token_data = await response.json()
+        
+        self.access_token = token_data['access_token']
+        self.expires_at = time.monotonic() + token_data.get('expires_in', 86400)
+        self.refresh_count += 1
+        logger.info(f"osu!アクセストークンを取得しました: expires_in={token_data.get('expires_in')}, refresh_count={self.refresh_count}")
+
+
+_providers: Dict[Tuple[str, str], OsuTokenProvider] = {}
+
+
+def get_osu_token_provider(client_id: str, client_secret: str) -> OsuTokenProvider:
+    """認証情報ごとに共有のトークンプロバイダを取得"""
+    key = (client_id, client_secret)
+    provider = _providers.get(key)
+    if provider is None:
+        provider = OsuTokenProvider(client_id, client_secret)
+        _providers[key] = provider
+    return provider
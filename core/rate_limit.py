@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""外部API用のクライアント側レート制御モジュール"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Any, Awaitable, Deque, Dict, List, Mapping, Optional, Tuple
+from core.config import get_osu_rate_limit_config
+from core.logger import get_logger
+from core.resilience import parse_retry_after
+
+logger = get_logger("rate_limit")
+
+# 優先度（小さいほど先に処理する）
+PRIORITY_INTERACTIVE = 0  # ユーザー情報・ベストスコアなど、コマンド応答に必須のもの
+PRIORITY_ENRICHMENT = 1   # MOD適用後Star Ratingなどの付加情報
+PRIORITY_BACKGROUND = 2   # キャッシュのウォームアップなど
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_ENRICHMENT: 'enrichment',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+
+class ActiveClock:
+    """レート制御の待ち行列にいた時間を除いた経過時間を測る時計"""
+    
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.queued = 0.0  # 待ち行列にいた合計秒数（待ち終わった分）
+        self.waiting_since: Optional[float] = None  # 待ち行列にいる場合は待ち始めた時刻
+        self.active = asyncio.Event()  # 待ち行列にいない間はセットされる
+        self.active.set()
+    
+    def start_waiting(self, started_at: float):
+        """待ち行列に入ったことを記録"""
+        self.waiting_since = started_at
+        self.active.clear()
+    
+    def stop_waiting(self):
+        """待ち行列を出たことを記録"""
+        if self.waiting_since is not None:
+            self.queued += time.monotonic() - self.waiting_since
+            self.waiting_since = None
+        self.active.set()
+    
+    def elapsed(self) -> float:
+        """待ち行列にいた時間を除いた経過秒数"""
+        now = time.monotonic()
+        queued = self.queued
+        if self.waiting_since is not None:
+            queued += now - self.waiting_since
+        return now - self.started_at - queued
+
+
+# wait_for_active で実行中の処理の時計（acquire で待った時間を記録する）
+_active_clock: ContextVar[Optional[ActiveClock]] = ContextVar('rate_limit_active_clock', default=None)
+
+
+async def wait_for_active(aw: Awaitable[Any], timeout: float) -> Any:
+    """asyncio.wait_for と同様だが、レート制御の待ち行列にいる時間はタイムアウトに含めない
+    
+    リクエストが混んでいるだけで、送信後の応答が遅くない処理を打ち切らないようにする。
+    """
+    clock = ActiveClock()
+    
+    async def run():
+        _active_clock.set(clock)
+        return await aw
+    
+    task = asyncio.ensure_future(run())
+    try:
+        while True:
+            if clock.waiting_since is None:
+                remaining = timeout - clock.elapsed()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, _ = await asyncio.wait({task}, timeout=remaining)
+            else:
+                # 待ち行列にいる間はタイムアウトを進めず、待ち行列を出るか処理が終わるまで待つ
+                left_queue = asyncio.ensure_future(clock.active.wait())
+                try:
+                    done, _ = await asyncio.wait({task, left_queue}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    left_queue.cancel()
+            if task in done:
+                return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    """ソート済みリストのパーセンタイル値を取得"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class RateGovernor:
+    """優先度付きトークンバケット
+    
+    トークンが足りない場合は優先度順に待たせる。429やレート制限ヘッダーを受け取ると
+    補充速度を下げ、成功が続くと設定値まで徐々に戻す。
+    """
+    
+    MIN_RATE_RATIO = 0.25    # 429受信時に下げる補充速度の下限（設定値に対する比率）
+    RECOVERY_STEP = 0.05     # 成功1回あたりに戻す補充速度（設定値に対する比率）
+    WAIT_SAMPLES = 1000      # 待ち時間のパーセンタイル計算に使うサンプル数
+    DEFAULT_PAUSE = 10.0     # Retry-Afterがない429を受けたときの停止秒数
+    
+    def __init__(self, name: str, requests_per_minute: float, burst: int):
+        self.name = name
+        self.base_rate = requests_per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.throttled = 0  # 429を受け取った回数
+        
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wait_times: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+    
+    def _refill(self):
+        """経過時間分のトークンを補充"""
+        now = time.monotonic()
+        if now <= self._updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def _can_take(self) -> bool:
+        return self.tokens >= 1 and time.monotonic() >= self._paused_until
+    
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """リクエスト1回分のトークンを取得（足りなければ優先度順に待つ）"""
+        started_at = time.monotonic()
+        self._refill()
+        
+        if not self._waiters and self._can_take():
+            self.tokens -= 1
+            self._wait_times.append(0.0)
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        
+        clock = _active_clock.get()
+        if clock is not None:
+            clock.start_waiting(started_at)
+        try:
+            # キャンセルされた場合、futureはキャンセル済みとしてディスパッチャに読み飛ばされる
+            await future
+        finally:
+            if clock is not None:
+                clock.stop_waiting()
+        self._wait_times.append(time.monotonic() - started_at)
+    
+    async def _dispatch(self):
+        """待機中のリクエストに優先度順でトークンを配る"""
+        while self._waiters:
+            self._refill()
+            now = time.monotonic()
+            
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+    
+    def on_response(self, status: int, headers: Mapping[str, str]):
+        """レスポンスのステータスとレート制限ヘッダーから制御を調整"""
+        if status == 429:
+            self.throttled += 1
+            # Retry-After は秒数・HTTP日付のどちらでもよい（解釈できなければ既定の秒数だけ止める）
+            pause = parse_retry_after(headers)
+            if pause is None:
+                pause = self.DEFAULT_PAUSE
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            # 停止中はトークンを補充しない
+            self.tokens = 0.0
+            self._updated_at = self._paused_until
+            self.rate = max(self.rate / 2, self.base_rate * self.MIN_RATE_RATIO)
+            logger.warning(f"レート制限を受けました: name={self.name}, pause={pause:.1f}s, rate={self.rate * 60:.1f}/min")
+            return
+        
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None and remaining.isdigit():
+            # サーバー側の残数が少なければ手元のトークンもそれに合わせる
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+        
+        if status < 400 and self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * self.RECOVERY_STEP)
+    
+    def stats(self) -> Dict:
+        """現在のトークン数・待ち行列・待ち時間のパーセンタイルを取得"""
+        self._refill()
+        queue_depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queue_depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        
+        wait_times = sorted(self._wait_times)
+        return {
+            'tokens': round(self.tokens, 2),
+            'rate_per_minute': round(self.rate * 60, 1),
+            'queue_depth': queue_depth,
+            'throttled': self.throttled,
+            'paused_for': round(max(self._paused_until - time.monotonic(), 0.0), 1),
+            'wait_p50': round(_percentile(wait_times, 0.50), 3),
+            'wait_p95': round(_percentile(wait_times, 0.95), 3),
+            'wait_p99': round(_percentile(wait_times, 0.99), 3)
+        }
+
+
+_osu_governor: Optional[RateGovernor] = None
+
+
+def get_osu_rate_governor() -> RateGovernor:
+    """osu! API呼び出しで共有するレート制御を取得"""
+    global _osu_governor
+    if _osu_governor is None:
+        config = get_osu_rate_limit_config()
+        _osu_governor = RateGovernor('osu', config['requests_per_minute'], config['burst'])
+    return _osu_governor
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""外部API呼び出しのリトライ・バックオフ・サーキットブレーカーモジュール"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlparse
+from core.config import get_http_config
+from core.logger import get_logger
+
+logger = get_logger("resilience")
+
+# リトライするHTTPステータス（429はRetry-Afterに従って待つ）
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いているため、リクエストを送らずに失敗したことを表す例外"""
+    
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} is unavailable (circuit open, retry in {retry_in:.1f}s)")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def is_retryable_status(status: int) -> bool:
+    """リトライするHTTPステータスか"""
+    return status in RETRYABLE_STATUSES
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数 or HTTP日付）から待つ秒数を取得"""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """回数上限付きのリトライ方針（decorrelated jitter によるバックオフ）
+    
+    待ち時間は base_delay 〜 前回の待ち時間の3倍 の一様乱数（max_delay が上限）で、
+    複数のクライアントが同時に失敗しても再送のタイミングが揃わないようにする。
+    """
+    
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 10.0):
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    @classmethod
+    def from_config(cls) -> "RetryPolicy":
+        """HTTP設定（HTTP_RETRY_*）からリトライ方針を作成"""
+        config = get_http_config()
+        return cls(config['retry_attempts'], config['retry_base_delay'], config['retry_max_delay'])
+    
+    def backoff(self, previous_delay: float) -> float:
+        """前回の待ち時間から次の待ち時間を計算"""
+        upper = max(previous_delay * 3, self.base_delay)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+
+class CircuitBreaker:
+    """ホストごとのサーキットブレーカー
+    
+    連続で failure_threshold 回失敗するとサーキットを開き、reset_timeout 秒の間は
+    リクエストを送らずに CircuitOpenError で即座に失敗させる。時間が経つと1件だけ
+    試しに通し（半開）、成功すれば閉じて失敗すれば再び開く。
+    """
+    
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.host = host
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        
+        self.failures = 0  # 連続失敗回数
+        self.opened = 0  # サーキットを開いた回数
+        self.rejected = 0  # サーキットが開いていて送らなかったリクエスト数
+        
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+    
+    def before_request(self):
+        """リクエストを送ってよいか確認（送れない場合は CircuitOpenError を送出）"""
+        if self.state == CIRCUIT_CLOSED:
+            return
+        
+        elapsed = time.monotonic() - self._opened_at
+        if self.state == CIRCUIT_OPEN and elapsed >= self.reset_timeout:
+            self.state = CIRCUIT_HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"サーキットを半開にしました（試行リクエストを送信）: host={self.host}")
+        
+        if self.state == CIRCUIT_HALF_OPEN:
+            # 試行リクエストが結果を記録せずに終わった（キャンセルされた）場合に備え、一定時間で次の試行を許可する
+            now = time.monotonic()
+            if not self._probe_in_flight or now - self._probe_started_at >= self.reset_timeout:
+                self._probe_in_flight = True
+                self._probe_started_at = now
+                return
+        
+        self.rejected += 1
+        raise CircuitOpenError(self.host, max(self.reset_timeout - elapsed, 0.0))
+    
+    def record_success(self):
+        """リクエストの成功（サーバーが応答した）を記録"""
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(f"サーキットを閉じました（復旧）: host={self.host}")
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        """リクエストの失敗（5xx・タイムアウト・接続エラー）を記録"""
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == CIRCUIT_HALF_OPEN or (self.state == CIRCUIT_CLOSED and self.failures >= self.failure_threshold):
+            self.state = CIRCUIT_OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning(f"サーキットを開きました（{self.reset_timeout:.0f}秒間リクエストを停止）: host={self.host}, failures={self.failures}")
+    
+    def stats(self) -> Dict:
+        """サーキットの状態と統計情報を取得"""
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(url: str) -> CircuitBreaker:
+    """URLのホストに対応する共有のサーキットブレーカーを取得"""
+    host = urlparse(url).netloc or url
+    breaker = _breakers.get(host)
+    if breaker is None:
+        config = get_http_config()
+        breaker = CircuitBreaker(host, config['circuit_failure_threshold'], config['circuit_reset_timeout'])
+        _breakers[host] = breaker
+    return breaker
+
+
+def get_circuit_stats() -> Dict[str, Dict]:
+    """全ホストのサーキットの状態を取得"""
+    return {host: breaker.stats() for host, breaker in _breakers.items()}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""取得済みのStar Ratingから学習するMOD補正モデルモジュール"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+from core.cache import TieredCache
+from core.config import get_cache_config
+from core.logger import get_logger
+from core.mods import MOD_BITS, difficulty_bitmask
+
+logger = get_logger("star_rating_model")
+
+# 学習データがないMODの組み合わせに使う倍率（実際の譜面での平均的な変化に基づく近似値）
+DEFAULT_MULTIPLIERS = {
+    'EZ': 0.85,  # Easy
+    'HR': 1.1,   # Hard Rock
+    'DT': 1.4,   # Double Time（NCはDTとして扱う）
+    'HT': 0.75   # Half Time
+}
+
+Curve = Tuple[float, float, int]  # (切片, 傾き, サンプル数)
+
+
+def default_multiplier(mod_bitmask: int) -> float:
+    """学習データがない場合のMOD倍率"""
+    multiplier = 1.0
+    if mod_bitmask & MOD_BITS['EZ']:
+        multiplier *= DEFAULT_MULTIPLIERS['EZ']
+    elif mod_bitmask & MOD_BITS['HR']:
+        multiplier *= DEFAULT_MULTIPLIERS['HR']
+    if mod_bitmask & MOD_BITS['DT']:
+        multiplier *= DEFAULT_MULTIPLIERS['DT']
+    elif mod_bitmask & MOD_BITS['HT']:
+        multiplier *= DEFAULT_MULTIPLIERS['HT']
+    return multiplier
+
+
+def fit_curves(mod_bitmasks: np.ndarray, base: np.ndarray, modded: np.ndarray, min_samples: int) -> Dict[int, Curve]:
+    """MODの組み合わせごとに log(MOD適用後SR) = 切片 + 傾き * log(基本SR) を最小二乗法で当てはめる
+    
+    全組み合わせの集計を bincount でまとめて行う。基本SRのばらつきが小さく傾きが
+    決まらない組み合わせは、傾き1（一定倍率）として当てはめる。
+    """
+    valid = (base > 0) & (modded > 0)
+    masks, inverse = np.unique(mod_bitmasks[valid], return_inverse=True)
+    x = np.log(base[valid])
+    y = np.log(modded[valid])
+    
+    n = np.bincount(inverse).astype('f8')
+    sum_x = np.bincount(inverse, x)
+    sum_y = np.bincount(inverse, y)
+    sum_xx = np.bincount(inverse, x * x)
+    sum_xy = np.bincount(inverse, x * y)
+    
+    denominator = n * sum_xx - sum_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / denominator
+    # 傾きが決まらない・不自然な場合は一定倍率
+    fixed_ratio = ~np.isfinite(slope) | (np.abs(denominator) < 1e-6 * n * n) | (slope < 0.5) | (slope > 2.0)
+    slope = np.where(fixed_ratio, 1.0, slope)
+    intercept = (sum_y - slope * sum_x) / n
+    
+    return {
+        int(mask): (float(intercept[i]), float(slope[i]), int(n[i]))
+        for i, mask in enumerate(masks)
+        if n[i] >= min_samples
+    }
+
+
+class StarRatingModel:
+    """APIで取得した (基本SR, MOD適用後SR) の組からMODごとの補正曲線を学習するモデル
+    
+    APIやローカル計算が使えない場合のフォールバックに使う。学習結果はJSONに保存し、
+    一定数のサンプルが増えるか一定時間が経つとバックグラウンドで再学習する。
+    """
+    
+    MIN_SAMPLES = 5         # 補正曲線を使うのに必要なサンプル数
+    REFIT_SAMPLES = 200     # この件数のサンプルが増えたら再学習
+    REFIT_INTERVAL = 3600.0  # 前回の学習からこの秒数が経ったら再学習
+    
+    def __init__(self, path: str, samples: TieredCache):
+        self.path = path
+        self.samples = samples
+        self.curves: Dict[int, Curve] = {}
+        self.fitted_at = 0.0
+        self._new_samples = 0
+        self._refit_task: Optional[asyncio.Task] = None
+        self._load()
+    
+    def _load(self):
+        """保存済みの補正曲線を読み込み"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.curves = {int(mask): tuple(curve) for mask, curve in data.get('curves', {}).items()}
+            self.fitted_at = data.get('fitted_at', 0.0)
+        except Exception as e:
+            logger.warning(f"Star Rating補正モデルの読み込みに失敗: path={self.path}, error={e}")
+    
+    def _save(self):
+        """補正曲線を保存（一時ファイルに書いてから置き換える）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fitted_at': self.fitted_at, 'curves': {str(mask): curve for mask, curve in self.curves.items()}}, f)
+        os.replace(tmp_path, self.path)
+    
+    def predict(self, base_star_rating: float, mod_bitmask: int) -> float:
+        """MOD適用後のStar Ratingを推定"""
+        mod_bitmask = difficulty_bitmask(mod_bitmask)
+        if base_star_rating <= 0 or not mod_bitmask:
+            return base_star_rating
+        
+        curve = self.curves.get(mod_bitmask)
+        if curve is not None:
+            intercept, slope, _ = curve
+            return math.exp(intercept) * base_star_rating ** slope
+        return base_star_rating * default_multiplier(mod_bitmask)
+    
+    async def record(self, beatmap_id: int, mod_bitmask: int, base_star_rating: float, modded_star_rating: float):
+        """APIで取得したStar Ratingを学習用サンプルとして保存"""
+        mod_bitmask = difficulty_bitmask(mod_bitmask)
+        if not mod_bitmask or base_star_rating <= 0 or modded_star_rating <= 0:
+            return
+        await self.samples.set(f"{beatmap_id}:{mod_bitmask}", [mod_bitmask, base_star_rating, modded_star_rating])
+        self._new_samples += 1
+        self._maybe_refit()
+    
+    def _maybe_refit(self):
+        """サンプルが十分に増えたか前回から時間が経っていれば再学習を開始"""
+        if self._refit_task is not None and not self._refit_task.done():
+            return
+        if self._new_samples < self.REFIT_SAMPLES and time.time() - self.fitted_at < self.REFIT_INTERVAL:
+            return
+        self._new_samples = 0
+        self._refit_task = asyncio.ensure_future(self.refit())
+    
+    def _fit(self) -> Dict[int, Curve]:
+        rows = self.samples.read_all()
+        if not rows:
+            return {}
+        data = np.array([value for _, value in rows], dtype='f8')
+        return fit_curves(data[:, 0].astype(np.int64), data[:, 1], data[:, 2], self.MIN_SAMPLES)
+    
+    async def refit(self):
+        """保存済みの全サンプルから補正曲線を学習し直す"""
+        started_at = time.perf_counter()
+        try:
+            curves = await asyncio.to_thread(self._fit)
+            self.curves = curves
+            self.fitted_at = time.time()
+            await asyncio.to_thread(self._save)
+            logger.info(
+                f"Star Rating補正モデルを更新しました: combinations={len(curves)}, "
+                f"samples={sum(curve[2] for curve in curves.values())}, elapsed={time.perf_counter() - started_at:.3f}s"
+            )
+        except Exception as e:
+            logger.warning(f"Star Rating補正モデルの更新に失敗: error={e}")
+
+
+_star_rating_model: Optional[StarRatingModel] = None
+
+
+def get_star_rating_model() -> StarRatingModel:
+    """Star Rating補正モデル（{cache_dir}/star_rating_model.json）を取得"""
+    global _star_rating_model
+    if _star_rating_model is None:
+        config = get_cache_config()
+        samples = TieredCache(
+            'star_rating_samples',
+            os.path.join(config['cache_dir'], 'cache.sqlite3'),
+            ttl=config['attributes_ttl'],
+            max_entries=config['attributes_max_entries'],
+            memory_entries=config['attributes_memory_entries']
+        )
+        _star_rating_model = StarRatingModel(os.path.join(config['cache_dir'], 'star_rating_model.json'), samples)
+    return _star_rating_model
@@ -2,35 +2,96 @@
 # -*- coding: utf-8 -*-
 """Twitch API v2 クライアントモジュール"""
 
-import requests
-from typing import Optional, Dict, List
+import asyncio
+import time
+import aiohttp
+from typing import Optional, Dict, List, Mapping, Set, Tuple
+from core.http import get_session
+from core.http_cache import ConditionalCache, get_response_cache
+from core.json_decode import Fields, decode
+from core.logger import get_logger
+from core.resilience import CircuitOpenError, RetryPolicy, get_circuit_breaker, is_retryable_status, parse_retry_after
+
+logger = get_logger("twitch_api")
+
+# エンドポイントごとに残すフィールド
+USER_FIELDS: Fields = {'data': {'id': None, 'login': None}}
+STREAM_FIELDS: Fields = {
+    'data': {
+        'id': None,
+        'user_id': None,
+        'user_login': None,
+        'user_name': None,
+        'game_name': None,
+        'type': None,
+        'title': None,
+        'viewer_count': None,
+        'started_at': None,
+        'thumbnail_url': None
+    }
+}
+
+
+def _seconds_until_reset(headers: Mapping[str, str]) -> Optional[float]:
+    """Twitchのレート制限ヘッダー（Ratelimit-Reset: UNIX時間）からリセットまでの秒数を取得"""
+    reset = headers.get('Ratelimit-Reset')
+    if not reset or not reset.isdigit():
+        return None
+    return max(int(reset) - time.time(), 0.0)
 
 
 class TwitchAPIClient:
-    """Twitch API v2 クライアント"""
+    """Twitch API v2 クライアント（asyncio版）
+    
+    イベントループをブロックしないようにaiohttpで通信する。
+    セッションを渡さない場合は共有のkeep-aliveプール（"twitch"）を使用する。
+    """
     
     TOKEN_URL = "https://id.twitch.tv/oauth2/token"
     BASE_URL = "https://api.twitch.tv/helix"
+    STREAMS_BATCH_SIZE = 100  # 配信状況APIで1回に指定できるユーザーIDの最大数
+    EVENTSUB_SUBSCRIPTIONS_URL = f"{BASE_URL}/eventsub/subscriptions"
     
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        response_cache: Optional[ConditionalCache] = None,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
         self.client_id = client_id
         self.client_secret = client_secret
-        self.access_token = None
-        self._authenticate()
+        self.access_token: Optional[str] = None
+        # ETag / Last-Modified で再検証するGETレスポンスのキャッシュ
+        self.response_cache = response_cache or get_response_cache('twitch')
+        # 5xx・429・タイムアウト時のリトライ方針（サーキットブレーカーはホストごとに共有）
+        self.retry_policy = retry_policy or RetryPolicy.from_config()
+        self._session = session
+        self._auth_lock = asyncio.Lock()
     
-    def _authenticate(self):
-        """APIアクセストークンの取得"""
-        params = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials"
-        }
-        
-        response = requests.post(self.TOKEN_URL, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        self.access_token = data["access_token"]
+    def _get_session(self) -> aiohttp.ClientSession:
+        """HTTPセッションの取得"""
+        if self._session is None or self._session.closed:
+            return get_session('twitch')
+        return self._session
+    
+    async def _authenticate(self, stale_token: Optional[str] = None):
+        """APIアクセストークンの取得（同時に必要になった場合は1回だけ取得する）"""
+        async with self._auth_lock:
+            # 待っている間に他のリクエストが取得を終えていればそれを使う
+            if self.access_token is not None and self.access_token != stale_token:
+                return
+            
+            params = {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials"
+            }
+            async with self._get_session().post(self.TOKEN_URL, params=params) as response:
+                response.raise_for_status()
+                data = decode(await response.read())
+            self.access_token = data["access_token"]
     
     def _get_headers(self) -> Dict[str, str]:
         """認証ヘッダーの取得"""
@@ -39,15 +100,83 @@ class TwitchAPIClient:
             "Authorization": f"Bearer {self.access_token}"
         }
     
-    def get_user_ids(self, usernames: List[str]) -> Dict[str, str]:
+    async def _request(self, url: str, params: Dict, fields: Fields, conditional: bool = False) -> Dict:
+        """GETリクエストを送信してJSONを返す
+        
+        401の場合はトークンを再取得して1回だけ、5xx・429・タイムアウトの場合は
+        バックオフしながら回数上限までリトライする。conditional の場合は保存済みの検証子で
+        条件付きリクエストを送り、304 Not Modified なら保存済みの本文を返す。
+        """
+        if self.access_token is None:
+            await self._authenticate()
+        
+        breaker = get_circuit_breaker(url)
+        cache_key = self.response_cache.key(url, params) if conditional else None
+        cached = self.response_cache.lookup(cache_key) if conditional else None
+        reauthenticated = False
+        attempt = 0
+        delay = 0.0
+        retry_delay = 0.0
+        
+        while True:
+            # バックオフはレスポンスを閉じてから待つ（待っている間プールのコネクションを占有しない）
+            if retry_delay > 0:
+                await asyncio.sleep(retry_delay)
+                retry_delay = 0.0
+            
+            # サーバーが落ちている間はリクエストを送らずに即座に失敗する
+            breaker.before_request()
+            token = self.access_token
+            headers = self._get_headers()
+            if cached is not None:
+                headers.update(cached.conditional_headers())
+            
+            attempt += 1
+            try:
+                async with self._get_session().get(url, headers=headers, params=params) as response:
+                    if response.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    
+                    # トークンが失効していた場合は再取得して1回だけリトライ
+                    if response.status == 401 and not reauthenticated:
+                        reauthenticated = True
+                        await self._authenticate(stale_token=token)
+                        logger.info("Twitchアクセストークンを再取得しました")
+                        continue
+                    
+                    if is_retryable_status(response.status) and attempt < self.retry_policy.attempts:
+                        delay = self.retry_policy.backoff(delay)
+                        if response.status == 429:
+                            # Retry-After（なければ Ratelimit-Reset）まで待つ
+                            delay = parse_retry_after(response.headers) or _seconds_until_reset(response.headers) or delay
+                        delay = min(delay, self.retry_policy.max_delay)
+                        logger.warning(f"Twitch APIエラーのためリトライします: status={response.status}, url={url}, attempt={attempt}, delay={delay:.2f}s")
+                        retry_delay = delay
+                        continue
+                    
+                    if cached is not None and response.status == 304:
+                        return self.response_cache.not_modified(cached)
+                    
+                    response.raise_for_status()
+                    data = decode(await response.read(), fields)
+                    if conditional:
+                        self.response_cache.store(cache_key, response.headers, data)
+                    return data
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                breaker.record_failure()
+                if attempt >= self.retry_policy.attempts:
+                    raise
+                delay = self.retry_policy.backoff(delay)
+                logger.warning(f"Twitch API通信エラーのためリトライします: url={url}, attempt={attempt}, delay={delay:.2f}s, error={e!r}")
+                retry_delay = delay
+    
+    async def get_user_ids(self, usernames: List[str]) -> Dict[str, str]:
         """ユーザー名からユーザーIDを取得"""
         url = f"{self.BASE_URL}/users"
-        headers = self._get_headers()
-        params = {"login": usernames}
-        
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
+        # 前回のレスポンスの検証子があれば条件付きリクエストにする
+        data = await self._request(url, {"login": usernames}, USER_FIELDS, conditional=True)
         
         user_ids = {}
         for user in data.get("data", []):
@@ -55,30 +184,86 @@ class TwitchAPIClient:
         
         return user_ids
     
-    def get_streams(self, user_ids: List[str]) -> List[Dict]:
-        """配信状況を取得"""
+    async def get_streams(self, user_ids: List[str]) -> List[Dict]:
+        """配信状況を取得（失敗したバッチの分は含まれない）"""
+        streams, _ = await self.get_streams_with_failures(user_ids)
+        return streams
+    
+    async def get_streams_with_failures(self, user_ids: List[str]) -> Tuple[List[Dict], Set[str]]:
+        """配信状況を取得（100人ずつのリクエストを並行して送信）
+        
+        リトライしても失敗したバッチは飛ばし、そのバッチのユーザーIDを2つ目の戻り値で返す
+        （呼び出し側は「配信していない」と区別できる）。
+        """
         if not user_ids:
-            return []
+            return [], set()
         
         url = f"{self.BASE_URL}/streams"
-        headers = self._get_headers()
+        batches = [
+            user_ids[i:i + self.STREAMS_BATCH_SIZE]
+            for i in range(0, len(user_ids), self.STREAMS_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *(self._request(url, {"user_id": batch}, STREAM_FIELDS) for batch in batches),
+            return_exceptions=True
+        )
         
-        # Twitch APIは最大100ユーザーIDまで一度に取得可能
-        # 100を超える場合は分割してリクエスト
         all_streams = []
-        for i in range(0, len(user_ids), 100):
-            batch = user_ids[i:i+100]
-            params = {"user_id": batch}
-            
-            try:
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                data = response.json()
-                all_streams.extend(data.get("data", []))
-            except Exception as e:
-                # エラー時は次のバッチに進む
-                print(f"[ERROR] Twitch配信取得エラー (batch {i//100 + 1}): {e}")
+        failed_ids: Set[str] = set()
+        for index, (batch, result) in enumerate(zip(batches, results)):
+            if isinstance(result, CircuitOpenError):
+                # Twitchが落ちている間は結果を使わない
+                raise result
+            if isinstance(result, BaseException):
+                logger.error(f"Twitch配信取得エラー (batch {index + 1}): {result}")
+                failed_ids.update(batch)
                 continue
+            all_streams.extend(result.get("data", []))
         
-        return all_streams
-
+        return all_streams, failed_ids
+    
+    async def create_eventsub_subscription(
+        self,
+        subscription_type: str,
+        condition: Dict[str, str],
+        session_id: str,
+        user_token: str,
+        url: Optional[str] = None
+    ) -> Optional[Dict]:
+        """EventSubのWebSocketセッションにサブスクリプションを作成（既に存在する場合はNone）
+        
+        WebSocketトランスポートの購読にはアプリトークンではなくユーザーアクセストークンが必要。
+        """
+        url = url or self.EVENTSUB_SUBSCRIPTIONS_URL
+        breaker = get_circuit_breaker(url)
+        breaker.before_request()
+        
+        payload = {
+            "type": subscription_type,
+            "version": "1",
+            "condition": condition,
+            "transport": {"method": "websocket", "session_id": session_id}
+        }
+        headers = {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {user_token}",
+            "Content-Type": "application/json"
+        }
+        try:
+            async with self._get_session().post(url, headers=headers, json=payload) as response:
+                if response.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                
+                # 409: 同じサブスクリプションが既に存在する
+                if response.status == 409:
+                    return None
+                response.raise_for_status()
+                data = decode(await response.read())
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            breaker.record_failure()
+            raise
+        
+        subscriptions = data.get("data", [])
+        return subscriptions[0] if subscriptions else None
@@ -2,8 +2,12 @@
 # -*- coding: utf-8 -*-
 """ユーティリティ関数モジュール"""
 
-from typing import List, Dict
+from typing import Dict, List, Optional
+from core.difficulty import get_local_star_rating
+from core.models import Score
+from core.mods import difficulty_bitmask, mods_to_bitmask
 from core.osu_api import OsuAPIClient
+from core.star_rating_model import get_star_rating_model
 
 
 def format_mods(mods: List[str]) -> str:
@@ -14,72 +18,72 @@ def format_mods(mods: List[str]) -> str:
 
 
 def calculate_modded_star_rating(base_star_rating: float, mods: List[str]) -> float:
-    """MOD適用後のStar Ratingを計算（フォールバック用）"""
-    if not mods or base_star_rating == 0:
-        return base_star_rating
-    
-    modded_sr = base_star_rating
-    
-    # MODの倍率（osu!標準の計算式に基づく近似値）
-    mod_multipliers = {
-        'HR': 1.08,   # Hard Rock
-        'DT': 1.12,   # Double Time
-        'NC': 1.12,   # Nightcore (DTと同じ)
-        'EZ': 0.5,    # Easy
-        'HT': 0.3,    # Half Time
-    }
-    
-    # MODの組み合わせ処理
-    has_dt = 'DT' in mods or 'NC' in mods
-    has_ht = 'HT' in mods
-    has_ez = 'EZ' in mods
-    has_hr = 'HR' in mods
+    """MOD適用後のStar Ratingを推定（フォールバック用、取得済みのデータから学習した補正を使用）"""
+    return get_star_rating_model().predict(base_star_rating, mods_to_bitmask(mods))
+
+
+def _attributes_star_rating(attributes: Optional[Dict]) -> float:
+    """譜面属性APIのレスポンスからStar Ratingを取り出す（ない場合は0）"""
+    if attributes and 'attributes' in attributes:
+        return attributes['attributes'].get('star_rating', 0) or 0
+    return 0
+
+
+async def lookup_modded_star_rating(score: Score, client: OsuAPIClient, mode: str = 'osu') -> Optional[float]:
+    """MOD適用後のStar Ratingを取得（キャッシュ → APIの順、譜面属性がない場合はNone、APIエラーは例外を送出）"""
+    beatmap = score.beatmap
+    mods_list = score.mod_names
+    if not beatmap.id:
+        return None
     
-    # EZとHTは同時に適用できない（通常はEZが優先）
-    if has_ez:
-        modded_sr *= 0.5
-    elif has_ht:
-        modded_sr *= 0.3
+    # 難易度に影響するMODがなければ譜面のStar Ratingそのまま（コンバート譜面はモードごとに異なるためosu!のみ）
+    if mode == 'osu' and difficulty_bitmask(score.mods) == 0 and beatmap.star_rating > 0:
+        return beatmap.star_rating
     
-    # DT/NCはHTと同時に適用できない（DT/NCが優先）
-    if has_dt and not has_ht:
-        modded_sr *= 1.12
+    # 取得済みの譜面属性があればAPIを呼ばない
+    attributes = await client.get_cached_beatmap_attributes(beatmap.id, mods_list, ruleset=mode)
+    star_rating = _attributes_star_rating(attributes)
+    if star_rating:
+        return star_rating
     
-    # HRは他のMODと組み合わせ可能
-    if has_hr:
-        modded_sr *= 1.08
+    # APIからMOD適用後の属性を取得
+    attributes = await client.get_beatmap_attributes(beatmap.id, mods_list, ruleset=mode)
+    star_rating = _attributes_star_rating(attributes)
+    if star_rating:
+        # フォールバック用の補正モデルの学習データとして保存（基本SRと同じモードの値のみ）
+        if mode == 'osu':
+            await get_star_rating_model().record(beatmap.id, score.mods, beatmap.star_rating, star_rating)
+        return star_rating
+    return None
+
+
+async def estimate_modded_star_rating(score: Score, mode: str = 'osu', client: Optional[OsuAPIClient] = None) -> float:
+    """APIで取得できない場合のMOD適用後のStar Rating（.osu ファイルから計算、できなければ補正モデルによる近似）
     
-    return modded_sr
+    ローカル計算はスタックとFlashlightを扱わずAPIの値と一致しないことがあるため、フォールバックにだけ使う。
+    client を渡した場合は保存されていない .osu ファイルを取得する（OSU_FILE_DOWNLOAD が有効な場合）。
+    """
+    if mode == 'osu' and score.beatmap.id:
+        star_rating = await get_local_star_rating(score.beatmap.id, score.mods, client)
+        if star_rating:
+            return star_rating
+    return calculate_modded_star_rating(score.beatmap.star_rating, score.mod_names)
 
 
-def get_modded_star_rating_from_api(score: Dict, client: OsuAPIClient) -> float:
-    """APIからMOD適用後のStar Ratingを取得"""
+async def get_modded_star_rating_from_api(score: Score, client: OsuAPIClient, mode: str = 'osu') -> float:
+    """MOD適用後のStar Ratingを取得（取得できない場合はローカル計算・補正モデルによる近似）"""
     try:
-        beatmap = score.get('beatmap', {})
-        beatmap_id = beatmap.get('id')
-        mods_list = score.get('mods', [])
-        
-        if not beatmap_id:
-            # フォールバック: 計算による取得
-            base_sr = beatmap.get('difficulty_rating', 0)
-            return calculate_modded_star_rating(base_sr, mods_list)
-        
-        # APIからMOD適用後の属性を取得
-        attributes = client.get_beatmap_attributes(beatmap_id, mods_list)
-        
-        if attributes and 'attributes' in attributes:
-            star_rating = attributes['attributes'].get('star_rating', 0)
-            if star_rating > 0:
-                return star_rating
-        
-        # フォールバック: 計算による取得
-        base_sr = beatmap.get('difficulty_rating', 0)
-        return calculate_modded_star_rating(base_sr, mods_list)
-        
+        star_rating = await lookup_modded_star_rating(score, client, mode)
+        if star_rating:
+            return star_rating
     except Exception as e:
-        # エラー時は計算による取得にフォールバック
-        beatmap = score.get('beatmap', {})
-        base_sr = beatmap.get('difficulty_rating', 0)
-        mods_list = score.get('mods', [])
-        return calculate_modded_star_rating(base_sr, mods_list)
+        # エラー時はローカル計算・近似にフォールバック
+        pass
+    return await estimate_modded_star_rating(score, mode, client)
+
 
+def get_display_star_rating(score: Score) -> float:
+    """表示用のStar Rating（API取得値がなければ計算値）"""
+    if score.modded_star_rating:
+        return score.modded_star_rating
+    return calculate_modded_star_rating(score.beatmap.star_rating, score.mod_names)
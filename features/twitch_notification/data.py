@@ -2,61 +2,175 @@
 # -*- coding: utf-8 -*-
 """Twitch配信通知 データ取得・処理モジュール"""
 
-from typing import Dict, List, Set
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from core.resilience import CircuitOpenError
 from core.twitch_api import TwitchAPIClient
 from core.logger import get_logger
 
 logger = get_logger("twitch_notification")
 
+STREAM_LOOKUP_ATTEMPTS = 3  # 配信開始直後は配信状況APIに反映されていないことがあるため取り直す回数
+STREAM_LOOKUP_DELAY = 2.0
+ANNOUNCED_STREAM_IDS = 1000  # 通知済みとして覚えておく配信IDの数
+
+# 配信の識別子（配信ID, 開始時刻）
+StreamKey = Tuple[str, str]
+
+
+def _started_before(stream: Dict, timestamp: float) -> bool:
+    """配信の開始時刻（RFC3339）が timestamp より前か（不明な場合はFalse）"""
+    started_at = stream.get('started_at')
+    if not started_at:
+        return False
+    try:
+        return datetime.fromisoformat(started_at.replace('Z', '+00:00')).timestamp() < timestamp
+    except ValueError:
+        return False
+
 
 class TwitchStreamMonitor:
-    """Twitch配信監視クラス"""
+    """Twitch配信監視クラス
+    
+    配信者ごとに現在の配信（配信ID, 開始時刻）を保持し、変化があった配信者だけを更新する。
+    取得に失敗したバッチの配信者は前回の状態のまま残し、通知は未通知の配信IDに対してだけ行う。
+    """
     
     def __init__(self, client: TwitchAPIClient):
         self.client = client
         self.user_ids: Dict[str, str] = {}  # ユーザー名 -> ユーザーIDマッピング
-        self.currently_live: Set[str] = set()  # 現在配信中のユーザー名
+        self.live_streams: Dict[str, StreamKey] = {}  # ユーザーID -> 現在の配信
+        self.announced: "OrderedDict[str, None]" = OrderedDict()  # 通知済みの配信ID（古い順）
+        self.dirty = False  # 保存後に状態が変わったか
+        self.failed_ids: Set[str] = set()  # 直近のチェックで配信状況を取得できなかったユーザーID
+        # 保存済みの配信状態がない場合、この時刻（UNIX時間）より前に始まった配信は通知せずに通知済みとして記録する
+        self.seed_before: Optional[float] = None
     
-    def initialize_user_ids(self, usernames: List[str]) -> bool:
+    async def initialize_user_ids(self, usernames: List[str]) -> bool:
         """ユーザーIDを初期化"""
         try:
-            self.user_ids = self.client.get_user_ids(usernames)
+            self.user_ids = await self.client.get_user_ids(usernames)
             logger.info(f"ユーザーID取得完了: {len(self.user_ids)}人")
             return len(self.user_ids) > 0
         except Exception as e:
             logger.error(f"ユーザーID取得エラー: {e}", exc_info=True)
             return False
     
-    def check_streams(self) -> List[Dict]:
-        """配信状況をチェックして新規配信を返す"""
+    def restore(self, live_streams: Dict[str, StreamKey], announced: Iterable[str]):
+        """保存済みの配信状態を復元（監視対象から外れた配信者の状態は捨てる）"""
+        watched = set(self.user_ids.values())
+        self.live_streams = {user_id: key for user_id, key in live_streams.items() if user_id in watched}
+        self.announced = OrderedDict((stream_id, None) for stream_id in announced)
+        while len(self.announced) > ANNOUNCED_STREAM_IDS:
+            self.announced.popitem(last=False)
+        self.dirty = False
+    
+    async def check_streams(self, user_ids: Optional[List[str]] = None) -> List[Dict]:
+        """配信状況をチェックして新規配信を返す（user_ids を指定した場合はその配信者だけ）"""
         if not self.user_ids:
             return []
         
+        if user_ids is None:
+            user_ids = list(self.user_ids.values())
         try:
-            streams = self.client.get_streams(list(self.user_ids.values()))
-            current_live = set()
-            new_streams = []
-            
-            for stream in streams:
-                username = stream['user_login']
-                current_live.add(username)
-                
-                # 新規配信開始の場合
-                if username not in self.currently_live:
-                    new_streams.append(stream)
-            
-            # 配信終了したユーザーをセットから削除
-            self.currently_live = current_live
-            
-            return new_streams
+            streams, failed_ids = await self.client.get_streams_with_failures(user_ids)
+        except CircuitOpenError as e:
+            logger.warning(f"Twitch APIが停止中のため配信状況チェックをスキップ: {e}")
+            self.failed_ids = set(user_ids)
+            return []
         except Exception as e:
+            # 401はクライアント側でトークンを再取得してリトライ済み
             logger.error(f"配信状況チェックエラー: {e}", exc_info=True)
-            # トークンが無効な場合は再認証
-            if "401" in str(e) or "Unauthorized" in str(e):
-                try:
-                    self.client._authenticate()
-                    logger.info("Twitchアクセストークンを再取得しました")
-                except Exception as auth_error:
-                    logger.error(f"Twitchアクセストークンの再取得に失敗: {auth_error}")
+            self.failed_ids = set(user_ids)
             return []
-
+        self.failed_ids = failed_ids
+        
+        new_streams = []
+        seeded = 0
+        live_ids = set()
+        for stream in streams:
+            user_id = stream['user_id']
+            live_ids.add(user_id)
+            key = (stream['id'], stream['started_at'])
+            if self.live_streams.get(user_id) == key:
+                continue
+            
+            # 配信が始まった（または配信が切り替わった）配信者だけ更新する
+            self.live_streams[user_id] = key
+            self.dirty = True
+            if self._mark_announced(stream['id']):
+                if self.seed_before is not None and _started_before(stream, self.seed_before):
+                    # 再デプロイ前のプロセスが通知済みの可能性が高い
+                    seeded += 1
+                    continue
+                new_streams.append(stream)
+        
+        # 配信終了: 今回確認して返ってこなかった配信者（取得に失敗したバッチの配信者は前回の状態を保つ）
+        checked = set(user_ids)
+        ended = [
+            user_id for user_id in self.live_streams
+            if user_id in checked and user_id not in live_ids and user_id not in failed_ids
+        ]
+        for user_id in ended:
+            del self.live_streams[user_id]
+            self.dirty = True
+        
+        if failed_ids:
+            logger.warning(f"配信状況を取得できなかった配信者は前回の状態を保持します: {len(failed_ids)}人")
+        if self.seed_before is not None:
+            if seeded:
+                logger.info(f"起動前に始まった配信を通知せずに記録しました: {seeded}件")
+            # 全員の状態を取得できたら以降は通常どおり通知する
+            if not failed_ids and checked.issuperset(self.user_ids.values()):
+                self.seed_before = None
+        return new_streams
+    
+    def _mark_announced(self, stream_id: str) -> bool:
+        """配信IDを通知済みにする（既に通知済みならFalse）"""
+        if stream_id in self.announced:
+            self.announced.move_to_end(stream_id)
+            return False
+        self.announced[stream_id] = None
+        self.dirty = True
+        while len(self.announced) > ANNOUNCED_STREAM_IDS:
+            self.announced.popitem(last=False)
+        return True
+    
+    async def handle_stream_online(self, event: Dict) -> Optional[Dict]:
+        """EventSubの stream.online イベントから新規配信を返す（通知済みならNone）"""
+        user_id = event['broadcaster_user_id']
+        username = event['broadcaster_user_login']
+        self.live_streams[user_id] = (event['id'], event.get('started_at', ''))
+        self.dirty = True
+        if not self._mark_announced(event['id']):
+            return None
+        
+        # 通知に使うタイトル・ゲーム名などはイベントに含まれないため配信状況APIから取得する
+        for attempt in range(STREAM_LOOKUP_ATTEMPTS):
+            try:
+                streams = await self.client.get_streams([user_id])
+                if streams:
+                    stream = streams[0]
+                    self.live_streams[user_id] = (stream['id'], stream['started_at'])
+                    return stream
+            except Exception as e:
+                logger.warning(f"配信情報の取得に失敗（イベントの内容で通知）: {username}, error={e}")
+                break
+            if attempt < STREAM_LOOKUP_ATTEMPTS - 1:
+                await asyncio.sleep(STREAM_LOOKUP_DELAY)
+        
+        return {
+            'id': event['id'],
+            'user_id': user_id,
+            'user_login': username,
+            'user_name': event.get('broadcaster_user_name') or username,
+            'type': event.get('type', 'live'),
+            'started_at': event.get('started_at')
+        }
+    
+    def handle_stream_offline(self, event: Dict):
+        """EventSubの stream.offline イベントで配信終了を反映"""
+        if self.live_streams.pop(event['broadcaster_user_id'], None) is not None:
+            self.dirty = True
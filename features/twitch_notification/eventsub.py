@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Twitch配信通知 EventSub（WebSocket）トランスポートモジュール"""
+
+import asyncio
+import aiohttp
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from core.http import get_session
+from core.json_decode import loads
+from core.logger import get_logger
+from core.resilience import RetryPolicy
+from core.twitch_api import TwitchAPIClient
+
+logger = get_logger("twitch_notification")
+
+EventHandler = Callable[[Dict], Awaitable[None]]
+
+
+class KeepaliveTimeout(Exception):
+    """keepalive間隔を過ぎても何も届かなかったことを表す例外"""
+
+
+class EventSubAuthError(Exception):
+    """ユーザーアクセストークンが無効・期限切れで購読できなかったことを表す例外"""
+
+
+class EventSubTransport:
+    """Twitch EventSub（WebSocket）で配信開始・終了を受け取るトランスポート
+    
+    - session_welcome を受け取ったら監視対象の stream.online / stream.offline を購読する
+    - keepalive 間隔を過ぎても何も届かなければ接続が切れたとみなして再接続する
+    - session_reconnect では指定されたURLに接続し直す（サブスクリプションは引き継がれる）
+    - Twitchは切断中のイベントを再送しないため、新しいセッションで購読した後は on_resync を呼び、
+      ポーリングで取りこぼしを確認する。同じメッセージIDの重複通知は無視する
+    - ユーザーアクセストークンが無効（購読が401）になったら再接続せずに停止する（ポーリングで監視を続ける）
+    """
+    
+    WS_URL = "wss://eventsub.wss.twitch.tv/ws"
+    MAX_SUBSCRIPTIONS = 300  # 1つのWebSocketセッションで作成できるサブスクリプション数の上限
+    SUBSCRIBE_CONCURRENCY = 10  # 購読リクエストの同時実行数（welcomeから10秒以内に購読する必要がある）
+    WELCOME_TIMEOUT = 10.0  # 接続してから session_welcome を待つ秒数
+    KEEPALIVE_GRACE = 5.0  # keepalive間隔に加えて待つ秒数
+    SEEN_MESSAGE_IDS = 1000  # 重複判定のために覚えておくメッセージIDの数
+    RECONNECT_MAX_DELAY = 300.0  # 再接続までの待ち時間の上限
+    
+    def __init__(
+        self,
+        client: TwitchAPIClient,
+        user_token: str,
+        broadcaster_ids: List[str],
+        on_online: EventHandler,
+        on_offline: EventHandler,
+        on_resync: Callable[[], Awaitable[None]],
+        ws_url: Optional[str] = None,
+        subscriptions_url: Optional[str] = None
+    ):
+        self.client = client
+        self.user_token = user_token
+        self.broadcaster_ids = list(broadcaster_ids)
+        self.on_online = on_online
+        self.on_offline = on_offline
+        self.on_resync = on_resync
+        self.ws_url = ws_url or self.WS_URL
+        self.subscriptions_url = subscriptions_url
+        self.retry_policy = RetryPolicy(base_delay=1.0, max_delay=self.RECONNECT_MAX_DELAY)
+        
+        self.connected = False
+        self.disabled_reason: Optional[str] = None  # 停止した理由（トークンが無効になった場合など）
+        self.subscribed_ids: Set[str] = set()  # stream.online / stream.offline の両方を購読できた配信者ID
+        self.sessions = 0  # 購読し直した（新しいセッションを張った）回数
+        self.reconnects = 0  # session_reconnect で接続先を移った回数
+        self.notifications = 0
+        self.duplicates = 0
+        self.keepalive_timeouts = 0
+        
+        self._seen_message_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._handlers: Set[asyncio.Task] = set()
+    
+    @property
+    def covers_all(self) -> bool:
+        """接続中で、全ての配信者の購読ができているか（できていなければポーリングを続ける）"""
+        return self.connected and self.subscribed_ids.issuperset(self.broadcaster_ids)
+    
+    def start(self):
+        """受信を開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self):
+        """受信を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.connected = False
+    
+    async def _run(self):
+        """接続・購読・受信を繰り返す（切断されたらバックオフして再接続）"""
+        url = self.ws_url
+        previous_ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        delay = 0.0
+        
+        while True:
+            reconnect_url = None
+            ws: Optional[aiohttp.ClientWebSocketResponse] = None
+            try:
+                ws = await get_session('twitch').ws_connect(url, heartbeat=None)
+                session_id, keepalive = await self._receive_welcome(ws)
+                
+                if previous_ws is not None:
+                    # session_reconnect: サブスクリプションは新しいセッションに引き継がれている
+                    await previous_ws.close()
+                    previous_ws = None
+                    self.reconnects += 1
+                    logger.info(f"EventSubの接続先を切り替えました: session_id={session_id}")
+                else:
+                    await self._subscribe(session_id)
+                    self.sessions += 1
+                    logger.info(f"EventSubに接続しました: session_id={session_id}, subscribed={len(self.subscribed_ids)}/{len(self.broadcaster_ids)}, keepalive={keepalive}s")
+                    # 切断中のイベントは再送されないため、ポーリングで取りこぼしを確認する
+                    self._spawn(self.on_resync())
+                
+                self.connected = True
+                delay = 0.0
+                reconnect_url = await self._listen(ws, keepalive)
+            except asyncio.CancelledError:
+                raise
+            except EventSubAuthError as e:
+                # トークンを更新するまで何度再接続しても購読できない
+                self.disabled_reason = str(e)
+                logger.error(f"TWITCH_USER_ACCESS_TOKEN が無効または期限切れのためEventSubを停止します（ポーリングで監視を続けます）。トークンを再発行して再起動してください: {e}")
+                return
+            except Exception as e:
+                logger.warning(f"EventSubの接続が切れました: url={url}, error={e!r}")
+            finally:
+                if reconnect_url is None:
+                    self.connected = False
+                    if ws is not None:
+                        await ws.close()
+                    if previous_ws is not None:
+                        await previous_ws.close()
+                        previous_ws = None
+            
+            if reconnect_url is not None:
+                # 古い接続は新しい接続でwelcomeを受け取るまで閉じない
+                previous_ws = ws
+                url = reconnect_url
+                continue
+            
+            url = self.ws_url
+            self.subscribed_ids.clear()
+            delay = self.retry_policy.backoff(delay)
+            logger.info(f"EventSubに再接続します: delay={delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    async def _receive_welcome(self, ws: aiohttp.ClientWebSocketResponse) -> Tuple[str, float]:
+        """session_welcome を待ってセッションIDとkeepalive間隔を取得"""
+        message = await self._receive_json(ws, self.WELCOME_TIMEOUT)
+        if message['metadata']['message_type'] != 'session_welcome':
+            raise ConnectionError(f"unexpected first message: {message['metadata']['message_type']}")
+        session = message['payload']['session']
+        return session['id'], float(session.get('keepalive_timeout_seconds') or 10)
+    
+    async def _receive_json(self, ws: aiohttp.ClientWebSocketResponse, timeout: float) -> Dict:
+        """次のテキストメッセージを受け取ってデコード（timeout 秒届かなければ KeepaliveTimeout）"""
+        while True:
+            try:
+                message = await ws.receive(timeout=timeout)
+            except asyncio.TimeoutError:
+                raise KeepaliveTimeout(f"no message for {timeout:.0f}s") from None
+            if message.type == aiohttp.WSMsgType.TEXT:
+                return loads(message.data)
+            if message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                raise ConnectionError(f"websocket closed: code={ws.close_code}")
+    
+    async def _subscribe(self, session_id: str):
+        """監視対象の配信者ごとに stream.online / stream.offline を購読"""
+        self.subscribed_ids.clear()
+        limit = self.MAX_SUBSCRIPTIONS // 2
+        broadcaster_ids = self.broadcaster_ids[:limit]
+        if len(self.broadcaster_ids) > limit:
+            logger.warning(f"EventSubで購読できる配信者数を超えています（残りはポーリングで監視）: {len(self.broadcaster_ids)}人中{limit}人")
+        
+        semaphore = asyncio.Semaphore(self.SUBSCRIBE_CONCURRENCY)
+        unauthorized = []
+        
+        async def subscribe(broadcaster_id: str):
+            async with semaphore:
+                try:
+                    for subscription_type in ('stream.online', 'stream.offline'):
+                        await self.client.create_eventsub_subscription(
+                            subscription_type,
+                            {'broadcaster_user_id': broadcaster_id},
+                            session_id,
+                            self.user_token,
+                            url=self.subscriptions_url
+                        )
+                    self.subscribed_ids.add(broadcaster_id)
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 401:
+                        unauthorized.append(broadcaster_id)
+                        return
+                    logger.warning(f"EventSubの購読に失敗（ポーリングで監視）: broadcaster_id={broadcaster_id}, error={e}")
+                except Exception as e:
+                    logger.warning(f"EventSubの購読に失敗（ポーリングで監視）: broadcaster_id={broadcaster_id}, error={e}")
+        
+        await asyncio.gather(*(subscribe(broadcaster_id) for broadcaster_id in broadcaster_ids))
+        if unauthorized:
+            raise EventSubAuthError(f"subscription request returned 401 for {len(unauthorized)} broadcasters")
+        if not self.subscribed_ids and broadcaster_ids:
+            raise ConnectionError("no EventSub subscriptions could be created")
+    
+    async def _listen(self, ws: aiohttp.ClientWebSocketResponse, keepalive: float) -> str:
+        """メッセージを受信し続ける（session_reconnect を受け取ったら接続先URLを返す）"""
+        while True:
+            try:
+                message = await self._receive_json(ws, keepalive + self.KEEPALIVE_GRACE)
+            except KeepaliveTimeout:
+                self.keepalive_timeouts += 1
+                raise
+            
+            metadata = message.get('metadata', {})
+            message_type = metadata.get('message_type')
+            payload = message.get('payload', {})
+            
+            if message_type == 'session_keepalive':
+                continue
+            if message_type == 'session_reconnect':
+                return payload['session']['reconnect_url']
+            if message_type == 'revocation':
+                subscription = payload.get('subscription', {})
+                logger.warning(f"EventSubの購読が取り消されました: type={subscription.get('type')}, status={subscription.get('status')}, condition={subscription.get('condition')}")
+                self.subscribed_ids.discard(subscription.get('condition', {}).get('broadcaster_user_id'))
+                continue
+            if message_type != 'notification':
+                continue
+            
+            if self._is_duplicate(metadata.get('message_id')):
+                self.duplicates += 1
+                continue
+            self.notifications += 1
+            
+            subscription_type = metadata.get('subscription_type')
+            event = payload.get('event', {})
+            if subscription_type == 'stream.online':
+                self._spawn(self.on_online(event))
+            elif subscription_type == 'stream.offline':
+                self._spawn(self.on_offline(event))
+    
+    def _is_duplicate(self, message_id: Optional[str]) -> bool:
+        """同じメッセージIDを受け取り済みか（Twitchは同じ通知を再送することがある）"""
+        if not message_id:
+            return False
+        if message_id in self._seen_message_ids:
+            return True
+        self._seen_message_ids[message_id] = None
+        while len(self._seen_message_ids) > self.SEEN_MESSAGE_IDS:
+            self._seen_message_ids.popitem(last=False)
+        return False
+    
+    def _spawn(self, coroutine: Awaitable[None]):
+        """イベント処理を受信ループとは別のタスクで実行（通知の送信で受信を止めない）"""
+        task = asyncio.ensure_future(coroutine)
+        self._handlers.add(task)
+        
+        def done(t: asyncio.Task):
+            self._handlers.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logger.error(f"EventSubイベント処理エラー: {t.exception()!r}")
+        
+        task.add_done_callback(done)
+    
+    def stats(self) -> Dict:
+        """接続状態と統計情報を取得"""
+        return {
+            'connected': self.connected,
+            'disabled': self.disabled_reason is not None,
+            'subscribed': len(self.subscribed_ids),
+            'sessions': self.sessions,
+            'reconnects': self.reconnects,
+            'notifications': self.notifications,
+            'duplicates': self.duplicates,
+            'keepalive_timeouts': self.keepalive_timeouts
+        }
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Twitch EventSub（WebSocket）のローカルモックサーバー（テスト用）
+
+使い方:
+    python -m features.twitch_notification.mock_eventsub --port 8080
+    
+    TWITCH_EVENTSUB_ENABLED=true
+    TWITCH_USER_ACCESS_TOKEN=mock
+    TWITCH_EVENTSUB_WS_URL=ws://127.0.0.1:8080/ws
+    TWITCH_EVENTSUB_SUBSCRIPTIONS_URL=http://127.0.0.1:8080/eventsub/subscriptions
+    
+    curl -X POST "http://127.0.0.1:8080/mock/online?user_id=123&login=foo"   # 配信開始を送信
+    curl -X POST "http://127.0.0.1:8080/mock/offline?user_id=123&login=foo"  # 配信終了を送信
+    curl -X POST "http://127.0.0.1:8080/mock/reconnect"                      # session_reconnect を送信
+    curl -X POST "http://127.0.0.1:8080/mock/drop"                           # 接続を切断
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from aiohttp import web
+
+
+def _now() -> str:
+    """Twitch形式の現在時刻"""
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class MockEventSubServer:
+    """Twitch EventSub（WebSocket）のモックサーバー
+    
+    - /ws: session_welcome を送り、keepalive_timeout 秒ごとに session_keepalive を送る
+    - /eventsub/subscriptions: WebSocketトランスポートのサブスクリプションを作成（重複は409、
+      user_token を指定した場合はそれ以外のトークンを401）
+    - /mock/*: 配信開始・終了の通知、session_reconnect、切断をテストから発生させる
+    """
+    
+    def __init__(self, keepalive_timeout: int = 10, user_token: Optional[str] = None):
+        self.keepalive_timeout = keepalive_timeout
+        self.user_token = user_token  # 受け付けるユーザーアクセストークン（Noneなら何でも受け付ける）
+        self.host = '127.0.0.1'
+        self.port = 0
+        self.sessions: Dict[str, web.WebSocketResponse] = {}
+        self.subscriptions: Dict[str, Dict] = {}
+        self.subscription_requests = 0
+        self.keepalive_enabled = True
+        self._runner: Optional[web.AppRunner] = None
+        
+        self.app = web.Application()
+        self.app.router.add_get('/ws', self._handle_ws)
+        self.app.router.add_post('/eventsub/subscriptions', self._handle_subscribe)
+        self.app.router.add_post('/mock/online', self._handle_trigger_online)
+        self.app.router.add_post('/mock/offline', self._handle_trigger_offline)
+        self.app.router.add_post('/mock/reconnect', self._handle_trigger_reconnect)
+        self.app.router.add_post('/mock/drop', self._handle_trigger_drop)
+    
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws"
+    
+    @property
+    def subscriptions_url(self) -> str:
+        return f"http://{self.host}:{self.port}/eventsub/subscriptions"
+    
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        """サーバーを起動（port=0 の場合は空いているポートを使う）"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.host = host
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        """サーバーを停止"""
+        await self.drop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+    
+    async def _send(self, ws: web.WebSocketResponse, message_type: str, payload: Dict, **metadata):
+        """EventSub形式のメッセージを送信"""
+        message = {
+            'metadata': {
+                'message_id': metadata.pop('message_id', None) or str(uuid.uuid4()),
+                'message_type': message_type,
+                'message_timestamp': _now(),
+                **metadata
+            },
+            'payload': payload
+        }
+        await ws.send_str(json.dumps(message))
+    
+    def _session_payload(self, session_id: str, status: str = 'connected', reconnect_url: Optional[str] = None) -> Dict:
+        return {
+            'session': {
+                'id': session_id,
+                'status': status,
+                'connected_at': _now(),
+                'keepalive_timeout_seconds': self.keepalive_timeout if status == 'connected' else None,
+                'reconnect_url': reconnect_url
+            }
+        }
+    
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        
+        session_id = str(uuid.uuid4())
+        previous_id = request.query.get('reconnect')
+        self.sessions[session_id] = ws
+        await self._send(ws, 'session_welcome', self._session_payload(session_id))
+        
+        if previous_id in self.sessions:
+            # session_reconnect: サブスクリプションを新しいセッションに移してから古い接続を閉じる
+            for subscription in self.subscriptions.values():
+                if subscription['transport']['session_id'] == previous_id:
+                    subscription['transport']['session_id'] = session_id
+            old_ws = self.sessions.pop(previous_id)
+            await old_ws.close()
+        
+        keepalive = asyncio.create_task(self._keepalive(ws))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            keepalive.cancel()
+            if self.sessions.get(session_id) is ws:
+                del self.sessions[session_id]
+                # 切断されたセッションのサブスクリプションは無効になる
+                for subscription_id in [s for s, sub in self.subscriptions.items() if sub['transport']['session_id'] == session_id]:
+                    del self.subscriptions[subscription_id]
+        return ws
+    
+    async def _keepalive(self, ws: web.WebSocketResponse):
+        while not ws.closed:
+            await asyncio.sleep(self.keepalive_timeout)
+            if self.keepalive_enabled and not ws.closed:
+                await self._send(ws, 'session_keepalive', {})
+    
+    async def _handle_subscribe(self, request: web.Request) -> web.Response:
+        self.subscription_requests += 1
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer ') or (self.user_token is not None and authorization != f'Bearer {self.user_token}'):
+            return web.json_response({'error': 'Unauthorized', 'status': 401}, status=401)
+        
+        body = await request.json()
+        session_id = body.get('transport', {}).get('session_id')
+        if body.get('transport', {}).get('method') != 'websocket' or session_id not in self.sessions:
+            return web.json_response({'error': 'Bad Request', 'status': 400, 'message': 'invalid transport'}, status=400)
+        
+        for subscription in self.subscriptions.values():
+            if subscription['type'] == body['type'] and subscription['condition'] == body['condition'] and subscription['transport']['session_id'] == session_id:
+                return web.json_response({'error': 'Conflict', 'status': 409}, status=409)
+        
+        subscription = {
+            'id': str(uuid.uuid4()),
+            'status': 'enabled',
+            'type': body['type'],
+            'version': body.get('version', '1'),
+            'condition': body['condition'],
+            'transport': {'method': 'websocket', 'session_id': session_id},
+            'created_at': _now(),
+            'cost': 1
+        }
+        self.subscriptions[subscription['id']] = subscription
+        return web.json_response({'data': [subscription], 'total': len(self.subscriptions), 'total_cost': len(self.subscriptions), 'max_total_cost': 10}, status=202)
+    
+    async def emit(self, subscription_type: str, event: Dict, message_id: Optional[str] = None) -> int:
+        """購読しているセッションに通知を送信（送信した件数を返す）"""
+        sent = 0
+        for subscription in list(self.subscriptions.values()):
+            if subscription['type'] != subscription_type:
+                continue
+            if subscription['condition'].get('broadcaster_user_id') != event.get('broadcaster_user_id'):
+                continue
+            ws = self.sessions.get(subscription['transport']['session_id'])
+            if ws is None or ws.closed:
+                continue
+            await self._send(
+                ws,
+                'notification',
+                {'subscription': subscription, 'event': event},
+                message_id=message_id,
+                subscription_type=subscription_type,
+                subscription_version=subscription['version']
+            )
+            sent += 1
+        return sent
+    
+    async def stream_online(self, user_id: str, login: str, stream_id: Optional[str] = None, message_id: Optional[str] = None) -> int:
+        """stream.online を送信"""
+        event = {
+            'id': stream_id or str(uuid.uuid4().int)[:11],
+            'broadcaster_user_id': user_id,
+            'broadcaster_user_login': login,
+            'broadcaster_user_name': login,
+            'type': 'live',
+            'started_at': _now()
+        }
+        return await self.emit('stream.online', event, message_id=message_id)
+    
+    async def stream_offline(self, user_id: str, login: str, message_id: Optional[str] = None) -> int:
+        """stream.offline を送信"""
+        event = {
+            'broadcaster_user_id': user_id,
+            'broadcaster_user_login': login,
+            'broadcaster_user_name': login
+        }
+        return await self.emit('stream.offline', event, message_id=message_id)
+    
+    async def reconnect(self):
+        """全セッションに session_reconnect を送信"""
+        for session_id, ws in list(self.sessions.items()):
+            reconnect_url = f"{self.ws_url}?reconnect={session_id}"
+            await self._send(ws, 'session_reconnect', self._session_payload(session_id, 'reconnecting', reconnect_url))
+    
+    async def drop(self):
+        """全セッションを切断（サブスクリプションも消える）"""
+        for ws in list(self.sessions.values()):
+            await ws.close()
+    
+    async def _handle_trigger_online(self, request: web.Request) -> web.Response:
+        sent = await self.stream_online(request.query['user_id'], request.query['login'], request.query.get('stream_id'), request.query.get('message_id'))
+        return web.json_response({'sent': sent})
+    
+    async def _handle_trigger_offline(self, request: web.Request) -> web.Response:
+        sent = await self.stream_offline(request.query['user_id'], request.query['login'], request.query.get('message_id'))
+        return web.json_response({'sent': sent})
+    
+    async def _handle_trigger_reconnect(self, request: web.Request) -> web.Response:
+        await self.reconnect()
+        return web.json_response({'sessions': len(self.sessions)})
+    
+    async def _handle_trigger_drop(self, request: web.Request) -> web.Response:
+        await self.drop()
+        return web.json_response({'sessions': 0})
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description='Twitch EventSub（WebSocket）モックサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--keepalive', type=int, default=10, help='keepalive間隔（秒）')
+    args = parser.parse_args()
+    
+    server = MockEventSubServer(keepalive_timeout=args.keepalive)
+    server.host, server.port = args.host, args.port
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
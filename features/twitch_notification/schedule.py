@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Twitch配信通知 配信者ごとのポーリング間隔スケジューラーモジュール"""
+
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import Container, Dict, Iterable, List, Optional, Set
+
+HOURS = 24
+DAY = 86400.0
+HALF_LIFE_DAYS = 28.0  # 古い配信開始の重みが半分になる日数（配信時間帯の変化に追従する）
+PRIOR_DAYS = 7.0  # 学習データが少ない間は「1日1回・時間帯は一様」とみなす重み（日数）
+NEIGHBOR_WEIGHT = 0.5  # 前後1時間の配信開始も含めて数える重み
+REFERENCE_RATE = 1.0 / HOURS  # 基準間隔で監視する配信開始率（1日1回・時間帯が一様な配信者）
+
+
+def _parse_started_at(started_at: Optional[str]) -> float:
+    """配信開始時刻（RFC3339）をUNIX時間に変換（不明なら現在時刻）"""
+    if started_at:
+        try:
+            return datetime.fromisoformat(started_at.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class StreamerHistory:
+    """配信者の時間帯（UTC）ごとの配信開始回数（指数減衰）と観測日数"""
+    
+    __slots__ = ('counts', 'exposure', 'updated_at')
+    
+    def __init__(self, updated_at: float):
+        self.counts = [0.0] * HOURS
+        self.exposure = 0.0  # 観測した日数（counts と同じく減衰させる）
+        self.updated_at = updated_at
+    
+    def _decayed(self, now: float):
+        """now 時点まで減衰させた (減衰率, 観測日数)"""
+        elapsed_days = max(now - self.updated_at, 0.0) / DAY
+        factor = 0.5 ** (elapsed_days / HALF_LIFE_DAYS)
+        return factor, self.exposure * factor + elapsed_days
+    
+    def observe(self, started_at: float, now: float):
+        """配信開始を記録"""
+        factor, self.exposure = self._decayed(now)
+        self.counts = [count * factor for count in self.counts]
+        self.updated_at = now
+        self.counts[datetime.fromtimestamp(started_at, timezone.utc).hour] += 1.0
+    
+    def rate(self, at: float, now: float) -> float:
+        """at の時間帯に配信を開始する見込み（1日あたりの期待回数、事前分布で平滑化）"""
+        factor, exposure = self._decayed(now)
+        hour = datetime.fromtimestamp(at, timezone.utc).hour
+        count = self.counts[hour] + NEIGHBOR_WEIGHT * (self.counts[hour - 1] + self.counts[(hour + 1) % HOURS])
+        count = count * factor / (1 + 2 * NEIGHBOR_WEIGHT)
+        return (count + PRIOR_DAYS * REFERENCE_RATE) / (exposure + PRIOR_DAYS)
+    
+    def to_dict(self) -> Dict:
+        return {'counts': self.counts, 'exposure': self.exposure, 'updated_at': self.updated_at}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StreamerHistory":
+        counts = [float(count) for count in data['counts']]
+        if len(counts) != HOURS:
+            raise ValueError(f"expected {HOURS} counts, got {len(counts)}")
+        history = cls(float(data['updated_at']))
+        history.counts = counts
+        history.exposure = float(data['exposure'])
+        return history
+
+
+class PollScheduler:
+    """配信者ごとにポーリング間隔を決めるスケジューラー
+    
+    観測した配信開始時刻から時間帯ごとの配信開始の見込みを学習し、配信を始めそうな時間帯の
+    配信者は min_interval まで短く、ほとんど配信しない時間帯は max_interval（遅延の上限）まで
+    長くする。学習データがない配信者は base_interval で監視する。配信中の配信者は終了の検出だけで
+    よいため max_interval で監視する。期限が来た配信者のリクエストは、100人単位の空き枠を
+    次に期限が来る配信者で埋めて送る（1回のリクエストで確認できる人数は同じため）。
+    """
+    
+    def __init__(self, base_interval: float, min_interval: float, max_interval: float, batch_size: int = 100):
+        self.min_interval = max(min(min_interval, base_interval), 1.0)
+        self.max_interval = max(max_interval, base_interval)
+        self.base_interval = base_interval
+        self.batch_size = batch_size
+        self.histories: Dict[str, StreamerHistory] = {}
+        self.dirty = False  # 保存後に学習データが変わったか
+        
+        self.next_due: Dict[str, float] = {}  # ユーザーID -> 次に確認する時刻（monotonic）
+        self.polls = 0
+        self.polled_ids = 0
+        self.skipped_ticks = 0
+    
+    def watch(self, user_ids: Iterable[str]):
+        """監視対象の配信者の観測を開始（配信しない日が続くと配信開始の見込みが下がる）"""
+        now = time.time()
+        for user_id in user_ids:
+            if user_id not in self.histories:
+                self.histories[user_id] = StreamerHistory(now)
+                self.dirty = True
+    
+    def interval(self, user_id: str, live: bool = False, now: Optional[float] = None) -> float:
+        """配信者の次の確認までの間隔（秒）"""
+        if live:
+            return self.max_interval
+        history = self.histories.get(user_id)
+        if history is None:
+            return self.base_interval
+        
+        now = now if now is not None else time.time()
+        # 待っている間に配信を始めそうな時間帯に入る場合に備え、最長の待ち時間の終わりの見込みも見る
+        rate = max(history.rate(now, now), history.rate(now + self.max_interval, now))
+        interval = self.base_interval * REFERENCE_RATE / rate
+        return min(max(interval, self.min_interval), self.max_interval)
+    
+    def due_user_ids(self, user_ids: Iterable[str]) -> List[str]:
+        """今回確認する配信者のユーザーID（期限が来た配信者＋リクエストの空き枠を埋める配信者）"""
+        now = time.monotonic()
+        due = []
+        waiting = []
+        for user_id in user_ids:
+            if self.next_due.get(user_id, 0.0) <= now:
+                due.append(user_id)
+            else:
+                waiting.append(user_id)
+        
+        if not due:
+            self.skipped_ticks += 1
+            return []
+        
+        spare = -len(due) % self.batch_size
+        if spare and waiting:
+            due.extend(heapq.nsmallest(spare, waiting, key=self.next_due.__getitem__))
+        return due
+    
+    def reschedule(self, user_ids: Iterable[str], live_ids: Container[str], failed_ids: Set[str]):
+        """確認した配信者の次の期限を設定（取得に失敗した配信者は最短間隔で確認し直す）"""
+        now = time.monotonic()
+        wall_now = time.time()
+        count = 0
+        for user_id in user_ids:
+            count += 1
+            if user_id in failed_ids:
+                self.next_due[user_id] = now + self.min_interval
+            else:
+                self.next_due[user_id] = now + self.interval(user_id, user_id in live_ids, wall_now)
+        self.polls += 1
+        self.polled_ids += count
+    
+    def observe_go_live(self, user_id: str, started_at: Optional[str]):
+        """配信開始を学習データに追加"""
+        now = time.time()
+        history = self.histories.get(user_id)
+        if history is None:
+            history = StreamerHistory(now)
+            self.histories[user_id] = history
+        history.observe(_parse_started_at(started_at), now)
+        self.dirty = True
+    
+    def to_dict(self) -> Dict[str, Dict]:
+        """学習データを保存用の辞書に変換"""
+        return {user_id: history.to_dict() for user_id, history in self.histories.items()}
+    
+    def restore(self, data: Dict[str, Dict]):
+        """保存済みの学習データを復元"""
+        histories = {}
+        for user_id, history in data.items():
+            try:
+                histories[user_id] = StreamerHistory.from_dict(history)
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.histories = histories
+        self.dirty = False
+    
+    def stats(self) -> Dict:
+        """統計情報を取得"""
+        return {
+            'polls': self.polls,
+            'polled_ids': self.polled_ids,
+            'skipped_ticks': self.skipped_ticks,
+            'learned': sum(1 for history in self.histories.values() if any(history.counts))
+        }
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Twitch配信通知 配信状態の保存モジュール"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+from core.logger import get_logger
+from .data import TwitchStreamMonitor
+from .schedule import PollScheduler
+
+logger = get_logger("twitch_notification")
+
+STATE_VERSION = 1
+
+
+class LiveStateStore:
+    """通知済みの配信と現在の配信状態（とポーリング間隔の学習データ）をJSONに保存するクラス
+    
+    再起動・再デプロイ後も通知済みの配信を覚えておき、起動直後のポーリングで
+    配信中の全員を再通知しないようにする。変更は flush_interval 秒ごとにまとめて書き込み、
+    一時ファイルに書いてから置き換えることで書き込み途中のファイルを読まないようにする。
+    """
+    
+    def __init__(self, path: str, flush_interval: float = 30.0, scheduler: Optional[PollScheduler] = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.scheduler = scheduler
+        self.flushes = 0
+        self._last_flush = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    def load(self, monitor: TwitchStreamMonitor) -> bool:
+        """保存済みの状態をモニターに読み込み（ファイルがない・壊れている場合はFalse）"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != STATE_VERSION:
+                logger.warning(f"配信状態ファイルのバージョンが異なるため読み込みません: path={self.path}")
+                return False
+            monitor.restore(
+                {user_id: tuple(key) for user_id, key in data.get('live_streams', {}).items()},
+                data.get('announced', [])
+            )
+            if self.scheduler is not None:
+                self.scheduler.restore(data.get('schedule', {}))
+        except Exception as e:
+            logger.warning(f"配信状態の読み込みに失敗: path={self.path}, error={e}")
+            return False
+        
+        age = time.time() - data.get('saved_at', 0)
+        logger.info(f"配信状態を読み込みました: live={len(monitor.live_streams)}, announced={len(monitor.announced)}, age={age:.0f}s")
+        return True
+    
+    def _is_dirty(self, monitor: TwitchStreamMonitor) -> bool:
+        return monitor.dirty or (self.scheduler is not None and self.scheduler.dirty)
+    
+    def schedule_flush(self, monitor: TwitchStreamMonitor):
+        """変更があれば flush_interval 秒以内に保存する（短時間の変更はまとめて1回で書き込む）"""
+        if not self._is_dirty(monitor):
+            return
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        self._flush_task = asyncio.create_task(self._flush_later(monitor))
+    
+    async def _flush_later(self, monitor: TwitchStreamMonitor):
+        delay = self.flush_interval - (time.monotonic() - self._last_flush)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            self.flush(monitor)
+        except Exception as e:
+            logger.error(f"配信状態の保存に失敗: path={self.path}, error={e}")
+    
+    def flush(self, monitor: TwitchStreamMonitor):
+        """変更があれば今すぐ保存（一時ファイルに書いてから置き換える）"""
+        if not self._is_dirty(monitor):
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        data = {
+            'version': STATE_VERSION,
+            'saved_at': time.time(),
+            'live_streams': {user_id: list(key) for user_id, key in monitor.live_streams.items()},
+            'announced': list(monitor.announced)
+        }
+        if self.scheduler is not None:
+            data['schedule'] = self.scheduler.to_dict()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        
+        monitor.dirty = False
+        if self.scheduler is not None:
+            self.scheduler.dirty = False
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+    
+    def close(self, monitor: TwitchStreamMonitor):
+        """保留中の書き込みを取り消して今すぐ保存（停止時）"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        try:
+            self.flush(monitor)
+        except Exception as e:
+            logger.error(f"配信状態の保存に失敗: path={self.path}, error={e}")
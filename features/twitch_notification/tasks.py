@@ -3,13 +3,21 @@
 """Twitch配信通知 タスクモジュール"""
 
 import asyncio
+import os
+import time
 import discord
 from discord.ext import tasks
-from typing import Optional
+from typing import List, Optional
 from core.twitch_api import TwitchAPIClient
-from core.config import get_twitch_credentials, get_twitch_config, get_notification_role_id
+from core.config import get_cache_config, get_twitch_credentials, get_twitch_config, get_notification_role_id
+from core.http import get_pool_stats
+from core.http_cache import get_response_cache_stats
+from core.resilience import get_circuit_stats
 from core.logger import get_logger
 from .data import TwitchStreamMonitor
+from .eventsub import EventSubTransport
+from .schedule import PollScheduler
+from .state import LiveStateStore
 from .embeds import create_stream_notification_embed
 
 logger = get_logger("twitch_notification")
@@ -23,7 +31,13 @@ class TwitchNotificationTask:
         self.monitor: Optional[TwitchStreamMonitor] = None
         self.channel_id: Optional[int] = None
         self.check_interval: int = 60
-        
+        self.eventsub: Optional[EventSubTransport] = None
+        self.state_store: Optional[LiveStateStore] = None
+        self.scheduler: Optional[PollScheduler] = None
+        self.reconcile_interval: int = 600  # EventSub接続中のポーリング間隔
+        self._last_poll = 0.0
+        self._poll_lock = asyncio.Lock()  # 定期ポーリングと再接続後の確認が重ならないようにする
+    
     async def initialize(self) -> bool:
         """初期化"""
         client_id, client_secret = get_twitch_credentials()
@@ -35,6 +49,7 @@ class TwitchNotificationTask:
         self.channel_id = config['channel_id']
         usernames = config['usernames']
         self.check_interval = config['check_interval']
+        self.reconcile_interval = config['reconcile_interval']
         
         if not self.channel_id:
             logger.error("TWITCH_DISCORD_CHANNEL_ID is not configured.")
@@ -48,11 +63,45 @@ class TwitchNotificationTask:
             client = TwitchAPIClient(client_id, client_secret)
             self.monitor = TwitchStreamMonitor(client)
             
-            if not self.monitor.initialize_user_ids(usernames):
+            if not await self.monitor.initialize_user_ids(usernames):
                 logger.error("Failed to initialize user IDs.")
                 return False
             
-            logger.info(f"Twitch通知を初期化しました: {len(usernames)}ユーザー監視")
+            if config['adaptive_polling']:
+                self.scheduler = PollScheduler(
+                    self.check_interval,
+                    config['min_poll_interval'],
+                    config['max_poll_interval'],
+                    TwitchAPIClient.STREAMS_BATCH_SIZE
+                )
+            
+            # 前回までに通知済みの配信を読み込み、起動直後のポーリングで再通知しないようにする
+            state_path = config['state_path'] or os.path.join(get_cache_config()['cache_dir'], 'twitch_live_state.json')
+            self.state_store = LiveStateStore(state_path, config['state_flush_interval'], self.scheduler)
+            if not self.state_store.load(self.monitor):
+                # 保存済みの状態がない（初回起動・永続化されない環境での再デプロイ）場合は、
+                # 起動前から配信中の配信者を一斉に通知しないよう最初のポーリング結果を通知済みとして記録する
+                self.monitor.seed_before = time.time()
+                logger.info(f"配信状態の保存がないため、起動前に始まった配信は通知しません: path={state_path}")
+            if self.scheduler:
+                self.scheduler.watch(self.monitor.user_ids.values())
+            
+            if config['eventsub_enabled']:
+                if config['eventsub_user_token']:
+                    self.eventsub = EventSubTransport(
+                        client,
+                        config['eventsub_user_token'],
+                        list(self.monitor.user_ids.values()),
+                        on_online=self._on_stream_online,
+                        on_offline=self._on_stream_offline,
+                        on_resync=self._poll,
+                        ws_url=config['eventsub_ws_url'],
+                        subscriptions_url=config['eventsub_subscriptions_url']
+                    )
+                else:
+                    logger.warning("TWITCH_USER_ACCESS_TOKEN is not configured. EventSub is disabled (polling only).")
+            
+            logger.info(f"Twitch通知を初期化しました: {len(usernames)}ユーザー監視, EventSub={'有効' if self.eventsub else '無効'}")
             return True
         except Exception as e:
             logger.error(f"Twitch通知の初期化に失敗: {e}", exc_info=True)
@@ -64,13 +113,64 @@ class TwitchNotificationTask:
         if not self.monitor:
             return
         
-        try:
-            new_streams = self.monitor.check_streams()
-            
-            for stream in new_streams:
-                await self.send_notification(stream)
-        except Exception as e:
-            logger.error(f"配信チェックエラー: {e}", exc_info=True)
+        # EventSubで全員の通知を受け取れている間は、取りこぼし確認のために間隔を空けてポーリングする
+        if self.eventsub is not None and self.eventsub.covers_all:
+            if time.monotonic() - self._last_poll < self.reconcile_interval:
+                return
+            await self._poll()
+            return
+        
+        # 配信者ごとの間隔で、期限が来た配信者だけを確認する
+        user_ids = None
+        if self.scheduler:
+            user_ids = self.scheduler.due_user_ids(self.monitor.user_ids.values())
+            if not user_ids:
+                return
+        
+        await self._poll(user_ids)
+    
+    async def _poll(self, user_ids: Optional[List[str]] = None):
+        """配信状況をポーリングして新規配信を通知（user_ids を省略した場合は全員）"""
+        async with self._poll_lock:
+            if user_ids is None:
+                self._last_poll = time.monotonic()
+            try:
+                new_streams = await self.monitor.check_streams(user_ids)
+                
+                if self.scheduler:
+                    for stream in new_streams:
+                        self.scheduler.observe_go_live(stream['user_id'], stream.get('started_at'))
+                    polled = user_ids if user_ids is not None else self.monitor.user_ids.values()
+                    self.scheduler.reschedule(polled, self.monitor.live_streams, self.monitor.failed_ids)
+                
+                for stream in new_streams:
+                    await self.send_notification(stream)
+                self._save_state()
+                
+                eventsub_stats = self.eventsub.stats() if self.eventsub else None
+                scheduler_stats = self.scheduler.stats() if self.scheduler else None
+                logger.debug(f"HTTPプール統計: {get_pool_stats()}, レスポンスキャッシュ: {get_response_cache_stats()}, サーキット: {get_circuit_stats()}, EventSub: {eventsub_stats}, スケジューラー: {scheduler_stats}")
+            except Exception as e:
+                logger.error(f"配信チェックエラー: {e}", exc_info=True)
+    
+    async def _on_stream_online(self, event: dict):
+        """EventSubで配信開始を受け取ったら通知"""
+        stream = await self.monitor.handle_stream_online(event)
+        if stream is not None and self.scheduler:
+            self.scheduler.observe_go_live(stream['user_id'], stream.get('started_at'))
+        self._save_state()
+        if stream is not None:
+            await self.send_notification(stream)
+    
+    async def _on_stream_offline(self, event: dict):
+        """EventSubで配信終了を受け取ったら状態を更新"""
+        self.monitor.handle_stream_offline(event)
+        self._save_state()
+    
+    def _save_state(self):
+        """配信状態に変更があれば保存を予約（書き込みはまとめて行う）"""
+        if self.state_store:
+            self.state_store.schedule_flush(self.monitor)
     
     async def send_notification(self, stream_data: dict):
         """Discord通知を送信"""
@@ -103,7 +203,7 @@ class TwitchNotificationTask:
                 await channel.send(content=content, embed=embed)
                 logger.info(f"Discord通知送信: {stream_data['user_name']}")
                 return
-                
+            
             except discord.Forbidden as e:
                 logger.error(f"Discord通知エラー (権限不足): {e}")
                 logger.info("以下の点を確認してください:")
@@ -133,13 +233,26 @@ class TwitchNotificationTask:
     def start(self):
         """タスクを開始"""
         if self.monitor:
-            self.check_streams_task.change_interval(seconds=self.check_interval)
-            self.check_streams_task.start()
-            logger.info(f"配信監視を開始しました (間隔: {self.check_interval}秒)")
+            if self.scheduler:
+                # 配信者ごとの期限は最短間隔ごとに確認する（期限が来た配信者がいなければリクエストしない）
+                self.check_streams_task.change_interval(seconds=self.scheduler.min_interval)
+                self.check_streams_task.start()
+                logger.info(f"配信監視を開始しました (間隔: {self.scheduler.min_interval:.0f}〜{self.scheduler.max_interval:.0f}秒, 学習前: {self.check_interval}秒)")
+            else:
+                self.check_streams_task.change_interval(seconds=self.check_interval)
+                self.check_streams_task.start()
+                logger.info(f"配信監視を開始しました (間隔: {self.check_interval}秒)")
+            if self.eventsub:
+                self.eventsub.start()
+                logger.info(f"EventSubでの配信監視を開始しました (接続中のポーリング間隔: {self.reconcile_interval}秒)")
     
     def stop(self):
         """タスクを停止"""
+        if self.eventsub:
+            self.eventsub.stop()
         if self.check_streams_task.is_running():
             self.check_streams_task.stop()
             logger.info("配信監視を停止しました")
+        if self.state_store and self.monitor:
+            self.state_store.close(self.monitor)
 
@@ -1,2 +1,2 @@
-"""osu! 2025 Wrapped feature module"""
+"""osu! Wrapped feature module"""
 
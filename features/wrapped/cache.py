@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! Wrapped 結果キャッシュモジュール"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from core.config import get_wrapped_config
+from core.logger import get_logger
+from .data import build_wrapped_stats, fetch_wrapped_user_data, start_star_rating_lookups
+
+logger = get_logger("wrapped")
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_username(username: str) -> str:
+    """キャッシュキー用にユーザー名を正規化"""
+    return username.strip().lower()
+
+
+def is_incomplete(stats_data: Dict) -> bool:
+    """Star Ratingの取得がタイムアウト・エラー・打ち切りで一部計算値のまま終わった結果か"""
+    star_rating_task = stats_data.get('star_rating_task')
+    if star_rating_task is None or not star_rating_task.done():
+        return False
+    if star_rating_task.cancelled() or star_rating_task.exception() is not None:
+        return True
+    return bool(star_rating_task.result())
+
+
+class WrappedResultCache:
+    """Wrapped結果のTTLキャッシュ（stale-while-revalidate対応）
+    
+    - 鮮度内（ttl）: そのまま返す
+    - 期限切れだが stale_ttl 以内: 古い結果を即座に返し、裏で再取得する
+    - 存在しないユーザー（None）は negative_ttl の間だけキャッシュする
+    - 同じキーの取得が同時に走った場合は1回の取得結果を全員で共有する（single-flight）
+    """
+    
+    def __init__(self, ttl: float, stale_ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 実行中の取得に相乗りしたリクエスト数
+        
+        self._entries: "OrderedDict[CacheKey, Tuple[Optional[Dict], float]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+    
+    def _store(self, key: CacheKey, value: Optional[Dict]):
+        """結果を保存（上限を超えたら古いものから捨てる）"""
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        """キャッシュから結果を取得し、なければfetchで取得して保存する"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            
+            if value is None:
+                if age < self.negative_ttl:
+                    self.hits += 1
+                    return None
+            elif age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            elif age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._schedule_refresh(key, fetch)
+                return value
+        
+        self.misses += 1
+        return await self._fetch_once(key, fetch)
+    
+    def peek(self, key: CacheKey) -> Tuple[bool, Optional[Dict]]:
+        """鮮度内の結果があれば (True, 結果) を返す（取得は開始しない）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        
+        value, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if value is None:
+            if age >= self.negative_ttl:
+                return False, None
+        else:
+            if age >= self.ttl:
+                return False, None
+            self._entries.move_to_end(key)
+        
+        self.hits += 1
+        return True, value
+    
+    def _start_fetch(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict]]]) -> asyncio.Task:
+        """取得を開始する（同じキーで実行中の取得があればそれを返す）"""
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+        
+        async def load() -> Optional[Dict]:
+            try:
+                value = await fetch()
+                # 失敗時は保存しない（例外は待っている全員に渡す）
+                self._store(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+        
+        task = asyncio.create_task(load())
+        self._inflight[key] = task
+        # 誰も待っていない状態で失敗しても未回収の例外として警告されないようにする
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+    
+    async def _fetch_once(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        """実行中の取得に相乗りするか、新しく取得する"""
+        if key in self._inflight:
+            self.coalesced += 1
+            logger.debug(f"実行中の取得に相乗りします: key={key}, coalesced={self.coalesced}")
+        
+        # 待っている側がキャンセルされても取得自体は止めない
+        return await asyncio.shield(self._start_fetch(key, fetch))
+    
+    def _schedule_refresh(self, key: CacheKey, fetch: Callable[[], Awaitable[Optional[Dict]]]):
+        """裏で結果を再取得（実行中の取得があれば何もしない）"""
+        if key in self._inflight:
+            return
+        
+        task = self._start_fetch(key, fetch)
+        
+        def log_result(t: asyncio.Task):
+            if t.cancelled():
+                return
+            if t.exception() is not None:
+                logger.warning(f"Wrappedキャッシュの再取得に失敗（古い結果を保持）: key={key}, error={t.exception()}")
+            else:
+                logger.debug(f"Wrappedキャッシュを更新しました: key={key}")
+        
+        task.add_done_callback(log_result)
+    
+    def stats(self) -> Dict:
+        """ヒット/ミスの統計情報を取得"""
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self._entries),
+            'inflight': len(self._inflight)
+        }
+
+
+_result_cache: Optional[WrappedResultCache] = None
+
+
+def get_result_cache() -> WrappedResultCache:
+    """/wrapped と /wrapped_simple で共有する結果キャッシュを取得"""
+    global _result_cache
+    if _result_cache is None:
+        config = get_wrapped_config()
+        _result_cache = WrappedResultCache(
+            ttl=config['cache_ttl'],
+            stale_ttl=config['cache_stale_ttl'],
+            negative_ttl=config['negative_cache_ttl'],
+            max_entries=config['cache_max_entries']
+        )
+    return _result_cache
+
+
+def get_year_view(
+    user_data: Dict,
+    year: int,
+    client_id: str,
+    client_secret: str,
+    username: str = '',
+    deadline: Optional[float] = None
+) -> Dict:
+    """キャッシュ済みのユーザーデータから指定年の統計情報を取得（なければ保存済みのテーブルとプレイカウントから作成）
+    
+    Star Ratingを取得しきれなかった年は incomplete_cache_ttl を過ぎたら作り直し、取得をやり直す。
+    """
+    views: Dict[int, Tuple[Dict, float]] = user_data.setdefault('views', {})
+    entry = views.get(year)
+    if entry is not None:
+        stats_data, created_at = entry
+        if not is_incomplete(stats_data) or time.monotonic() - created_at < get_wrapped_config()['incomplete_cache_ttl']:
+            return stats_data
+    
+    stats_data = build_wrapped_stats(user_data, year)
+    start_star_rating_lookups(stats_data, client_id, client_secret, username, deadline)
+    views[year] = (stats_data, time.monotonic())
+    return stats_data
+
+
+async def get_cached_wrapped_stats_data(
+    username: str,
+    client_id: str,
+    client_secret: str,
+    year: int,
+    mode: str = 'osu',
+    deadline: Optional[float] = None
+) -> Optional[Dict]:
+    """キャッシュ経由で指定年・モードの統計情報を取得（APIエラーは例外を送出）
+    
+    ユーザー情報とベストスコアは (ユーザー名, モード) 単位でキャッシュし、別の年を指定しても再取得しない。
+    MOD適用後Star Ratingは取得を待たずに返す（stats_data['star_rating_task'] で完了を待てる）。
+    取得は deadline（time.monotonic）を過ぎたら打ち切る。
+    """
+    key = (normalize_username(username), mode)
+    user_data = await get_result_cache().get(
+        key,
+        lambda: fetch_wrapped_user_data(username, client_id, client_secret, mode)
+    )
+    if user_data is None:
+        return None
+    return get_year_view(user_data, year, client_id, client_secret, username, deadline)
+
+
+def peek_cached_wrapped_stats_data(username: str, year: int, mode: str = 'osu') -> Tuple[bool, Optional[Dict]]:
+    """メモリ上の鮮度内で完成済み（Star Ratingもすべて取得済み）の統計情報を取得（なければ (False, None)、存在しないユーザーは (True, None)）"""
+    found, user_data = get_result_cache().peek((normalize_username(username), mode))
+    if not found or user_data is None:
+        return found, None
+    
+    entry = user_data.get('views', {}).get(year)
+    if entry is None:
+        return False, None
+    stats_data = entry[0]
+    star_rating_task = stats_data.get('star_rating_task')
+    if star_rating_task is not None and not star_rating_task.done():
+        return False, None
+    # 計算値が混ざった結果は通常の経路で返す（期限切れなら取り直す）
+    if is_incomplete(stats_data):
+        return False, None
+    return True, stats_data
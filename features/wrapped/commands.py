@@ -1,21 +1,122 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""osu! 2025 Wrapped コマンド定義モジュール"""
+"""osu! Wrapped コマンド定義モジュール"""
 
+import asyncio
+import time
 import discord
 from discord import app_commands
-from typing import Optional
-from core.config import get_osu_credentials
-from core.utils import format_mods
+from typing import Callable, Dict, Optional, Tuple
+from core.config import get_osu_credentials, get_wrapped_config
+from core.resilience import CircuitOpenError
+from core.utils import format_mods, get_display_star_rating
 from core.logger import get_logger
-from .data import get_2025_stats_data
+from .cache import get_cached_wrapped_stats_data, peek_cached_wrapped_stats_data
+from .data import GAME_MODES, FIRST_WRAPPED_YEAR, get_default_year, is_valid_year
 from .embeds import create_wrapped_embed
 
 logger = get_logger("wrapped")
 
+EMBED_EDIT_INTERVAL = 1.0  # Star Rating反映のためにメッセージを編集する最小間隔（秒）
 
-async def wrapped_command_handler(interaction: discord.Interaction, username: str):
-    """osu! 2025 Wrappedコマンドハンドラ"""
+
+async def _resolve_year(interaction: discord.Interaction, year: Optional[int]) -> Optional[int]:
+    """対象年を決定（未指定ならデフォルト年、範囲外ならエラーメッセージを送信してNone）"""
+    if year is None:
+        return get_default_year()
+    
+    if not is_valid_year(year):
+        logger.warning(f"対象年が範囲外: year={year}, user_id={interaction.user.id}")
+        await interaction.response.send_message(
+            f"❌ Error: year must be between {FIRST_WRAPPED_YEAR} and the current year.",
+            ephemeral=True
+        )
+        return None
+    
+    return year
+
+
+def _star_rating_snapshot(stats_data: Dict) -> Tuple[float, ...]:
+    """表示中のスコアのAPI取得済みStar Rating（未取得は0）"""
+    return tuple(score.modded_star_rating for score in stats_data['top_10_scores'])
+
+
+async def _refine_star_ratings(
+    message: discord.WebhookMessage,
+    stats_data: Dict,
+    render: Callable[[], discord.Embed],
+    shown: Tuple[float, ...],
+    deadline: float
+):
+    """MOD適用後Star Ratingの取得に合わせて送信済みのEmbedを編集する
+    
+    最初のEmbedは計算値で送信し、取得が進むたびに（EMBED_EDIT_INTERVAL 秒間隔で）
+    同じメッセージを差し替える。deadline（time.monotonic）を過ぎたら待つのをやめる。
+    """
+    task: Optional[asyncio.Task] = stats_data.get('star_rating_task')
+    if task is None:
+        return
+    
+    edits = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if not task.done() and remaining > 0:
+            await asyncio.wait({task}, timeout=min(EMBED_EDIT_INTERVAL, remaining))
+        
+        current = _star_rating_snapshot(stats_data)
+        if current != shown:
+            try:
+                await message.edit(embed=render())
+            except discord.HTTPException as e:
+                # メッセージが削除された場合などは反映をやめる（最初のEmbedは送信済み）
+                logger.warning(f"Star Rating反映のためのメッセージ編集に失敗: message_id={message.id}, error={e}")
+                return
+            shown = current
+            edits += 1
+        
+        if task.done() or deadline - time.monotonic() <= 0:
+            break
+    
+    if not task.done():
+        logger.info(f"応答時間の上限に達したためStar Ratingの反映を終了: message_id={message.id}, edits={edits}")
+    else:
+        logger.debug(f"Star Ratingを反映しました: message_id={message.id}, edits={edits}")
+
+
+async def _respond_from_cache(
+    interaction: discord.Interaction,
+    username: str,
+    year: int,
+    mode: str,
+    render: Callable[[Dict], discord.Embed],
+    not_found_message: str,
+    started_at: float
+) -> bool:
+    """鮮度内の完成した結果がメモリにあれば、deferせずに1回の応答で返す（応答した場合はTrue）"""
+    found, stats_data = peek_cached_wrapped_stats_data(username, year, mode)
+    if not found:
+        return False
+    
+    try:
+        if stats_data is None:
+            await interaction.response.send_message(not_found_message)
+        else:
+            await interaction.response.send_message(embed=render(stats_data))
+    except discord.errors.NotFound as e:
+        logger.warning(f"インタラクションが既にタイムアウトまたは無効: username={username}, error={e}")
+        return True
+    
+    logger.info(f"初回応答: path=cache, username={username}, elapsed={time.monotonic() - started_at:.3f}s")
+    return True
+
+
+async def wrapped_command_handler(
+    interaction: discord.Interaction,
+    username: str,
+    year: Optional[int] = None,
+    mode: str = 'osu'
+):
+    """osu! Wrappedコマンドハンドラ"""
     import json
     import time
     debug_log_path = r"c:\Users\Reira\Documents\git_repository\osu2025-wrapped\.cursor\debug.log"
@@ -27,7 +128,10 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
     except: pass
     # #endregion
     
-    logger.info(f"コマンドリクエスト: username={username}, user_id={interaction.user.id}, guild_id={interaction.guild_id if interaction.guild_id else 'DM'}")
+    logger.info(f"コマンドリクエスト: username={username}, year={year}, mode={mode}, user_id={interaction.user.id}, guild_id={interaction.guild_id if interaction.guild_id else 'DM'}")
+    # このインタラクションで待つ時間の上限（Star Ratingの反映はここまで）
+    started_at = time.monotonic()
+    deadline = started_at + get_wrapped_config()['response_budget']
     
     # 認証情報の確認
     client_id, client_secret = get_osu_credentials()
@@ -45,6 +149,10 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
         )
         return
     
+    year = await _resolve_year(interaction, year)
+    if year is None:
+        return
+    
     # 処理中メッセージを送信
     # #region agent log
     try:
@@ -64,6 +172,15 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
         logger.warning(f"インタラクションは既に応答済み: username={username}")
         return
     
+    # 完成した結果がキャッシュにあれば defer + followup の2往復ではなく1回で応答する
+    if await _respond_from_cache(
+        interaction, username, year, mode,
+        lambda data: create_wrapped_embed(username, data),
+        f"❌ User '{username}' not found. Please check the username.",
+        started_at
+    ):
+        return
+    
     try:
         await interaction.response.defer(thinking=True)
         # #region agent log
@@ -112,23 +229,23 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
     
     try:
         # 統計データを取得
-        logger.info(f"osu! APIリクエスト開始: username={username}")
+        logger.info(f"osu! APIリクエスト開始: username={username}, year={year}, mode={mode}")
         # #region agent log
         api_start_time = time.time()
         try:
             with open(debug_log_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "D", "location": "commands.py:54", "message": "Before get_2025_stats_data", "data": {"username": username, "interaction_id": str(interaction.id), "api_start_time": api_start_time}, "timestamp": int(time.time() * 1000)}) + "\n")
+                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "D", "location": "commands.py:54", "message": "Before get_cached_wrapped_stats_data", "data": {"username": username, "interaction_id": str(interaction.id), "api_start_time": api_start_time}, "timestamp": int(time.time() * 1000)}) + "\n")
         except: pass
         # #endregion
         
-        stats_data = get_2025_stats_data(username, client_id, client_secret)
+        stats_data = await get_cached_wrapped_stats_data(username, client_id, client_secret, year, mode, deadline)
         
         # #region agent log
         api_end_time = time.time()
         api_duration = api_end_time - api_start_time
         try:
             with open(debug_log_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "D", "location": "commands.py:60", "message": "After get_2025_stats_data", "data": {"username": username, "interaction_id": str(interaction.id), "api_duration": api_duration, "stats_data_is_none": stats_data is None, "has_scores": stats_data is not None and len(stats_data.get('scores_2025', [])) > 0 if stats_data else False}, "timestamp": int(time.time() * 1000)}) + "\n")
+                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "D", "location": "commands.py:60", "message": "After get_cached_wrapped_stats_data", "data": {"username": username, "interaction_id": str(interaction.id), "api_duration": api_duration, "stats_data_is_none": stats_data is None, "has_scores": stats_data is not None and len(stats_data.get('scores_year', [])) > 0 if stats_data else False}, "timestamp": int(time.time() * 1000)}) + "\n")
         except: pass
         # #endregion
         
@@ -145,9 +262,9 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
             )
             return
         
-        # 2025年のスコアがなくても他の情報（プレイカウントなど）は表示する
-        if not stats_data['scores_2025']:
-            logger.info(f"2025年のベストスコアが見つかりませんでした（Top PPセクションは除外）: username={username}, user_id={stats_data['user']['id']}")
+        # 対象年のスコアがなくても他の情報（プレイカウントなど）は表示する
+        if not stats_data['scores_year']:
+            logger.info(f"{year}年のベストスコアが見つかりませんでした（Top PPセクションは除外）: username={username}, user_id={stats_data['user']['id']}")
             # #region agent log
             try:
                 with open(debug_log_path, "a", encoding="utf-8") as f:
@@ -156,14 +273,16 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
             # #endregion
         
         # Embedを作成して送信
-        logger.info(f"データ取得成功: username={username}, user_id={stats_data['user']['id']}, scores_count={len(stats_data['scores_2025'])}, playcount_2025={stats_data['plays_2025']}")
+        logger.info(f"データ取得成功: username={username}, user_id={stats_data['user']['id']}, scores_count={len(stats_data['scores_year'])}, playcount_{year}={stats_data['plays_year']}")
         # #region agent log
         try:
             with open(debug_log_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "G", "location": "commands.py:109", "message": "Before create_wrapped_embed", "data": {"username": username, "interaction_id": str(interaction.id), "scores_count": len(stats_data['scores_2025'])}, "timestamp": int(time.time() * 1000)}) + "\n")
+                f.write(json.dumps({"sessionId": "debug-session", "runId": "run1", "hypothesisId": "G", "location": "commands.py:109", "message": "Before create_wrapped_embed", "data": {"username": username, "interaction_id": str(interaction.id), "scores_count": len(stats_data['scores_year'])}, "timestamp": int(time.time() * 1000)}) + "\n")
         except: pass
         # #endregion
         
+        # 取得済みでないStar Ratingは計算値で表示し、取得でき次第同じメッセージを編集する
+        shown = _star_rating_snapshot(stats_data)
         embed = create_wrapped_embed(username, stats_data)
         
         # #region agent log
@@ -173,7 +292,8 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
         except: pass
         # #endregion
         
-        await interaction.followup.send(embed=embed)
+        message = await interaction.followup.send(embed=embed, wait=True)
+        logger.info(f"初回応答: path=fetch, username={username}, elapsed={time.monotonic() - started_at:.3f}s")
         logger.info(f"コマンド成功: username={username}")
         
         # #region agent log
@@ -183,6 +303,12 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
         except: pass
         # #endregion
         
+        await _refine_star_ratings(message, stats_data, lambda: create_wrapped_embed(username, stats_data), shown, deadline)
+        
+    except CircuitOpenError as e:
+        # osu!が落ちている間は待たせずにすぐ応答する
+        logger.warning(f"osu! APIが停止中のため応答できません: username={username}, error={e}")
+        await interaction.followup.send("❌ osu! API is currently unavailable. Please try again in a few minutes.")
     except Exception as e:
         # #region agent log
         try:
@@ -205,9 +331,56 @@ async def wrapped_command_handler(interaction: discord.Interaction, username: st
             logger.error(f"followup.sendも失敗: username={username}, error={followup_error}", exc_info=True)
 
 
-async def wrapped_simple_command_handler(interaction: discord.Interaction, username: str):
-    """簡易版osu! 2025 Wrappedコマンドハンドラ"""
-    logger.info(f"コマンドリクエスト: username={username}, user_id={interaction.user.id}, guild_id={interaction.guild_id if interaction.guild_id else 'DM'}")
+def _create_simple_embed(stats_data: Dict) -> discord.Embed:
+    """簡易版osu! WrappedのEmbedを作成"""
+    user = stats_data['user']
+    year = stats_data['year']
+    mode = stats_data['mode']
+    plays_year = stats_data['plays_year']
+    top_10_scores = stats_data['top_10_scores']
+    
+    embed = discord.Embed(
+        title=f"{GAME_MODES[mode]} {year} Wrapped - {user['username']}",
+        color=0xff1493
+    )
+    
+    avatar_url = user.get('avatar_url', '')
+    if avatar_url:
+        embed.set_thumbnail(url=avatar_url)
+    
+    embed.add_field(
+        name="Statistics",
+        value=f"**{year} Playcount:** {plays_year:,}\n**Best Scores:** {len(stats_data['scores_year'])}",
+        inline=False
+    )
+    
+    if top_10_scores:
+        top_3_text = ""
+        for i, score in enumerate(top_10_scores[:3], 1):
+            beatmap = score.beatmap
+            modded_sr = get_display_star_rating(score)
+            song_diff_text = f"{beatmap.artist} - {beatmap.title} [{beatmap.version}]"
+            if beatmap.url:
+                song_diff_text = f"[{song_diff_text}]({beatmap.url})"
+            mods = format_mods(score.mod_names)
+            mod_display = f" +{mods}" if mods != "NoMod" else ""
+            top_3_text += f"**#{i}** {song_diff_text}\n{modded_sr:.2f}⭐ {score.pp:.2f}pp{mod_display}\n\n"
+        embed.add_field(name="Top 3 PP", value=top_3_text, inline=False)
+    
+    return embed
+
+
+async def wrapped_simple_command_handler(
+    interaction: discord.Interaction,
+    username: str,
+    year: Optional[int] = None,
+    mode: str = 'osu'
+):
+    """簡易版osu! Wrappedコマンドハンドラ"""
+    logger.info(f"コマンドリクエスト: username={username}, year={year}, mode={mode}, user_id={interaction.user.id}, guild_id={interaction.guild_id if interaction.guild_id else 'DM'}")
+    # このインタラクションで待つ時間の上限（Star Ratingの反映はここまで）
+    started_at = time.monotonic()
+    deadline = started_at + get_wrapped_config()['response_budget']
     
     client_id, client_secret = get_osu_credentials()
     if not client_id or not client_secret:
@@ -218,11 +391,24 @@ async def wrapped_simple_command_handler(interaction: discord.Interaction, usern
         )
         return
     
+    year = await _resolve_year(interaction, year)
+    if year is None:
+        return
+    
+    # 完成した結果がキャッシュにあれば defer + followup の2往復ではなく1回で応答する
+    if await _respond_from_cache(
+        interaction, username, year, mode,
+        _create_simple_embed,
+        f"❌ User '{username}' not found.",
+        started_at
+    ):
+        return
+    
     await interaction.response.defer(thinking=True)
     
     try:
-        logger.info(f"osu! APIリクエスト開始: username={username}")
-        stats_data = get_2025_stats_data(username, client_id, client_secret)
+        logger.info(f"osu! APIリクエスト開始: username={username}, year={year}, mode={mode}")
+        stats_data = await get_cached_wrapped_stats_data(username, client_id, client_secret, year, mode, deadline)
         
         if not stats_data:
             logger.warning(f"ユーザーが見つかりませんでした: username={username}")
@@ -232,59 +418,27 @@ async def wrapped_simple_command_handler(interaction: discord.Interaction, usern
             return
         
         user = stats_data['user']
-        plays_2025 = stats_data['plays_2025']
-        top_10_scores = stats_data['top_10_scores']
+        plays_year = stats_data['plays_year']
         
-        # 2025年のスコアがない場合はログに記録（Top PPセクションは除外される）
-        if not stats_data['scores_2025']:
-            logger.info(f"2025年のベストスコアが見つかりませんでした（プレイカウントのみ表示します）: username={username}, user_id={user['id']}")
+        # 対象年のスコアがない場合はログに記録（Top PPセクションは除外される）
+        if not stats_data['scores_year']:
+            logger.info(f"{year}年のベストスコアが見つかりませんでした（プレイカウントのみ表示します）: username={username}, user_id={user['id']}")
         
-        # 簡易Embed
-        embed = discord.Embed(
-            title=f"osu! 2025 Wrapped - {user['username']}",
-            color=0xff1493
-        )
-        
-        avatar_url = user.get('avatar_url', '')
-        if avatar_url:
-            embed.set_thumbnail(url=avatar_url)
-        
-        embed.add_field(
-            name="Statistics",
-            value=f"**2025 Playcount:** {plays_2025:,}\n**Best Scores:** {len(stats_data['scores_2025'])}",
-            inline=False
-        )
-        
-        if top_10_scores:
-            top_3_text = ""
-            for i, score in enumerate(top_10_scores[:3], 1):
-                pp = score.get('pp', 0)
-                beatmapset = score.get('beatmapset', {})
-                beatmap = score.get('beatmap', {})
-                artist = beatmapset.get('artist', 'Unknown')
-                title = beatmapset.get('title', 'Unknown')
-                base_sr = beatmap.get('difficulty_rating', 0)
-                mods_list = score.get('mods', [])
-                modded_sr = score.get('_modded_star_rating', 0)
-                if modded_sr == 0:
-                    from core.utils import calculate_modded_star_rating
-                    modded_sr = calculate_modded_star_rating(base_sr, mods_list)
-                beatmapset_id = beatmapset.get('id', 0)
-                beatmap_id = beatmap.get('id', 0)
-                beatmap_url = f"https://osu.ppy.sh/beatmapsets/{beatmapset_id}#osu/{beatmap_id}" if beatmapset_id and beatmap_id else ""
-                difficulty = beatmap.get('version', 'Unknown')
-                song_diff_text = f"{artist} - {title} [{difficulty}]"
-                if beatmap_url:
-                    song_diff_text = f"[{song_diff_text}]({beatmap_url})"
-                mods = format_mods(mods_list) if mods_list else "NoMod"
-                mod_display = f" +{mods}" if mods != "NoMod" else ""
-                top_3_text += f"**#{i}** {song_diff_text}\n{modded_sr:.2f}⭐ {pp:.2f}pp{mod_display}\n\n"
-            embed.add_field(name="Top 3 PP", value=top_3_text, inline=False)
+        # 取得済みでないStar Ratingは計算値で表示し、取得でき次第同じメッセージを編集する
+        shown = _star_rating_snapshot(stats_data)
+        embed = _create_simple_embed(stats_data)
         
-        logger.info(f"データ取得成功: username={username}, user_id={user['id']}, scores_count={len(stats_data['scores_2025'])}, playcount_2025={plays_2025}")
-        await interaction.followup.send(embed=embed)
+        logger.info(f"データ取得成功: username={username}, user_id={user['id']}, scores_count={len(stats_data['scores_year'])}, playcount_{year}={plays_year}")
+        message = await interaction.followup.send(embed=embed, wait=True)
+        logger.info(f"初回応答: path=fetch, username={username}, elapsed={time.monotonic() - started_at:.3f}s")
         logger.info(f"コマンド成功: username={username}")
         
+        await _refine_star_ratings(message, stats_data, lambda: _create_simple_embed(stats_data), shown, deadline)
+        
+    except CircuitOpenError as e:
+        # osu!が落ちている間は待たせずにすぐ応答する
+        logger.warning(f"osu! APIが停止中のため応答できません: username={username}, error={e}")
+        await interaction.followup.send("❌ osu! API is currently unavailable. Please try again in a few minutes.")
     except Exception as e:
         logger.error(f"コマンド失敗: username={username}, error={str(e)}", exc_info=True)
         await interaction.followup.send(f"❌ Error: {str(e)}")
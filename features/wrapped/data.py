@@ -1,93 +1,202 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""osu! 2025 Wrapped データ取得・処理モジュール"""
+"""osu! Wrapped データ取得・処理モジュール"""
 
-from datetime import datetime
-from typing import Optional, Dict, List
+import asyncio
+import time
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Tuple
+from core.config import get_wrapped_config
+from core.models import Score
+from core.mods import difficulty_bitmask
 from core.osu_api import OsuAPIClient
-from core.utils import get_modded_star_rating_from_api
+from core.rate_limit import get_osu_rate_governor, wait_for_active
+from core.utils import lookup_modded_star_rating, estimate_modded_star_rating
+from .engine import ScoreTable
 from core.logger import get_logger
 
 logger = get_logger("wrapped")
 
+# 対応しているゲームモード（APIのモード名 -> 表示名）
+GAME_MODES = {
+    'osu': 'osu!',
+    'taiko': 'osu!taiko',
+    'fruits': 'osu!catch',
+    'mania': 'osu!mania'
+}
+FIRST_WRAPPED_YEAR = 2007  # osu!のサービス開始年
 
-def filter_2025_scores(scores: List[Dict], year: int = 2025) -> List[Dict]:
-    """指定された年のスコアをフィルタリング"""
-    filtered_scores = []
-    
-    for score in scores:
-        # created_at のフォーマット例: "2025-01-15T12:30:45Z"
-        created_at = score.get('created_at', '')
-        if created_at:
-            try:
-                score_date = datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%SZ')
-                if score_date.year == year:
-                    filtered_scores.append(score)
-            except ValueError:
-                continue
-    
-    return filtered_scores
 
+def get_default_year() -> int:
+    """デフォルトの対象年を取得（WRAPPED_DEFAULT_YEAR が未設定なら現在の年）"""
+    return get_wrapped_config()['default_year'] or datetime.now(timezone.utc).year
 
-def calculate_2025_playcount(user_data: Dict, year: int = 2025) -> int:
-    """月ごとのプレイカウントデータから2025年のトータルプレイカウントを計算"""
-    monthly_playcounts = user_data.get('monthly_playcounts', [])
-    
-    if not monthly_playcounts:
-        return 0
+
+def is_valid_year(year: int) -> bool:
+    """Wrappedを作成できる年か"""
+    return FIRST_WRAPPED_YEAR <= year <= datetime.now(timezone.utc).year
+
+
+def build_yearly_playcounts(user_data: Dict) -> Dict[int, Dict]:
+    """月ごとのプレイカウントデータから全年分の年間合計と月別データを1回の走査で作成
     
-    total_2025_plays = 0
+    Returns:
+        {年: {'total': 年間プレイカウント, 'monthly': [{'month': 'YYYY-MM', 'count': 回数}, ...]}}
+    """
+    yearly: Dict[int, Dict] = {}
     
-    for month_data in monthly_playcounts:
+    for month_data in user_data.get('monthly_playcounts', []):
         # start_date のフォーマット例: "2025-01-01"
         start_date = month_data.get('start_date', '')
         count = month_data.get('count', 0)
         
-        if start_date:
-            try:
-                date = datetime.strptime(start_date, '%Y-%m-%d')
-                if date.year == year:
-                    total_2025_plays += count
-            except ValueError:
-                continue
+        if len(start_date) < 7 or not start_date[:4].isdigit():
+            continue
+        
+        year = int(start_date[:4])
+        entry = yearly.setdefault(year, {'total': 0, 'monthly': []})
+        entry['total'] += count
+        entry['monthly'].append({'month': start_date[:7], 'count': count})
     
-    return total_2025_plays
+    for entry in yearly.values():
+        entry['monthly'].sort(key=lambda x: x['month'])
+    
+    return yearly
 
 
-def get_monthly_2025_data(user_data: Dict, year: int = 2025) -> List[Dict]:
-    """2025年の月別プレイカウントデータを取得"""
-    monthly_playcounts = user_data.get('monthly_playcounts', [])
-    monthly_2025_data = []
+async def add_modded_star_ratings(
+    client: OsuAPIClient,
+    scores: List[Score],
+    username: str = '',
+    mode: str = 'osu',
+    budget: Optional[float] = None
+) -> int:
+    """スコアごとのMOD適用後Star Ratingを並行取得して modded_star_rating に設定し、取得できなかった組み合わせの数を返す
     
-    for month_data in monthly_playcounts:
-        start_date = month_data.get('start_date', '')
-        count = month_data.get('count', 0)
-        
-        if start_date:
+    同じ(譜面, MOD)の組み合わせは1回だけ取得し、同時実行数とタイムアウトは
+    WRAPPED_SR_CONCURRENCY / WRAPPED_SR_TIMEOUT で設定する（タイムアウトにはレート制御の待ち時間を含めない）。
+    タイムアウト・エラーになった組み合わせはローカル計算・近似値にフォールバックし、他の取得は継続する。
+    budget 秒を過ぎても終わらない取得は打ち切る（該当スコアは計算値で表示される）。
+    """
+    config = get_wrapped_config()
+    semaphore = asyncio.Semaphore(config['sr_concurrency'])
+    timeout = config['sr_timeout']
+    
+    # (譜面ID, 難易度に影響するMODのビットマスク) ごとにスコアをまとめる
+    groups: Dict[Tuple[int, int], List[Score]] = {}
+    for score in scores:
+        key = (score.beatmap.id, difficulty_bitmask(score.mods))
+        groups.setdefault(key, []).append(score)
+    
+    async def lookup(key: Tuple[int, int], group: List[Score]) -> bool:
+        """グループのStar Ratingを設定（タイムアウト・エラーで取得できなかった場合はFalse）"""
+        score = group[0]
+        completed = True
+        async with semaphore:
             try:
-                date = datetime.strptime(start_date, '%Y-%m-%d')
-                if date.year == year:
-                    monthly_2025_data.append({
-                        'month': date.strftime('%Y-%m'),
-                        'count': count
-                    })
-            except ValueError:
-                continue
+                modded_sr = await wait_for_active(lookup_modded_star_rating(score, client, mode), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Star Rating取得タイムアウト（計算値を使用）: username={username}, beatmap_id={key[0]}, mods={key[1]}")
+                modded_sr = None
+                completed = False
+            except Exception as sr_error:
+                logger.warning(f"Star Rating取得エラー（計算値を使用）: username={username}, beatmap_id={key[0]}, error={sr_error}")
+                modded_sr = None
+                completed = False
+        
+        if not modded_sr:
+            # 属性がない譜面（削除済みなど）も計算値を使う（応答を待たせないよう .osu ファイルは取得しない）
+            modded_sr = await estimate_modded_star_rating(score, mode)
+        for grouped_score in group:
+            grouped_score.modded_star_rating = modded_sr
+        return completed
     
-    monthly_2025_data.sort(key=lambda x: x['month'])
-    return monthly_2025_data
+    tasks = [asyncio.ensure_future(lookup(key, group)) for key, group in groups.items()]
+    if not tasks:
+        return 0
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=budget)
+    finally:
+        # 打ち切り・キャンセル時は残りの取得を止める
+        for task in tasks:
+            task.cancel()
+    if pending:
+        logger.info(f"Star Rating取得を打ち切りました（計算値を使用）: username={username}, abandoned={len(pending)}/{len(tasks)}, budget={budget}s")
+    # 打ち切った取得とタイムアウト・エラーになった取得は結果キャッシュで未完成として扱う
+    incomplete = len(pending) + sum(1 for task in done if not task.result())
+    logger.debug(f"Star Rating取得: username={username}, scores={len(scores)}, unique_lookups={len(groups)}, incomplete={incomplete}, rate_limit={get_osu_rate_governor().stats()}")
+    return incomplete
 
 
-def get_2025_stats_data(username: str, client_id: str, client_secret: str) -> Optional[Dict]:
-    """2025年の統計情報を取得して辞書形式で返す（Discord Bot用）"""
-    try:
-        # APIクライアントの初期化
-        logger.debug(f"OsuAPIClient初期化: username={username}")
-        client = OsuAPIClient(client_id, client_secret)
+async def collect_best_scores(client: OsuAPIClient, user: Dict, year: Optional[int] = None, mode: str = 'osu') -> List[Score]:
+    """集計に必要なベストスコアをページ単位で取得（不要なページは取得しない）
+    
+    ベストスコアはPP順のため指定年のスコアが後半のページに含まれる可能性があり、
+    件数などの集計には全件が必要になる。ユーザーのベストスコア件数を上限にして
+    空ページの取得を避け、year を指定した場合は登録日がそれより後のユーザーの取得自体を行わない。
+    """
+    join_date = user.get('join_date')
+    # join_date のフォーマット例: "2015-01-01T00:00:00+00:00"
+    if year is not None and join_date and join_date[:4].isdigit() and int(join_date[:4]) > year:
+        return []
+    
+    max_scores = user.get('scores_best_count') or OsuAPIClient.BEST_SCORES_LIMIT
+    
+    best_scores: List[Score] = []
+    async with aclosing(client.iter_user_best_scores(user['id'], mode=mode, max_scores=max_scores)) as stream:
+        async for score in stream:
+            best_scores.append(score)
+    return best_scores
+
+
+def build_wrapped_user_data(user: Dict, best_scores: List[Score], mode: str = 'osu') -> Dict:
+    """取得済みのユーザー情報とベストスコアを、どの年の統計も再パースせずに作れる形にまとめる
+    
+    年ごとのプレイカウント（全年分）とスコアの列指向テーブルを1回だけ作成する。
+    """
+    return {
+        'mode': mode,
+        'user': user,
+        'scores': ScoreTable(best_scores),
+        'yearly_playcounts': build_yearly_playcounts(user)
+    }
+
+
+def build_wrapped_stats(user_data: Dict, year: int) -> Dict:
+    """build_wrapped_user_data の結果から指定年の統計情報を作成"""
+    user = user_data['user']
+    year_playcounts = user_data['yearly_playcounts'].get(year, {'total': 0, 'monthly': []})
+    
+    # 指定年のスコアを抽出し、PP上位10件を計算
+    summary = user_data['scores'].year_summary(year, k=10)
+    
+    return {
+        'year': year,
+        'mode': user_data['mode'],
+        'user': user,
+        'scores_year': summary['scores'],
+        'top_10_scores': summary['top_scores'],
+        'plays_year': year_playcounts['total'],
+        'monthly_data': year_playcounts['monthly'],
+        'total_playcount': user.get('statistics', {}).get('play_count', 0)
+    }
+
+
+async def fetch_wrapped_user_data(
+    username: str,
+    client_id: str,
+    client_secret: str,
+    mode: str = 'osu'
+) -> Optional[Dict]:
+    """ユーザー情報とベストスコア（全件）を取得して build_wrapped_user_data の形で返す（ユーザーが存在しない場合はNone、APIエラーは例外を送出）"""
+    # APIクライアントの初期化
+    logger.debug(f"OsuAPIClient初期化: username={username}")
+    async with OsuAPIClient(client_id, client_secret) as client:
         
         # ユーザー情報の取得
-        logger.debug(f"ユーザー情報取得API呼び出し: username={username}")
-        user = client.get_user(username)
+        logger.debug(f"ユーザー情報取得API呼び出し: username={username}, mode={mode}")
+        user = await client.get_user(username, mode=mode)
         
         if not user:
             logger.warning(f"ユーザー情報の取得に失敗（ユーザーが見つかりません）: username={username}")
@@ -96,47 +205,78 @@ def get_2025_stats_data(username: str, client_id: str, client_secret: str) -> Op
         user_id = user['id']
         logger.debug(f"ユーザー情報取得成功: username={username}, user_id={user_id}")
         
-        # ベストスコアの取得
+        # ベストスコアの取得（どの年にも使えるよう全件取得する）
         logger.debug(f"ベストスコア取得API呼び出し: user_id={user_id}")
-        best_scores = client.get_user_best_scores(user_id, limit=100)
-        logger.debug(f"ベストスコア取得完了: user_id={user_id}, count={len(best_scores)}")
-        
-        # 2025年のスコアをフィルタリング
-        scores_2025 = filter_2025_scores(best_scores, year=2025)
-        logger.debug(f"2025年スコアフィルタリング完了: username={username}, scores_2025_count={len(scores_2025)}")
-        
-        # PPでソート（降順）
-        if scores_2025:
-            scores_2025.sort(key=lambda x: x.get('pp', 0), reverse=True)
-            top_10_scores = scores_2025[:10]
-            
-            # 各スコアにMOD適用後のStar Ratingを追加（APIから取得）
-            logger.debug(f"MOD適用後Star Rating取得開始: username={username}, top_10_count={len(top_10_scores)}")
-            for idx, score in enumerate(top_10_scores, 1):
-                try:
-                    modded_sr = get_modded_star_rating_from_api(score, client)
-                    score['_modded_star_rating'] = modded_sr
-                except Exception as sr_error:
-                    logger.warning(f"Star Rating取得エラー (score #{idx}): username={username}, error={sr_error}")
-            logger.debug(f"MOD適用後Star Rating取得完了: username={username}")
-        else:
-            top_10_scores = []
-        
-        # プレイカウントの計算
-        plays_2025 = calculate_2025_playcount(user, year=2025)
-        monthly_2025_data = get_monthly_2025_data(user, year=2025)
-        total_playcount = user.get('statistics', {}).get('play_count', 0)
-        logger.debug(f"プレイカウント計算完了: username={username}, total={total_playcount}, 2025={plays_2025}, monthly_count={len(monthly_2025_data)}")
-        
-        return {
-            'user': user,
-            'scores_2025': scores_2025,
-            'top_10_scores': top_10_scores,
-            'plays_2025': plays_2025,
-            'monthly_2025_data': monthly_2025_data,
-            'total_playcount': total_playcount
-        }
-    except Exception as e:
-        logger.error(f"get_2025_stats_data error: username={username}, error={str(e)}", exc_info=True)
+        best_scores = await collect_best_scores(client, user, mode=mode)
+        logger.debug(f"ベストスコア取得完了: user_id={user_id}, count={len(best_scores)}, response_cache={client.response_cache.stats()}")
+    
+    return build_wrapped_user_data(user, best_scores, mode)
+
+
+def start_star_rating_lookups(
+    stats_data: Dict,
+    client_id: str,
+    client_secret: str,
+    username: str = '',
+    deadline: Optional[float] = None
+) -> Optional[asyncio.Task]:
+    """上位10件のMOD適用後Star Ratingの取得をバックグラウンドで開始（stats_data['star_rating_task'] に設定）
+    
+    取得は deadline（time.monotonic、コマンドの受付時刻 + WRAPPED_RESPONSE_BUDGET）を過ぎたら打ち切る。
+    deadline を省略した場合は開始から WRAPPED_RESPONSE_BUDGET 秒とする。取得が進むにつれてスコアの modded_star_rating が順に埋まる。
+    """
+    top_10_scores = stats_data['top_10_scores']
+    if not top_10_scores:
         return None
+    
+    # 共有プールを使うクライアントのため、閉じずにバックグラウンドの取得に使える
+    client = OsuAPIClient(client_id, client_secret)
+    logger.debug(f"MOD適用後Star Rating取得開始: username={username}, top_10_count={len(top_10_scores)}")
+    if deadline is None:
+        budget = get_wrapped_config()['response_budget']
+    else:
+        # ユーザー情報・ベストスコアの取得にかかった時間も予算に含める
+        budget = max(0.0, deadline - time.monotonic())
+    star_rating_task = asyncio.ensure_future(add_modded_star_ratings(client, top_10_scores, username, stats_data['mode'], budget))
+    # 誰も待っていない状態で失敗しても未回収の例外として警告されないようにする
+    star_rating_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    stats_data['star_rating_task'] = star_rating_task
+    return star_rating_task
 
+
+async def fetch_wrapped_stats_data(
+    username: str,
+    client_id: str,
+    client_secret: str,
+    year: int,
+    mode: str = 'osu'
+) -> Optional[Dict]:
+    """指定年の統計情報を取得して辞書形式で返す（ユーザーが存在しない場合はNone、APIエラーは例外を送出）"""
+    user_data = await fetch_wrapped_user_data(username, client_id, client_secret, mode)
+    if user_data is None:
+        return None
+    
+    stats_data = build_wrapped_stats(user_data, year)
+    logger.debug(f"{year}年スコアフィルタリング完了: username={username}, scores_count={len(stats_data['scores_year'])}")
+    logger.debug(f"プレイカウント計算完了: username={username}, total={stats_data['total_playcount']}, {year}={stats_data['plays_year']}, monthly_count={len(stats_data['monthly_data'])}")
+    
+    star_rating_task = start_star_rating_lookups(stats_data, client_id, client_secret, username)
+    if star_rating_task is not None:
+        await star_rating_task
+        logger.debug(f"MOD適用後Star Rating取得完了: username={username}")
+    return stats_data
+
+
+async def get_wrapped_stats_data(
+    username: str,
+    client_id: str,
+    client_secret: str,
+    year: int,
+    mode: str = 'osu'
+) -> Optional[Dict]:
+    """指定年の統計情報を取得して辞書形式で返す（Discord Bot用）"""
+    try:
+        return await fetch_wrapped_stats_data(username, client_id, client_secret, year, mode)
+    except Exception as e:
+        logger.error(f"get_wrapped_stats_data error: username={username}, year={year}, mode={mode}, error={str(e)}", exc_info=True)
+        return None
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! Wrapped 列指向スコア集計モジュール
+
+スコアのリストをNumPy配列（pp・取得日時・MOD・SR・精度）に展開し、
+年の絞り込み・上位k件の抽出・集計をベクトル演算で行う。
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from core.models import Score
+from core.mods import MOD_BITS, bitmask_to_mods
+
+PP_HISTOGRAM_BIN_WIDTH = 50  # ppヒストグラムの階級幅
+
+
+def year_range(year: int) -> Tuple[float, float]:
+    """指定年の開始・終了（UTC）をUNIX時間で取得"""
+    start = datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+    return start, end
+
+
+class ScoreTable:
+    """スコアの列指向テーブル"""
+    
+    def __init__(self, scores: Sequence[Score]):
+        self.scores: List[Score] = list(scores)
+        count = len(self.scores)
+        self.pp = np.fromiter((score.pp for score in self.scores), dtype=np.float64, count=count)
+        self.created_at = np.fromiter((score.created_at for score in self.scores), dtype=np.float64, count=count)
+        self.mods = np.fromiter((score.mods for score in self.scores), dtype=np.int64, count=count)
+        self.star_rating = np.fromiter((score.beatmap.star_rating for score in self.scores), dtype=np.float64, count=count)
+        self.accuracy = np.fromiter((score.accuracy for score in self.scores), dtype=np.float64, count=count)
+    
+    def __len__(self) -> int:
+        return len(self.scores)
+    
+    def year_mask(self, year: int) -> np.ndarray:
+        """指定年に取得したスコアのマスク"""
+        start, end = year_range(year)
+        return (self.created_at >= start) & (self.created_at < end)
+    
+    def take(self, indices: np.ndarray) -> List[Score]:
+        """インデックス配列の順にScoreを取り出す"""
+        return [self.scores[i] for i in indices]
+    
+    def top_k_indices(self, k: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """pp上位k件のインデックス（pp降順）を部分選択で取得"""
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.scores))
+        if len(candidates) > k:
+            # 全件ソートせず、上位k件だけを取り出してからソートする
+            partition = np.argpartition(-self.pp[candidates], k - 1)[:k]
+            candidates = candidates[partition]
+        order = np.argsort(-self.pp[candidates], kind='stable')
+        return candidates[order]
+    
+    def top_k(self, k: int, mask: Optional[np.ndarray] = None) -> List[Score]:
+        """pp上位k件のScore（pp降順）"""
+        return self.take(self.top_k_indices(k, mask))
+    
+    def aggregate(self, mask: Optional[np.ndarray] = None) -> Dict:
+        """MOD使用数・ppヒストグラム・平均SR等を集計"""
+        if mask is None:
+            mask = np.ones(len(self.scores), dtype=bool)
+        pp = self.pp[mask]
+        mods = self.mods[mask]
+        count = int(pp.size)
+        
+        # MOD使用数（DTの件数にはNCを含む）
+        mod_usage = {}
+        if count:
+            for mod in bitmask_to_mods(int(np.bitwise_or.reduce(mods))):
+                mod_usage[mod] = int(np.count_nonzero(mods & MOD_BITS[mod]))
+            nomod_count = int(np.count_nonzero(mods == 0))
+            if nomod_count:
+                mod_usage['NoMod'] = nomod_count
+        
+        # ppヒストグラム（階級の下限 -> 件数）
+        pp_histogram = {}
+        if count:
+            bins = (pp // PP_HISTOGRAM_BIN_WIDTH).astype(np.int64)
+            values, counts = np.unique(bins, return_counts=True)
+            pp_histogram = {int(v) * PP_HISTOGRAM_BIN_WIDTH: int(c) for v, c in zip(values, counts)}
+        
+        return {
+            'count': count,
+            'total_pp': float(pp.sum()) if count else 0.0,
+            'max_pp': float(pp.max()) if count else 0.0,
+            'average_star_rating': float(self.star_rating[mask].mean()) if count else 0.0,
+            'average_accuracy': float(self.accuracy[mask].mean()) if count else 0.0,
+            'mod_usage': dict(sorted(mod_usage.items(), key=lambda item: item[1], reverse=True)),
+            'pp_histogram': pp_histogram
+        }
+    
+    def year_summary(self, year: int, k: int = 10) -> Dict:
+        """指定年のスコア一覧・上位k件をまとめて取得"""
+        mask = self.year_mask(year)
+        return {
+            'scores': self.take(np.flatnonzero(mask)),
+            'top_scores': self.top_k(k, mask)
+        }
@@ -1,20 +1,25 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""コマンドライン版 osu! 2025 Wrapped（後方互換性のため残存）"""
+"""コマンドライン版 osu! Wrapped（後方互換性のため残存）"""
 
 import sys
 import argparse
+import asyncio
 import io
-from datetime import datetime
-import requests
+import aiohttp
 from core.config import get_osu_credentials
+from core.http import close_sessions
 from core.osu_api import OsuAPIClient
+from core.osu_auth import get_osu_token_provider
 from core.utils import format_mods, calculate_modded_star_rating
 from features.wrapped.data import (
-    get_2025_stats_data,
-    filter_2025_scores,
-    calculate_2025_playcount,
-    get_monthly_2025_data
+    GAME_MODES,
+    FIRST_WRAPPED_YEAR,
+    build_wrapped_stats,
+    build_wrapped_user_data,
+    collect_best_scores,
+    get_default_year,
+    is_valid_year
 )
 
 # Windows環境での文字化け対策
@@ -23,18 +28,26 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 
-def get_2025_stats(username: str, client_id: str, client_secret: str):
-    """2025年の統計情報を取得（コマンドライン版）"""
+async def get_wrapped_stats(username: str, client_id: str, client_secret: str, year: int, mode: str = 'osu'):
+    """指定年の統計情報を取得（コマンドライン版）"""
     
-    print(f"\nosu! 2025 Wrapped - {username}\n")
+    print(f"\n{GAME_MODES[mode]} {year} Wrapped - {username}\n")
     print("=" * 80)
     
-    # APIクライアントの初期化
-    client = OsuAPIClient(client_id, client_secret)
-    
+    # APIクライアントの初期化（トークンは共有プロバイダから取得）
+    token_provider = get_osu_token_provider(client_id, client_secret)
+    try:
+        async with OsuAPIClient(client_id, client_secret, token_provider=token_provider) as client:
+            await _print_wrapped_stats(client, username, year, mode)
+    finally:
+        await close_sessions()
+
+
+async def _print_wrapped_stats(client: OsuAPIClient, username: str, year: int, mode: str):
+    """APIクライアントを使って指定年の統計情報を表示"""
     # ユーザー情報の取得
     print(f"\n[*] ユーザー情報を取得中...")
-    user = client.get_user(username)
+    user = await client.get_user(username, mode=mode)
     
     if not user:
         print(f"[!] ユーザー '{username}' が見つかりませんでした。")
@@ -48,84 +61,84 @@ def get_2025_stats(username: str, client_id: str, client_secret: str):
     
     # ベストスコアの取得
     print(f"\n[*] ベストスコアを取得中...")
-    best_scores = client.get_user_best_scores(user_id, limit=100)
+    best_scores = await collect_best_scores(client, user, year, mode)
+    
+    # 対象年のスコア・PP上位10件・年別プレイカウントをまとめて計算
+    user_data = build_wrapped_user_data(user, best_scores, mode)
+    stats_data = build_wrapped_stats(user_data, year)
+    scores_year = stats_data['scores_year']
     
-    # 2025年のスコアをフィルタリング
-    scores_2025 = filter_2025_scores(best_scores, year=2025)
+    # 集計（MOD使用回数・平均SR・平均精度）はコマンドライン版でのみ表示する
+    table = user_data['scores']
+    aggregates = table.aggregate(table.year_mask(year))
     
-    if not scores_2025:
-        print(f"\n[!] 2025年のスコアが見つかりませんでした。")
+    if not scores_year:
+        print(f"\n[!] {year}年のスコアが見つかりませんでした。")
         print(f"    総ベストスコア数: {len(best_scores)}")
         if best_scores:
-            first_score_date = datetime.strptime(best_scores[0]['created_at'], '%Y-%m-%dT%H:%M:%SZ')
+            first_score_date = best_scores[0].created_date
             print(f"    最新のベストスコア: {first_score_date.strftime('%Y-%m-%d')}")
     else:
-        # PPでソート（降順）
-        scores_2025.sort(key=lambda x: x.get('pp', 0), reverse=True)
-        
         # 上位10件を表示
-        top_10_scores = scores_2025[:10]
+        top_10_scores = stats_data['top_10_scores']
         
-        print(f"\n[TOP 10] 2025年に取得したPP")
+        print(f"\n[TOP 10] {year}年に取得したPP")
         print("=" * 80)
         
         for i, score in enumerate(top_10_scores, 1):
-            pp = score.get('pp', 0)
-            beatmap = score.get('beatmap', {})
-            beatmapset = score.get('beatmapset', {})
-            mods = format_mods(score.get('mods', []))
-            
-            # 譜面情報
-            artist = beatmapset.get('artist', 'Unknown')
-            title = beatmapset.get('title', 'Unknown')
-            difficulty = beatmap.get('version', 'Unknown')
-            base_star_rating = beatmap.get('difficulty_rating', 0)
-            mods_list = score.get('mods', [])
+            beatmap = score.beatmap
+            mods_list = score.mod_names
+            mods = format_mods(mods_list)
             
             # MOD適用後のStar Ratingを計算
-            modded_star_rating = calculate_modded_star_rating(base_star_rating, mods_list)
-            
-            # カバー画像URL
-            cover_url = beatmapset.get('covers', {}).get('card', '')
+            modded_star_rating = calculate_modded_star_rating(beatmap.star_rating, mods_list)
             
-            print(f"\n{i}. {pp:.2f}pp")
-            print(f"   Song: {artist} - {title}")
-            print(f"   Diff: [{difficulty}] - {modded_star_rating:.2f}* {mods}")
-            print(f"   Cover: {cover_url}")
-            print(f"   Date: {score['created_at'][:10]}")
-    
-    # プレイカウントの計算
-    print(f"\n[*] 2025年のプレイカウントを計算中...")
+            print(f"\n{i}. {score.pp:.2f}pp")
+            print(f"   Song: {beatmap.artist} - {beatmap.title}")
+            print(f"   Diff: [{beatmap.version}] - {modded_star_rating:.2f}* {mods}")
+            print(f"   Cover: {beatmap.cover_url}")
+            print(f"   Date: {score.created_date.strftime('%Y-%m-%d')}")
     
-    # 月ごとのプレイカウントデータから2025年のトータルを計算
-    plays_2025 = calculate_2025_playcount(user, year=2025)
-    total_playcount = user.get('statistics', {}).get('play_count', 0)
-    monthly_2025_data = get_monthly_2025_data(user, year=2025)
+    # プレイカウント（月ごとのプレイカウントデータから計算済み）
+    plays_year = stats_data['plays_year']
+    total_playcount = stats_data['total_playcount']
+    monthly_data = stats_data['monthly_data']
     
     print(f"\n[STATS] 統計情報")
     print("=" * 80)
     print(f"PLAYCOUNT (TOTAL): {total_playcount:,}")
-    print(f"PLAYCOUNT (2025): {plays_2025:,}")
-    print(f"BESTSCORES: {len(scores_2025)}")
-    
-    if monthly_2025_data:
-        print(f"\n[MONTHLY PLAYCOUNT (2025)]")
+    print(f"PLAYCOUNT ({year}): {plays_year:,}")
+    print(f"BESTSCORES: {len(scores_year)}")
+    if scores_year:
+        mod_usage = ", ".join(f"{mod}: {count}" for mod, count in aggregates['mod_usage'].items())
+        print(f"AVERAGE SR (BASE): {aggregates['average_star_rating']:.2f}*")
+        print(f"AVERAGE ACCURACY: {aggregates['average_accuracy'] * 100:.2f}%")
+        print(f"MOD USAGE: {mod_usage}")
+    
+    if monthly_data:
+        print(f"\n[MONTHLY PLAYCOUNT ({year})]")
         print("-" * 80)
-        for month_info in monthly_2025_data:
+        for month_info in monthly_data:
             print(f"  {month_info['month']}: {month_info['count']:,} plays")
     
     print("\n" + "=" * 80)
-    print("[完了] osu! 2025 Wrapped")
+    print(f"[完了] {GAME_MODES[mode]} {year} Wrapped")
 
 
 def main():
     """メイン処理"""
     
     # コマンドライン引数のパース
-    parser = argparse.ArgumentParser(description='osu! 2025 Wrapped - 2025年のプレイ統計を取得')
+    parser = argparse.ArgumentParser(description='osu! Wrapped - 年間のプレイ統計を取得')
     parser.add_argument('username', nargs='?', help='osu! ユーザー名')
+    parser.add_argument('--year', type=int, default=get_default_year(), help='対象年（デフォルト: 今年）')
+    parser.add_argument('--mode', choices=list(GAME_MODES), default='osu', help='ゲームモード（デフォルト: osu）')
     args = parser.parse_args()
     
+    if not is_valid_year(args.year):
+        print(f"[ERROR] 対象年は {FIRST_WRAPPED_YEAR} 年から今年までの範囲で指定してください。")
+        return
+    
     # 環境変数から認証情報を取得
     client_id, client_secret = get_osu_credentials()
     
@@ -150,10 +163,10 @@ def main():
         return
     
     try:
-        get_2025_stats(username, client_id, client_secret)
-    except requests.exceptions.HTTPError as e:
+        asyncio.run(get_wrapped_stats(username, client_id, client_secret, args.year, args.mode))
+    except aiohttp.ClientResponseError as e:
         print(f"\n[ERROR] APIエラーが発生しました: {e}")
-        if e.response.status_code == 401:
+        if e.status == 401:
             print("        認証に失敗しました。CLIENT_IDとCLIENT_SECRETを確認してください。")
     except Exception as e:
         print(f"\n[ERROR] エラーが発生しました: {e}")
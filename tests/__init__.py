@@ -0,0 +1,2 @@
+"""Tests for osu! Discord Bot"""
+
@@ -0,0 +1,2 @@
+"""Core module tests"""
+
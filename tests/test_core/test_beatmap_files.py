@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""".osu ファイル解析のテスト"""
+
+from concurrent.futures import ThreadPoolExecutor
+from core.beatmap_files import KIND_CIRCLE, KIND_SLIDER, OsuFileStore, parse_osu_file
+
+HEADER = """osu file format v14
+
+[General]
+Mode: 0
+
+[Metadata]
+BeatmapID:{beatmap_id}
+
+[Difficulty]
+CircleSize:4
+OverallDifficulty:8
+ApproachRate:9
+SliderMultiplier:1.4
+SliderTickRate:1
+
+[TimingPoints]
+0,500,4,2,1,60,1,0
+
+[HitObjects]
+"""
+
+
+def _osu_file(hit_objects: str, beatmap_id: int = 1) -> bytes:
+    return (HEADER.format(beatmap_id=beatmap_id) + hit_objects).encode('utf-8')
+
+
+def _parse(hit_objects: str):
+    return parse_osu_file(_osu_file(hit_objects))
+
+
+def test_parses_circles_and_sliders():
+    beatmap = _parse("100,100,1000,1,0\n200,100,1500,2,0,L|300:100,1,100\n")
+    
+    assert beatmap.beatmap_id == 1
+    assert list(beatmap.objects['kind']) == [KIND_CIRCLE, KIND_SLIDER]
+    assert beatmap.objects[1]['end_x'] == 300
+    assert beatmap.objects[1]['end_y'] == 100
+
+
+def test_slider_without_curve_points_does_not_drop_beatmap():
+    for curve_type in ('B', 'P', 'L'):
+        beatmap = _parse(f"100,100,1000,2,0,{curve_type},1,100\n300,300,2000,1,0\n")
+        
+        assert list(beatmap.objects['kind']) == [KIND_SLIDER, KIND_CIRCLE]
+        assert beatmap.objects[0]['end_x'] == 100
+        assert beatmap.objects[0]['end_y'] == 100
+
+
+def test_store_loads_concurrently_from_threads(tmp_path):
+    store = OsuFileStore(str(tmp_path), index=None)
+    store.MEMORY_ENTRIES = 2
+    digests = {}
+    for beatmap_id in range(1, 9):
+        _, digests[beatmap_id] = store.add_bytes(_osu_file(f"{beatmap_id},100,1000,1,0\n", beatmap_id))
+    
+    # メモリに残せる数より多い譜面を複数スレッドから同時に読み込む
+    requests = [beatmap_id for _ in range(50) for beatmap_id in digests]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        loaded = list(executor.map(lambda beatmap_id: store._load_digest(digests[beatmap_id]), requests))
+    
+    assert [parsed.beatmap_id for parsed in loaded] == requests
+    assert len(store._memory) <= store.MEMORY_ENTRIES
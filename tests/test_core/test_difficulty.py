@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ローカルStar Rating計算のテスト（tests/fixtures/osu の .osu ファイルを使用）
+
+tests/fixtures/osu/star_ratings.json
+    lazer: osu!lazer で確認したStar Rating（ファイル名 -> {MOD: SR}）。lazer_tolerance 以内で一致すること
+    local: この計算の結果（計算を変更した際に意図しない差が出ていないかの確認用）
+"""
+
+import asyncio
+import json
+import os
+import pytest
+from core import utils
+from core.beatmap_files import OsuFileStore
+from core.difficulty import calculate_star_rating
+from core.models import Beatmap, Score
+from core.mods import mods_to_bitmask
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'osu')
+
+with open(os.path.join(FIXTURE_DIR, 'star_ratings.json'), encoding='utf-8') as f:
+    EXPECTED = json.load(f)
+
+
+def _mods(name: str) -> int:
+    return 0 if name == 'NM' else mods_to_bitmask(name.split('+'))
+
+
+@pytest.fixture(scope='module')
+def beatmaps(tmp_path_factory):
+    """フィクスチャのディレクトリを取り込んだ解析済みの譜面（ファイル名 -> 譜面）"""
+    store = OsuFileStore(str(tmp_path_factory.mktemp('osu_files')), index=None)
+    results = {}
+    for name in sorted(os.listdir(FIXTURE_DIR)):
+        if name.endswith('.osu'):
+            with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+                _, digest = store.add_bytes(f.read())
+            results[name] = store._load_digest(digest)
+    return results
+
+
+def _cases(section: str):
+    return [(name, mods, star_rating) for name, values in EXPECTED[section].items() for mods, star_rating in values.items()]
+
+
+@pytest.mark.skipif(not EXPECTED['lazer'], reason="osu!lazer reference star ratings are not recorded yet")
+@pytest.mark.parametrize('name, mods, star_rating', _cases('lazer'))
+def test_matches_lazer_reference(beatmaps, name, mods, star_rating):
+    assert calculate_star_rating(beatmaps[name], _mods(mods)) == pytest.approx(star_rating, abs=EXPECTED['lazer_tolerance'])
+
+
+@pytest.mark.parametrize('name, mods, star_rating', _cases('local'))
+def test_matches_local_snapshot(beatmaps, name, mods, star_rating):
+    assert calculate_star_rating(beatmaps[name], _mods(mods)) == pytest.approx(star_rating, abs=1e-3)
+
+
+def test_rate_and_difficulty_mods_change_star_rating(beatmaps):
+    for beatmap in beatmaps.values():
+        nomod = calculate_star_rating(beatmap)
+        assert calculate_star_rating(beatmap, _mods('HT')) < nomod < calculate_star_rating(beatmap, _mods('DT'))
+        assert calculate_star_rating(beatmap, _mods('EZ')) < nomod <= calculate_star_rating(beatmap, _mods('HR'))
+        assert calculate_star_rating(beatmap, _mods('HD+NF')) == nomod
+        assert calculate_star_rating(beatmap, _mods('NC')) == calculate_star_rating(beatmap, _mods('DT'))
+        # Flashlightは計算しない
+        assert calculate_star_rating(beatmap, _mods('FL')) is None
+
+
+class _AttributesClient:
+    """譜面属性APIだけを持つクライアント（error を指定した場合は例外を送出）"""
+    
+    def __init__(self, star_rating: float = 0.0, error: Exception = None):
+        self.star_rating = star_rating
+        self.error = error
+        self.calls = 0
+    
+    async def get_cached_beatmap_attributes(self, beatmap_id, mods=None, ruleset='osu'):
+        return None
+    
+    async def get_beatmap_attributes(self, beatmap_id, mods=None, ruleset='osu'):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {'attributes': {'star_rating': self.star_rating}}
+
+
+def _score(mods) -> Score:
+    beatmap = Beatmap(id=101, beatmapset_id=1, version='', star_rating=5.0, artist='', title='', cover_url='')
+    return Score(pp=100.0, created_at='2025-01-01T00:00:00Z', mods=mods_to_bitmask(mods), accuracy=1.0, beatmap=beatmap)
+
+
+def test_api_star_rating_takes_precedence_over_local(monkeypatch):
+    async def local_star_rating(beatmap_id, mods, client=None):
+        return 6.0
+    
+    async def record(*args):
+        pass
+    
+    monkeypatch.setattr(utils, 'get_local_star_rating', local_star_rating)
+    monkeypatch.setattr(utils.get_star_rating_model(), 'record', record)
+    
+    client = _AttributesClient(star_rating=7.25)
+    assert asyncio.run(utils.get_modded_star_rating_from_api(_score(['DT']), client)) == 7.25
+    
+    # APIに失敗した場合だけローカル計算を使う
+    failing = _AttributesClient(error=ConnectionError('unavailable'))
+    assert asyncio.run(utils.get_modded_star_rating_from_api(_score(['DT']), failing)) == 6.0
+    
+    # 難易度に影響するMODがなければAPIを呼ばない
+    assert asyncio.run(utils.get_modded_star_rating_from_api(_score(['HD']), client)) == 5.0
+    assert client.calls == 1
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""osu! APIクライアントのテスト（APIは呼び出さない）"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional
+import aiohttp
+from aiohttp import web
+from core import osu_api
+from core.osu_api import OsuAPIClient
+from core.rate_limit import RateGovernor
+from core.resilience import RetryPolicy
+
+
+class _EmptyCache:
+    """常に空の譜面情報キャッシュ"""
+    
+    async def get_many(self, keys: Iterable[str]) -> Dict:
+        return {}
+
+
+def test_concurrent_clients_share_beatmap_batches(monkeypatch):
+    batches: List[List[int]] = []
+    
+    async def load_beatmap_batch(beatmap_ids: List[int]) -> Dict[int, Dict]:
+        batches.append(sorted(beatmap_ids))
+        return {beatmap_id: {'id': beatmap_id} for beatmap_id in beatmap_ids if beatmap_id != 404}
+    
+    monkeypatch.setattr(osu_api, '_load_beatmap_batch', load_beatmap_batch)
+    monkeypatch.setattr(osu_api, '_beatmap_loader', None)
+    
+    async def main():
+        first = OsuAPIClient('id', 'secret', beatmap_cache=_EmptyCache())
+        second = OsuAPIClient('id', 'secret', beatmap_cache=_EmptyCache())
+        assert first.beatmap_loader is second.beatmap_loader
+        return await asyncio.gather(
+            first.load_beatmaps([1, 2]),
+            second.load_beatmaps([2, 3, 404]),
+            second.get_beatmap(1)
+        )
+    
+    first_result, second_result, beatmap = asyncio.run(main())
+    assert batches == [[1, 2, 3, 404]]
+    assert sorted(first_result) == [1, 2]
+    assert sorted(second_result) == [2, 3]
+    assert beatmap == {'id': 1}
+
+
+class _StaticTokenProvider:
+    """固定のトークンを返す認証プロバイダ"""
+    
+    async def get_token(self, session: aiohttp.ClientSession, stale_token: Optional[str] = None) -> str:
+        return 'token'
+
+
+def test_backoff_releases_the_pooled_connection():
+    """リトライのバックオフ中は他のリクエストがコネクションを使える（プールの上限は1）"""
+    async def main():
+        calls: List[str] = []
+        
+        async def user(request: web.Request) -> web.Response:
+            calls.append('user')
+            if calls.count('user') == 1:
+                # 本文を送り終えないエラー応答（読み終えるまでコネクションはプールに戻らない）
+                response = web.StreamResponse(status=503)
+                await response.prepare(request)
+                await response.write(b'unavailable')
+                await asyncio.sleep(1)
+                return response
+            return web.json_response({'id': 1, 'username': 'Tester'})
+        
+        async def ping(request: web.Request) -> web.Response:
+            calls.append('ping')
+            return web.json_response({})
+        
+        app = web.Application()
+        app.router.add_get('/api/v2/users/Tester/osu', user)
+        app.router.add_get('/api/v2/ping', ping)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1))
+        try:
+            client = OsuAPIClient(
+                'id',
+                'secret',
+                session=session,
+                token_provider=_StaticTokenProvider(),
+                rate_governor=RateGovernor('test', 6000, 10),
+                retry_policy=RetryPolicy(attempts=2, base_delay=0.5, max_delay=0.5)
+            )
+            client.BASE_URL = f"http://127.0.0.1:{port}/api/v2"
+            
+            user_task = asyncio.ensure_future(client.get_user('Tester'))
+            while 'user' not in calls:
+                await asyncio.sleep(0.01)
+            started_at = time.monotonic()
+            await client._request('GET', f"{client.BASE_URL}/ping")
+            ping_elapsed = time.monotonic() - started_at
+            assert (await user_task)['id'] == 1
+        finally:
+            await session.close()
+            await runner.cleanup()
+        return calls, ping_elapsed
+    
+    calls, ping_elapsed = asyncio.run(main())
+    assert calls == ['user', 'ping', 'user']
+    assert ping_elapsed < 0.3
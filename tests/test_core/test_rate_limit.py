@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""レート制御のテスト"""
+
+import asyncio
+import time
+from email.utils import formatdate
+from typing import List
+import pytest
+from core.rate_limit import RateGovernor, wait_for_active
+
+
+def _paused_for(governor: RateGovernor) -> float:
+    """残りの停止秒数"""
+    return governor._paused_until - time.monotonic()
+
+
+def test_retry_after_seconds_pauses_the_governor():
+    governor = RateGovernor('test', 60, 5)
+    governor.on_response(429, {'Retry-After': '7'})
+    assert 6 < _paused_for(governor) <= 7
+    assert governor.throttled == 1
+
+
+def test_retry_after_http_date_pauses_the_governor():
+    governor = RateGovernor('test', 60, 5)
+    governor.on_response(429, {'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+    assert 25 < _paused_for(governor) <= 30
+
+
+def test_invalid_retry_after_uses_the_default_pause():
+    governor = RateGovernor('test', 60, 5)
+    governor.on_response(429, {'Retry-After': 'soon'})
+    assert RateGovernor.DEFAULT_PAUSE - 1 < _paused_for(governor) <= RateGovernor.DEFAULT_PAUSE
+
+
+def test_wait_for_active_excludes_time_in_the_queue():
+    async def main():
+        governor = RateGovernor('test', 6000, 1)
+        governor.on_response(429, {'Retry-After': '0.3'})
+        
+        async def request():
+            await governor.acquire()
+            await asyncio.sleep(0.05)
+            return 'done'
+        
+        started_at = time.monotonic()
+        result = await wait_for_active(request(), timeout=0.2)
+        return result, time.monotonic() - started_at
+    
+    result, elapsed = asyncio.run(main())
+    assert result == 'done'
+    assert elapsed >= 0.3
+
+
+def test_wait_for_active_cancels_and_awaits_on_timeout():
+    events: List[str] = []
+    
+    async def main():
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            finally:
+                events.append('cleaned up')
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await wait_for_active(slow(), timeout=0.05)
+        # タイムアウトを返す前にキャンセルした処理の後始末が終わっている
+        events.append('timed out')
+    
+    asyncio.run(main())
+    assert events == ['cleaned up', 'timed out']
@@ -0,0 +1,2 @@
+"""Feature module tests"""
+
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""EventSubトランスポートのテスト（ローカルのモックサーバーを使用）"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from core.http import close_sessions
+from core.twitch_api import TwitchAPIClient
+from features.twitch_notification.eventsub import EventSubTransport
+from features.twitch_notification.mock_eventsub import MockEventSubServer
+
+BROADCASTER_IDS = ['1', '2', '3']
+
+
+async def _wait_until(condition: Callable[[], bool], timeout: float = 3.0):
+    """condition が真になるまで待つ"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out waiting for condition"
+        await asyncio.sleep(0.01)
+
+
+def _run_with_transport(test: Callable[[MockEventSubServer, EventSubTransport, Dict[str, List]], Awaitable[None]], user_token: Optional[str] = None):
+    """モックサーバーに接続したトランスポートでテストを実行"""
+    async def main():
+        server = MockEventSubServer(keepalive_timeout=1, user_token=user_token)
+        await server.start()
+        received: Dict[str, List] = {'online': [], 'offline': [], 'resync': []}
+        
+        async def on_online(event: Dict):
+            received['online'].append(event)
+        
+        async def on_offline(event: Dict):
+            received['offline'].append(event)
+        
+        async def on_resync():
+            received['resync'].append(None)
+        
+        transport = EventSubTransport(
+            TwitchAPIClient('client-id', 'client-secret'),
+            'user-token',
+            BROADCASTER_IDS,
+            on_online=on_online,
+            on_offline=on_offline,
+            on_resync=on_resync,
+            ws_url=server.ws_url,
+            subscriptions_url=server.subscriptions_url
+        )
+        transport.start()
+        try:
+            await test(server, transport, received)
+        finally:
+            transport.stop()
+            await server.stop()
+            await close_sessions()
+    
+    asyncio.run(main())
+
+
+def test_subscribes_all_broadcasters_and_resyncs():
+    async def test(server, transport, received):
+        await _wait_until(lambda: transport.covers_all)
+        assert len(server.subscriptions) == len(BROADCASTER_IDS) * 2
+        await _wait_until(lambda: len(received['resync']) == 1)
+    
+    _run_with_transport(test)
+
+
+def test_ignores_duplicate_notifications():
+    async def test(server, transport, received):
+        await _wait_until(lambda: transport.covers_all)
+        await server.stream_online('1', 'one', stream_id='100', message_id='message-1')
+        await server.stream_online('1', 'one', stream_id='100', message_id='message-1')
+        await server.stream_offline('1', 'one', message_id='message-2')
+        await _wait_until(lambda: len(received['offline']) == 1)
+        
+        assert [event['id'] for event in received['online']] == ['100']
+        assert transport.duplicates == 1
+    
+    _run_with_transport(test)
+
+
+def test_reconnect_hands_off_subscriptions():
+    async def test(server, transport, received):
+        await _wait_until(lambda: transport.covers_all)
+        requests = server.subscription_requests
+        
+        await server.reconnect()
+        await _wait_until(lambda: transport.reconnects == 1)
+        
+        # サブスクリプションは引き継がれるため購読し直さず、取りこぼし確認も行わない
+        assert server.subscription_requests == requests
+        assert transport.sessions == 1
+        assert len(server.sessions) == 1
+        assert len(received['resync']) == 1
+        
+        await server.stream_online('2', 'two', stream_id='200')
+        await _wait_until(lambda: len(received['online']) == 1)
+        assert transport.covers_all
+    
+    _run_with_transport(test)
+
+
+def test_invalid_user_token_disables_eventsub():
+    async def test(server, transport, received):
+        await _wait_until(lambda: transport.disabled_reason is not None)
+        requests = server.subscription_requests
+        await asyncio.sleep(0.2)
+        
+        # 401では再接続を繰り返さない
+        assert server.subscription_requests == requests
+        assert not transport.connected
+        assert not transport.covers_all
+        assert received['resync'] == []
+    
+    _run_with_transport(test, user_token='another-token')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Wrapped結果キャッシュのテスト（APIは呼び出さない）"""
+
+import asyncio
+from typing import Dict, List
+from features.wrapped import cache
+from features.wrapped.data import build_wrapped_user_data
+
+USER = {
+    'id': 1,
+    'username': 'Tester',
+    'statistics': {'play_count': 600},
+    'monthly_playcounts': [
+        {'start_date': '2023-11-01', 'count': 100},
+        {'start_date': '2024-01-01', 'count': 200},
+        {'start_date': '2024-02-01', 'count': 300}
+    ]
+}
+
+
+def _run_with_cache(monkeypatch, test):
+    """取得処理を差し替えた新しい結果キャッシュでテストを実行し、ユーザー情報の取得回数を返す"""
+    fetches: List[str] = []
+    
+    async def fetch_wrapped_user_data(username: str, client_id: str, client_secret: str, mode: str = 'osu') -> Dict:
+        fetches.append(username)
+        return build_wrapped_user_data(USER, [], mode)
+    
+    monkeypatch.setattr(cache, 'fetch_wrapped_user_data', fetch_wrapped_user_data)
+    monkeypatch.setattr(cache, '_result_cache', cache.WrappedResultCache(ttl=60, stale_ttl=60, negative_ttl=60, max_entries=10))
+    asyncio.run(test())
+    return fetches
+
+
+def test_other_years_reuse_the_cached_user(monkeypatch):
+    async def test():
+        stats_2024 = await cache.get_cached_wrapped_stats_data('Tester', 'id', 'secret', 2024)
+        stats_2023 = await cache.get_cached_wrapped_stats_data('tester ', 'id', 'secret', 2023)
+        assert stats_2024['plays_year'] == 500
+        assert [m['month'] for m in stats_2024['monthly_data']] == ['2024-01', '2024-02']
+        assert stats_2023['plays_year'] == 100
+        assert stats_2024['total_playcount'] == 600
+        # 同じ年は作成済みの結果をそのまま返す
+        assert await cache.get_cached_wrapped_stats_data('Tester', 'id', 'secret', 2024) is stats_2024
+    
+    assert _run_with_cache(monkeypatch, test) == ['Tester']
+
+
+def test_peek_only_returns_built_years(monkeypatch):
+    async def test():
+        assert cache.peek_cached_wrapped_stats_data('Tester', 2024) == (False, None)
+        stats_data = await cache.get_cached_wrapped_stats_data('Tester', 'id', 'secret', 2024)
+        assert cache.peek_cached_wrapped_stats_data('Tester', 2024) == (True, stats_data)
+        assert cache.peek_cached_wrapped_stats_data('Tester', 2023) == (False, None)
+        assert cache.peek_cached_wrapped_stats_data('Tester', 2024, mode='mania') == (False, None)
+    
+    assert _run_with_cache(monkeypatch, test) == ['Tester']